@@ -12,22 +12,31 @@ CORE COMPONENTS
 --------------------------------------------------------------------------------
 
 1.  Chat Engine Integration:
-    * Imports and initializes a global 'chat_engine' instance using
-      'get_engine()' from 'src.chat_engine'.
-    * The engine is initialized via an @app.before_request hook, ensuring it's
-      ready and potentially loaded with a user profile before any route is accessed.
+    * Each browser gets its own 'ChatEngine' from the session pool in
+      'src.session_manager', keyed by the 'chat_session_id' cookie.
+    * An @app.before_request hook assigns the session id; the engine is created
+      on first use and loaded with the default user profile. The model provider
+      and moderator are shared across sessions.
 
 2.  Profile Management:
-    * Handles loading and saving user data to a local JSON file ('data/profiles.json').
+    * Handles loading and saving user data through 'src.profile_store': the local
+      JSON file ('data/profiles.json', written atomically) or a SQLite database,
+      with an in-process read cache so '/' does not re-parse the file.
     * The root route ('/') checks for a 'default_user' profile:
         * If a profile exists, it redirects to the main chat interface ('/chat_interface').
         * If no profile exists, it redirects to the profiling quiz ('/profile_quiz').
 
 3.  Text-to-Speech (TTS):
-    * The '/speak' endpoint uses the 'gTTS' library to generate audio streams
-      (MPEG format) from text provided in a POST request.
+    * The '/speak' endpoint generates audio from text provided in a POST body or
+      GET query string, using the backend chosen by TTS_BACKEND: 'gTTS' (MPEG,
+      needs network) or a local espeak-ng engine (WAV, works offline).
     * It automatically detects Chinese (zh-cn) or English text to select the
       appropriate voice/language setting.
+    * Audio is cached by content hash in memory and on disk ('src.tts'), served
+      with an ETag and long-lived Cache-Control, and the Chinese in each reply is
+      pre-synthesised in the background right after /chat returns.
+    * Text is synthesised sentence by sentence, so '/speak/stream' can start
+      playback after the first sentence instead of the whole reply.
 
 --------------------------------------------------------------------------------
 API ENDPOINTS
@@ -36,108 +45,131 @@ API ENDPOINTS
 * / : Entry point. Redirects based on profile existence.
 * /profile_quiz : Serves the HTML page for the user profile questionnaire.
 * /submit_profile (POST) : Receives profile data, saves it as 'default_user',
-    and updates the global chat engine instance immediately.
+    and updates the current session's chat engine immediately.
 * /chat_interface : Serves the main HTML page for the chat application.
 * /chat (POST) : Receives a user prompt, processes it via 'chat_engine.process_message()',
     and returns a structured JSON response (which may include multilingual text and
     safety actions).
+* /chat/stream (POST) : Same input as /chat, but streams the reply as
+    Server-Sent Events: 'token' events with raw text as it arrives (plus the
+    HTML of any lines it completes), then one 'done' event with the same
+    JSON as /chat.
+* /usage_log : Returns the days the user practised, optionally limited to
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD. Opening /chat_interface records today.
+* /usage_log/summary : Returns the current and longest streak and total active days.
+* /usage_log/months : Returns the number of active days per month (optionally ?year=).
 * /disclaimer : Returns a JSON object containing a static educational disclaimer.
-* /speak (POST) : Generates and sends an MP3 audio file for the provided text.
+* /metrics : Prometheus-style histograms of chat latency per pipeline stage
+    (also returned per request under 'timings').
+* /speak (GET, POST) : Generates and sends an audio file for the provided text.
+* /speak/stream (GET) : Streams the same audio sentence by sentence as it is synthesised.
 
 --------------------------------------------------------------------------------
 SETUP & EXECUTION
 --------------------------------------------------------------------------------
 
 * The parent directory is added to the system path to allow 'src' module imports.
+* Importing this module makes no network calls: the model provider is created on
+    first use, and the OpenAI connection is verified in a background thread
+    at startup.
 * The application runs on http://127.0.0.1:5000 in debug mode when executed
     via 'if __name__ == "__main__":'.
+* For high-concurrency serving, 'app.asgi' wraps this app and handles /chat
+    asynchronously: 'uvicorn app.asgi:application'.
 """
 
 
-from src.chat_engine import get_engine
+from src.config import (
+    LOG_FORMAT,
+    LOG_LEVEL,
+    SESSION_COOKIE_KEY,
+    SESSION_IDLE_TTL_SECONDS,
+    TTS_PRESYNTHESIZE,
+)
+from src.metrics import get_metrics
+from src.model_provider import verify_connection_in_background
+from src.profile_store import get_profile_store
+from src.session_manager import SessionManager, get_session_manager
+from src.usage_log import get_usage_log
+from src.tts import extract_chinese, get_synthesizer
 import json
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+import logging
+from flask import Flask, request, jsonify, render_template, redirect, url_for, g
+from flask import Response, stream_with_context
 import sys
 import os
-from gtts import gTTS
 from io import BytesIO
+from datetime import date
 from flask import send_file, request
 
+logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
 # Add parent directory to path for src module
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 app = Flask(__name__, template_folder='templates')  # Specify templates folder
 
-# Global chat engine instance
-chat_engine = None
+# Per-session chat engine pool
+session_manager = get_session_manager()
 
-# Path for storing profiles
-PROFILE_DATA_PATH = os.path.join(
-    os.path.dirname(__file__), 'data', 'profiles.json')
+# Profiles are kept in profiles.json or SQLite, per PROFILE_STORE_BACKEND
+profile_store = get_profile_store()
 
-USAGE_LOG_PATH = os.path.join(os.path.dirname(__file__), 'data', 'usage_log.json')
+# Per-user practice days for the streak calendar
+usage_log = get_usage_log()
 
+# How long browsers may reuse /speak audio (it is content-addressed)
+TTS_BROWSER_CACHE_SECONDS = 365 * 24 * 60 * 60
 
+# Body returned by the chat endpoints on unexpected errors
+CHAT_ERROR_RESPONSE = {"response": [{"chinese": "抱歉，服务器发生错误。", "pinyin": "Bàoqiàn, fúwùqì fāshēng cuòwù.", "english": "Sorry, a server error occurred."}], "safety_action": "block"}
 
-def load_user_profiles():
-    """Loads all user profiles from profiles.json."""
-    if not os.path.exists(PROFILE_DATA_PATH):
-        return {}
-    with open(PROFILE_DATA_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
 
-def load_usage_log():
-    """Loads all recorded usage dates."""
-    if not os.path.exists(USAGE_LOG_PATH):
-        return []
-    try:
-        with open(USAGE_LOG_PATH, 'r', encoding='utf-8') as f: 
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
-
-def save_usage_date():
-    """Adds today's date if not already recorded."""
-    from datetime import date
-    today = str(date.today())
-    data = load_usage_log()
-    if today not in data:
-        data.append(today)
-        os.makedirs(os.path.dirname(USAGE_LOG_PATH), exist_ok=True)
-        with open(USAGE_LOG_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    return data
-
-def save_user_profile(user_id, profile_data):
-    """Saves a single user profile to profiles.json."""
-    profiles = load_user_profiles()
-    profiles[user_id] = profile_data
-    os.makedirs(os.path.dirname(PROFILE_DATA_PATH), exist_ok=True)
-    with open(PROFILE_DATA_PATH, 'w', encoding='utf-8') as f:
-        json.dump(profiles, f, indent=4, ensure_ascii=False)
+
+def load_default_profile(engine):
+    """Loads the default user profile into a newly created chat engine."""
+    profile = profile_store.get('default_user')
+    if profile is not None:  # Check for a default profile
+        engine.set_user_profile(profile)
+        print("Loaded default user profile into chat engine.")
+    else:
+        print(
+            "No default user profile found. Chat engine running without profile data.")
+
+
+def get_chat_engine():
+    """Returns the chat engine for the current browser session."""
+    return session_manager.get(g.session_id, on_create=load_default_profile)
 
 
 @app.before_request
-def ensure_chat_engine():
-    """Initializes chat_engine if it hasn't been already."""
-    global chat_engine
-    if chat_engine is None:
-        chat_engine = get_engine()
-        user_profiles = load_user_profiles()
-        if 'default_user' in user_profiles:  # Check for a default profile
-            chat_engine.set_user_profile(user_profiles['default_user'])
-            print("Loaded default user profile into chat engine.")
-        else:
-            print(
-                "No default user profile found. Chat engine running without profile data.")
+def ensure_session_id():
+    """Assigns a session id from the cookie, or a new one for first-time visitors.
+
+    Cookies that don't look like an id we issued get a new id, so clients
+    can't pick arbitrary keys into the session pool.
+    """
+    session_id = request.cookies.get(SESSION_COOKIE_KEY)
+    if not SessionManager.is_valid_session_id(session_id):
+        session_id = SessionManager.new_session_id()
+    g.session_id = session_id
+
+
+@app.after_request
+def set_session_cookie(response):
+    """Sets (and slides the expiry of) the session cookie."""
+    if 'session_id' in g:
+        response.set_cookie(
+            SESSION_COOKIE_KEY, g.session_id,
+            max_age=SESSION_IDLE_TTL_SECONDS, httponly=True, samesite='Lax')
+    return response
 
 
 @app.route("/")
 def index():
     """Determines whether to show the quiz or the chat."""
     # For a simple demo, check if a 'default_user' profile exists
-    profiles = load_user_profiles()
-    if 'default_user' in profiles:
+    if profile_store.exists('default_user'):
         return redirect(url_for('chat_interface'))
     else:
         return redirect(url_for('profile_quiz'))
@@ -159,16 +191,10 @@ def submit_profile():
 
         # For this demo, we'll save it as a 'default_user'
         user_id = 'default_user'
-        save_user_profile(user_id, data)
+        profile_store.set(user_id, data)
 
-        # Update the chat engine with the new profile immediately
-        global chat_engine
-        if chat_engine:
-            chat_engine.set_user_profile(data)
-        else:
-            # If chat_engine wasn't initialized yet (unlikely with @before_request but good for robustness)
-            chat_engine = get_engine()
-            chat_engine.set_user_profile(data)
+        # Update this session's chat engine with the new profile immediately
+        get_chat_engine().set_user_profile(data)
 
         print(f"Profile saved for {user_id}: {data}")
         return jsonify({"message": "Profile saved successfully!"}), 200
@@ -180,20 +206,48 @@ def submit_profile():
 def chat_interface():
     """Serves the main chat interface HTML page."""
     try:
-        save_usage_date()
+        usage_log.record('default_user')
     except Exception as e:
         print(f"⚠️ Failed to record usage date: {e}")
     return render_template('chat_with_sidepanel.html')
 
+def _parse_date_arg(name):
+    """Reads an optional YYYY-MM-DD query parameter."""
+    value = request.args.get(name)
+    return date.fromisoformat(value) if value else None
+
 @app.route("/usage_log")
-def usage_log():
-    """Returns all recorded usage dates."""
+def usage_log_dates():
+    """Returns recorded usage dates, optionally limited to ?start=&end= (inclusive)."""
     try:
-        return jsonify(load_usage_log())
+        start, end = _parse_date_arg('start'), _parse_date_arg('end')
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD."}), 400
+    try:
+        return jsonify(usage_log.dates('default_user', start, end))
     except Exception as e:
         print(f"Error loading usage log: {e}")
         return jsonify([]), 500
 
+@app.route("/usage_log/summary")
+def usage_summary():
+    """Returns the current and longest streak and total active days."""
+    try:
+        return jsonify(usage_log.summary('default_user'))
+    except Exception as e:
+        print(f"Error loading usage summary: {e}")
+        return jsonify({}), 500
+
+@app.route("/usage_log/months")
+def usage_months():
+    """Returns the number of active days per month, optionally for ?year=."""
+    year = request.args.get('year', type=int)
+    try:
+        return jsonify(usage_log.days_by_month('default_user', year))
+    except Exception as e:
+        print(f"Error loading usage months: {e}")
+        return jsonify({}), 500
+
 @app.route("/disclaimer")
 def disclaimer():
     try:
@@ -216,41 +270,120 @@ def chat():
         if not user_prompt:
             return jsonify({"response": "Please enter a message.", "safety_action": "allow"}), 400
 
-        global chat_engine
-        if chat_engine is None:
-            # Re-initialize if for some reason it's gone (shouldn't happen with @before_request)
-            chat_engine = get_engine()
-
-        response_data = chat_engine.process_message(user_prompt)
-        return jsonify(response_data)
+        response_data = get_chat_engine().process_message(user_prompt)
+        response = jsonify(response_data)
+        # Queued once the reply has been sent, not ahead of it
+        response.call_on_close(lambda: presynthesize_reply(response_data))
+        return response
     except Exception as e:
         print(f"Error processing chat: {e}")
-        return jsonify({"response": [{"chinese": "抱歉，服务器发生错误。", "pinyin": "Bàoqiàn, fúwùqì fāshēng cuòwù.", "english": "Sorry, a server error occurred."}], "safety_action": "block"}), 500
+        return jsonify(CHAT_ERROR_RESPONSE), 500
+
+
+def _sse(event, data):
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
-@app.route("/speak", methods=["POST"])
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    data = request.get_json(silent=True)
+    if not data or 'prompt' not in data:
+        return jsonify({"response": "Invalid request.", "safety_action": "allow"}), 400
+    user_prompt = data.get("prompt", "").strip()
+    if not user_prompt:
+        return jsonify({"response": "Please enter a message.", "safety_action": "allow"}), 400
+
+    engine = get_chat_engine()
+
+    def generate():
+        try:
+            for event in engine.process_message_stream(user_prompt):
+                event_type = event.pop("type")
+                yield _sse(event_type, event)
+                if event_type == "done":
+                    presynthesize_reply(event)
+        except Exception as e:
+            print(f"Error streaming chat: {e}")
+            yield _sse("done", {"response": "Sorry, a server error occurred.", "safety_action": "block"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    """Per-stage latency histograms in the Prometheus text format."""
+    return Response(get_metrics().render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/speak", methods=["GET", "POST"])
 def speak():
-    data = request.get_json()
-    text = data.get("text", "")
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        text = data.get("text", "")
+    else:
+        text = request.args.get("text", "")
     if not text:
         return {"error": "No text provided"}, 400
 
-    # Choose language
-    lang = "zh-cn" if any("\u4e00" <= c <= "\u9fff" for c in text) else "en"
+    synthesizer = get_synthesizer()
+    # Audio is content-addressed, so a matching ETag needs no synthesis at all
+    key = synthesizer.key(text)
+    if request.if_none_match.contains(key):
+        return Response(status=304, headers={"ETag": f'"{key}"'})
 
-    # Generate TTS audio
-    tts = gTTS(text=text, lang=lang)
-    audio_io = BytesIO()
-    tts.write_to_fp(audio_io)
-    audio_io.seek(0)
+    # Generate (or fetch cached) TTS audio; language is detected from the text
+    key, audio = synthesizer.get_full_audio(text)
 
-    return send_file(audio_io, mimetype="audio/mpeg")
+    # Browsers may keep it indefinitely
+    response = send_file(BytesIO(audio), mimetype=synthesizer.mimetype,
+                         etag=key, max_age=TTS_BROWSER_CACHE_SECONDS)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+@app.route("/speak/stream", methods=["GET"])
+def speak_stream():
+    text = request.args.get("text", "")
+    if not text:
+        return {"error": "No text provided"}, 400
+
+    # Audio starts after the first sentence is synthesised; the rest follows
+    synthesizer = get_synthesizer()
+    return Response(
+        stream_with_context(synthesizer.stream_audio(text)),
+        mimetype=synthesizer.mimetype,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def presynthesize_reply(response_data):
+    """
+    Starts synthesising the Chinese in a reply so the Speak button is instant.
+
+    Only queues the work; the reply has already been sent, so a failure here
+    is logged rather than raised.
+    """
+    if not TTS_PRESYNTHESIZE or not isinstance(response_data.get("response"), str):
+        return
+    try:
+        get_synthesizer().presynthesize(extract_chinese(response_data["response"]))
+    except Exception as e:
+        print(f"Error starting pre-synthesis: {e}")
 
 
 if __name__ == "__main__":
     # Create data directory if it doesn't exist
     os.makedirs('data', exist_ok=True)
 
+    # Check the model API without delaying startup
+    verify_connection_in_background()
+
     host = '127.0.0.1'
     port = 5000
 
@@ -0,0 +1,122 @@
+"""
+================================================================================
+ASGI Entry Point for High-Concurrency Serving
+================================================================================
+
+Serves POST /chat on the asyncio event loop via 'ChatEngine.process_message_async',
+so an in-flight OpenAI request holds a coroutine rather than a worker thread.
+Every other route is delegated to the Flask app in 'app.app' through asgiref's
+WSGI adapter, sharing the same session pool and session cookie.
+
+Run with:
+
+    uvicorn app.asgi:application --host 127.0.0.1 --port 5000
+"""
+
+import asyncio
+import json
+from http.cookies import SimpleCookie
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.http import dump_cookie
+
+from app.app import (
+    CHAT_ERROR_RESPONSE,
+    app as flask_app,
+    load_default_profile,
+    presynthesize_reply,
+    session_manager,
+)
+from src.config import SESSION_COOKIE_KEY, SESSION_IDLE_TTL_SECONDS
+from src.model_provider import verify_connection_in_background
+from src.session_manager import SessionManager
+
+wsgi_application = WsgiToAsgi(flask_app)
+
+
+async def _read_body(receive):
+    """Reads the full HTTP request body."""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+def _get_session_id(scope):
+    """Returns the session id from the cookie header, if it is well-formed."""
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            cookie = SimpleCookie(value.decode("latin-1"))
+            if SESSION_COOKIE_KEY in cookie:
+                session_id = cookie[SESSION_COOKIE_KEY].value
+                return session_id if SessionManager.is_valid_session_id(session_id) else None
+    return None
+
+
+async def _send_json(send, status, data, session_id):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    cookie = dump_cookie(
+        SESSION_COOKIE_KEY, session_id,
+        max_age=SESSION_IDLE_TTL_SECONDS, httponly=True, samesite="Lax")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"set-cookie", cookie.encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def chat(scope, receive, send):
+    """Async equivalent of the Flask /chat route."""
+    session_id = _get_session_id(scope) or SessionManager.new_session_id()
+    try:
+        try:
+            data = json.loads(await _read_body(receive))
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or 'prompt' not in data:
+            await _send_json(send, 400, {"response": "Invalid request.", "safety_action": "allow"}, session_id)
+            return
+        user_prompt = str(data.get("prompt", "")).strip()
+        if not user_prompt:
+            await _send_json(send, 400, {"response": "Please enter a message.", "safety_action": "allow"}, session_id)
+            return
+
+        engine = session_manager.get(session_id, on_create=load_default_profile)
+        response_data = await engine.process_message_async(user_prompt)
+    except Exception as e:
+        print(f"Error processing chat: {e}")
+        await _send_json(send, 500, CHAT_ERROR_RESPONSE, session_id)
+        return
+    await _send_json(send, 200, response_data, session_id)
+    # Creating the synthesizer and its cache touches the disk, so not on the loop
+    await asyncio.get_running_loop().run_in_executor(None, presynthesize_reply, response_data)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            verify_connection_in_background()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI application: async /chat, Flask for everything else."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+    elif (scope["type"] == "http" and scope["path"] == "/chat"
+            and scope["method"] == "POST"):
+        await chat(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
@@ -0,0 +1,119 @@
+"""
+Markdown benchmark: per-reply cost of formatting chat replies.
+
+Renders ~10 KB replies, both realistic ones and adversarial ones full of
+stray '*', '**', '[' and '`', with src.markdown.render_markdown and with
+the regex passes it replaced, and times the streaming renderer on the same
+text fed in small chunks. Also renders 10x longer inputs to check that
+cost grows linearly. Exits non-zero if any 10 KB input takes longer than
+the budget or the 10x input costs more than 30x as much (quadratic cost
+would be about 100x).
+
+Usage:
+    python benchmarks/bench_markdown.py [--size 10000] [--budget-ms 20]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from src.markdown import StreamingMarkdownRenderer, render_markdown  # noqa: E402
+
+# Default budget for rendering one 10 KB reply, in milliseconds
+RENDER_BUDGET_MS = 20.0
+
+# Largest allowed cost ratio between 10x and 1x inputs; leaves room for timing noise
+LINEARITY_LIMIT = 30
+
+# Give up timing the old implementation after this long per input
+LEGACY_TIMEOUT_SECONDS = 10.0
+
+REALISTIC_REPLY = (
+    "**你好！** (nǐ hǎo) means *hello*. Try this sentence:\n"
+    "`我想点一杯咖啡。` (Wǒ xiǎng diǎn yì bēi kāfēi.) — *I'd like to order a coffee.*\n"
+    "See [the HSK word list](https://www.hsk.academy/en/hsk-1-vocabulary-list) for more.\n"
+)
+
+
+def legacy_format(text: str) -> str:
+    """The previous ChatEngine._format_ai_response, for comparison."""
+    text = re.sub(r"```(.*?)```", r"<pre><code>\1</code></pre>", text, flags=re.DOTALL)
+    text = re.sub(r"`([^`]+)`", r"<code>\1</code>", text)
+    text = re.sub(r"\*\*(.*?)\*\*", r"<b>\1</b>", text)
+    text = re.sub(r"(?<!\*)\*(?!\*)(.*?)\*(?<!\*)", r"<i>\1</i>", text)
+    text = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r'<a href="\2">\1</a>', text)
+    return text.replace("\n", "<br>")
+
+
+def make_inputs(size: int) -> dict:
+    def fill(piece: str) -> str:
+        return (piece * (size // len(piece) + 1))[:size]
+
+    return {
+        "realistic": fill(REALISTIC_REPLY),
+        "stray_stars": fill("a*"),
+        "unclosed_bold": fill("**a "),
+        "brackets": fill("[a"),
+        "link_openers": fill("[a](b"),
+        "backticks": fill("`a"),
+        "fences": fill("```a\n"),
+        "escapes": fill("<&>\"'"),
+    }
+
+
+def time_per_call(fn, text: str, budget_seconds: float = 1.0) -> float:
+    """Mean seconds per call, repeating for about budget_seconds (at least once)."""
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        fn(text)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget_seconds or (runs >= 3 and elapsed * (runs + 1) / runs > budget_seconds):
+            return elapsed / runs
+
+
+def render_streaming(text: str, chunk_size: int = 4) -> str:
+    renderer = StreamingMarkdownRenderer()
+    parts = [renderer.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    parts.append(renderer.close())
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=10_000, help="Characters per input")
+    parser.add_argument("--budget-ms", type=float, default=RENDER_BUDGET_MS)
+    parser.add_argument("--skip-legacy", action="store_true", help="Don't time the old regex passes")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'input':<15} {'render':>10} {'streaming':>10} {'x10 ratio':>10} {'legacy':>12}")
+    for name, text in make_inputs(args.size).items():
+        assert render_streaming(text) == render_markdown(text), name
+        render_ms = time_per_call(render_markdown, text) * 1000
+        stream_ms = time_per_call(render_streaming, text) * 1000
+        large = make_inputs(args.size * 10)[name]
+        ratio = time_per_call(render_markdown, large) * 1000 / render_ms
+
+        legacy = "skipped"
+        if not args.skip_legacy:
+            legacy_seconds = time_per_call(legacy_format, text, budget_seconds=LEGACY_TIMEOUT_SECONDS)
+            legacy = f"{legacy_seconds * 1000:.2f} ms"
+
+        print(f"{name:<15} {render_ms:>7.3f} ms {stream_ms:>7.3f} ms {ratio:>9.1f}x {legacy:>12}")
+        if render_ms > args.budget_ms or ratio > LINEARITY_LIMIT:
+            failed = True
+
+    print(f"budget {args.budget_ms:.1f} ms per {args.size}-character reply")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Startup benchmark: time `import app.app` in fresh interpreters.
+
+Each run imports the Flask app in a clean subprocess with a dummy API key and
+outbound sockets replaced by a stub that raises, so any import-time network
+call fails the run. Exits non-zero if the median import time exceeds the
+budget or if importing created the model provider.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--budget 1.0]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Default budget for importing app.app, in seconds
+STARTUP_BUDGET_SECONDS = 1.0
+
+CHILD = """
+import json, socket, sys, time
+
+def _no_network(*args, **kwargs):
+    raise RuntimeError("network access during import")
+
+socket.socket.connect = _no_network
+socket.create_connection = _no_network
+
+start = time.perf_counter()
+import app.app
+elapsed = time.perf_counter() - start
+
+import src.model_provider as model_provider
+print(json.dumps({
+    "seconds": elapsed,
+    "provider_created": model_provider._provider_instance is not None,
+    "openai_imported": "openai" in sys.modules,
+}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ, OPENAI_API_KEY="sk-benchmark-stub")
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_SECONDS)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    times = [r["seconds"] for r in results]
+    median = statistics.median(times)
+
+    print(f"import app.app over {args.runs} runs: "
+          f"min {min(times):.3f}s, median {median:.3f}s, max {max(times):.3f}s "
+          f"(budget {args.budget:.3f}s)")
+    print(f"provider created at import: {any(r['provider_created'] for r in results)}")
+    print(f"openai SDK imported at import: {any(r['openai_imported'] for r in results)}")
+
+    if median > args.budget or any(r["provider_created"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
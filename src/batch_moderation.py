@@ -0,0 +1,265 @@
+"""
+Batch moderation for scoring corpora.
+
+moderate_batch() applies the input checks of Moderator.moderate() (racial
+bias, then general bias; there is no conversation context or model output
+in a corpus) to many texts and returns columnar results: an action code
+and a confidence per text, plus its tags. Rules are scanned once per text
+and the SAFETY_MODE thresholds applied afterwards, so scoring under every
+mode costs a single pass. Large batches are split into chunks of
+MODERATION_BATCH_CHUNK_SIZE texts and scanned on a process pool.
+
+Result columns are NumPy arrays, and the thresholds are applied to whole
+columns at once.
+
+Each input line is an object with the text in a "prompt" field (see --field).
+
+Usage:
+    python -m src.batch_moderation corpus.jsonl [--field prompt] [--processes 4]
+"""
+
+import argparse
+import logging
+import os
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy
+
+from .config import LOG_FORMAT, LOG_LEVEL, MODERATION_BATCH_CHUNK_SIZE, SAFETY_MODE
+from .io_utils import iter_jsonl
+from .moderation import ModerationAction, get_moderator
+
+logger = logging.getLogger(__name__)
+
+# Action code i in BatchModerationResult.actions means ACTIONS[i]
+ACTIONS = (ModerationAction.ALLOW, ModerationAction.SAFE_FALLBACK, ModerationAction.BLOCK)
+_ALLOW, _SAFE_FALLBACK, _BLOCK = range(len(ACTIONS))
+
+
+@dataclass
+class RuleScores:
+    """Mode-independent rule results for a batch of texts."""
+    racial_confidence: array  # Highest racial bias hit confidence per text ('d')
+    bias_confidence: array  # Highest general bias hit confidence per text ('d')
+    racial_tags: List[Tuple[str, ...]]
+    bias_tags: List[Tuple[str, ...]]
+    rules_version: Optional[str] = None  # RuleSet.version the texts were scanned with
+
+    def __len__(self) -> int:
+        return len(self.racial_confidence)
+
+    def extend(self, other: "RuleScores"):
+        if self.rules_version is None:
+            self.rules_version = other.rules_version
+        elif other.rules_version != self.rules_version:
+            logger.warning(
+                f"Moderation rules changed during the scan ({self.rules_version} -> "
+                f"{other.rules_version}); rerun for consistent results")
+        self.racial_confidence.extend(other.racial_confidence)
+        self.bias_confidence.extend(other.bias_confidence)
+        self.racial_tags.extend(other.racial_tags)
+        self.bias_tags.extend(other.bias_tags)
+
+
+@dataclass
+class BatchModerationResult:
+    """Moderation results for a batch of texts under one safety mode, as columns."""
+    mode: str
+    actions: numpy.ndarray  # int8 codes, indexes into ACTIONS
+    confidence: numpy.ndarray  # float64, as ModerationResult.confidence
+    tags: List[Tuple[str, ...]]  # Policy tags per text (empty when allowed)
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def action(self, index: int) -> ModerationAction:
+        return ACTIONS[int(self.actions[index])]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of texts per action."""
+        return _action_counts(self.actions)
+
+
+def _score_chunk(texts: List[str]) -> RuleScores:
+    """Scan texts with this process's current moderation rules."""
+    rules = get_moderator().rules
+    # Memoising a corpus scan would only churn the rule set's LRU
+    scan = rules.matcher.scan_uncached
+    category_confidence = rules.category_confidence
+    scores = RuleScores(array("d"), array("d"), [], [], rules.version)
+    for text in texts:
+        hits = scan(text)
+        confidence, tags = category_confidence(hits, "racial_bias")
+        scores.racial_confidence.append(confidence)
+        scores.racial_tags.append(tuple(tags))
+        confidence, tags = category_confidence(hits, "bias")
+        scores.bias_confidence.append(confidence)
+        scores.bias_tags.append(tuple(tags))
+    return scores
+
+
+def _chunks(texts: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(texts)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def score_texts(
+    texts: Iterable[str],
+    processes: int = 1,
+    chunk_size: int = MODERATION_BATCH_CHUNK_SIZE,
+) -> RuleScores:
+    """
+    Scan texts against every moderation rule.
+
+    Args:
+        texts: Texts to scan, in order
+        processes: Worker processes; 1 scans in this process
+        chunk_size: Texts sent to a worker per task
+
+    Returns:
+        Per-text category confidences and tags, in input order
+    """
+    scores = RuleScores(array("d"), array("d"), [], [])
+    if processes <= 1:
+        for chunk in _chunks(texts, chunk_size):
+            scores.extend(_score_chunk(chunk))
+        return scores
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # At most two chunks per worker are in flight, so a large corpus is
+        # never read (and pickled) ahead of the workers. Results are taken
+        # oldest first, which keeps them in input order.
+        pending = deque()
+        for chunk in _chunks(texts, chunk_size):
+            if len(pending) >= processes * 2:
+                scores.extend(pending.popleft().result())
+            pending.append(executor.submit(_score_chunk, chunk))
+        while pending:
+            scores.extend(pending.popleft().result())
+    return scores
+
+
+def decide(scores: RuleScores, mode: str = SAFETY_MODE) -> BatchModerationResult:
+    """
+    Apply one safety mode's thresholds to scanned texts.
+
+    Matches Moderator.moderate(): racial bias blocks, otherwise general bias
+    gets the safe fallback, otherwise the text is allowed with confidence 1.
+    """
+    racial, bias = _confidence_columns(scores)
+    actions = _decide_actions(racial, bias, get_moderator().confidence_thresholds[mode])
+    confidence = numpy.select(
+        [actions == _BLOCK, actions == _SAFE_FALLBACK], [racial, bias], default=1.0)
+    # Tags are variable-length tuples, so they are picked per text
+    tags = [
+        racial_tags if code == _BLOCK else bias_tags if code == _SAFE_FALLBACK else ()
+        for code, racial_tags, bias_tags in zip(
+            actions.tolist(), scores.racial_tags, scores.bias_tags)
+    ]
+    return BatchModerationResult(mode, actions, confidence, tags)
+
+
+def moderate_batch(
+    texts: Iterable[str],
+    mode: Optional[str] = None,
+    processes: int = 1,
+    chunk_size: int = MODERATION_BATCH_CHUNK_SIZE,
+) -> BatchModerationResult:
+    """
+    Moderate many user texts at once.
+
+    Args:
+        texts: Texts to moderate, in order
+        mode: Safety mode whose thresholds apply (defaults to SAFETY_MODE)
+        processes: Worker processes to scan on; 1 scans in this process
+        chunk_size: Texts sent to a worker per task
+
+    Returns:
+        Columnar results in input order
+    """
+    return decide(score_texts(texts, processes, chunk_size), mode or SAFETY_MODE)
+
+
+def _confidence_columns(scores: RuleScores) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    # Copies, so the scanned arrays can still be extended
+    return (numpy.array(scores.racial_confidence, dtype=numpy.float64),
+            numpy.array(scores.bias_confidence, dtype=numpy.float64))
+
+
+def _decide_actions(
+    racial: numpy.ndarray, bias: numpy.ndarray, thresholds: Dict[str, float]
+) -> numpy.ndarray:
+    """Action codes for confidence columns under one mode's thresholds."""
+    actions = numpy.full(len(racial), _ALLOW, dtype=numpy.int8)
+    actions[bias >= thresholds["bias"]] = _SAFE_FALLBACK
+    # Racial bias is checked first in moderate(), so it wins
+    actions[racial >= thresholds["racial_bias"]] = _BLOCK
+    return actions
+
+
+def _action_counts(actions: numpy.ndarray) -> Dict[str, int]:
+    totals = numpy.bincount(actions, minlength=len(ACTIONS))
+    return {action.value: int(total) for action, total in zip(ACTIONS, totals)}
+
+
+def hit_matrix(scores: RuleScores, modes: Iterable[str]) -> Dict[str, Dict[str, int]]:
+    """
+    Texts flagged per category and per action, under each mode.
+
+    Returns:
+        Row name -> mode -> count. Category rows count texts whose category
+        confidence meets the mode's threshold, whichever action won; action
+        rows count final decisions.
+    """
+    thresholds = get_moderator().confidence_thresholds
+    racial, bias = _confidence_columns(scores)
+    matrix: Dict[str, Dict[str, int]] = {"racial_bias": {}, "bias": {}}
+    for mode in modes:
+        matrix["racial_bias"][mode] = int(
+            numpy.count_nonzero(racial >= thresholds[mode]["racial_bias"]))
+        matrix["bias"][mode] = int(numpy.count_nonzero(bias >= thresholds[mode]["bias"]))
+        actions = _decide_actions(racial, bias, thresholds[mode])
+        for action, total in _action_counts(actions).items():
+            matrix.setdefault(action, {})[mode] = total
+    return matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("corpus", help="JSONL file of texts to score")
+    parser.add_argument("--field", default="prompt", help="Record field holding the text")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (1 scans in this process)")
+    parser.add_argument("--chunk-size", type=int, default=MODERATION_BATCH_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    texts = (record.get(args.field) or "" for record in iter_jsonl(args.corpus))
+    start = time.perf_counter()
+    scores = score_texts(texts, args.processes, args.chunk_size)
+    scan_seconds = time.perf_counter() - start
+
+    modes = list(get_moderator().confidence_thresholds)
+    matrix = hit_matrix(scores, modes)
+    total_seconds = time.perf_counter() - start
+
+    print(f"{'':<15}" + "".join(f"{mode:>12}" for mode in modes))
+    for row, counts in matrix.items():
+        print(f"{row:<15}" + "".join(f"{counts.get(mode, 0):>12}" for mode in modes))
+    rate = len(scores) / scan_seconds if scan_seconds else 0.0
+    print(f"rules {scores.rules_version}")
+    print(f"{len(scores)} texts scanned in {scan_seconds:.2f}s ({rate:,.0f} texts/s, "
+          f"{args.processes} processes); {total_seconds:.2f}s with all {len(modes)} modes")
+
+
+if __name__ == "__main__":
+    main()
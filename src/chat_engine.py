@@ -1,48 +1,327 @@
+import asyncio
+import copy
 import time
 import logging
-import re
-from typing import Dict, List
-
-from .config import SYSTEM_PROMPT
-from .model_provider import get_provider
+import threading
+from itertools import chain
+from typing import Dict, Iterator, List, Optional
+
+from .concurrency import run_in_thread
+from .config import (
+    SPECULATIVE_GENERATION,
+    SYSTEM_PROMPT,
+    TEMPERATURE,
+    user_profile_data,
+)
+from .history import ConversationHistory
+from .markdown import StreamingMarkdownRenderer, render_markdown
+from .metrics import SpanTimer, get_metrics
+from .model_provider import (
+    AsyncModelProvider,
+    ModelProvider,
+    get_async_provider,
+    get_provider,
+)
 from .moderation import ModerationAction, ModerationResult, get_moderator
+from .prompts import CompiledPrompt, get_prompt_compiler
+from .scheduler import PRIORITY_INTERACTIVE
 
 logger = logging.getLogger(__name__)
 
+# Output verdict for turns whose output needed no check
+_ALLOWED = ModerationResult(action=ModerationAction.ALLOW, tags=[], reason="", confidence=1.0)
+
 
 class ChatEngine:
     """Handles conversation flow with moderation and response generation."""
 
-    def __init__(self):
-        self.model = get_provider()
+    def __init__(
+        self, session_id: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE
+    ):
+        # Model and moderator are shared, thread-safe singletons; everything
+        # else is per-session state. The model provider is resolved on first
+        # use so engines can be built without credentials or network.
         self.moderator = get_moderator()
-        self.conversation_history: List[Dict] = []
+        self.history = ConversationHistory()
+        # Racial bias hits in the last CONTEXT_WINDOW_SIZE messages, kept in step with history
+        self.violations = self.moderator.new_tally()
         self.turn_count = 0
-        self.session_id = f"session_{int(time.time())}"
+        self.session_id = session_id or f"session_{int(time.time())}"
+        # Rate limiter priority of this session's model calls
+        self.priority = priority
         self.first_interaction = True
-        self.user_profile: Dict = {}
+        # Own copy: the module default is shared by every engine
+        self.user_profile: Dict = copy.deepcopy(user_profile_data)
+        # Rendered profile message, recompiled only when the profile changes
+        self.profile_prompt: CompiledPrompt = get_prompt_compiler().compile(user_profile_data)
+        # Serialises concurrent requests from the same session, whether they
+        # arrive on worker threads or on the event loop
+        self._lock = threading.Lock()
+
+    @property
+    def conversation_history(self) -> List[Dict]:
+        """Recent messages kept within the history token budget."""
+        return self.history.messages
 
     def set_user_profile(self, profile_data: Dict):
-        self.user_profile = profile_data
-        logger.info(f"User profile set: {self.user_profile}")
+        """Use a profile for this session's prompts from the next turn on."""
+        compiled = get_prompt_compiler().compile(profile_data)
+        self.user_profile = copy.deepcopy(profile_data)
+        if compiled.key != self.profile_prompt.key:
+            self.profile_prompt = compiled
+            logger.info(f"User profile set: {self.user_profile}")
 
     def process_message(self, user_input: str, include_context: bool = True) -> Dict:
-        start_time = time.time()
-        disclaimer = self.moderator.get_disclaimer() if self.first_interaction else None
-        self.first_interaction = False
+        with self._lock:
+            return self._process_message(user_input, include_context)
 
-        input_moderation = self._moderate_input(user_input)
+    @property
+    def model(self) -> ModelProvider:
+        return get_provider()
 
-        if input_moderation.action == ModerationAction.BLOCK:
-            return self._handle_block(user_input, start_time, disclaimer)
+    @property
+    def async_model(self) -> AsyncModelProvider:
+        return get_async_provider()
 
-        if input_moderation.action == ModerationAction.SAFE_FALLBACK:
-            return self._handle_safe_fallback(user_input, start_time, disclaimer)
+    async def process_message_async(
+        self, user_input: str, include_context: bool = True
+    ) -> Dict:
+        """
+        Same pipeline as process_message(), but awaits the model call so the
+        event loop can serve other conversations meanwhile.
+
+        Moderation and formatting are microsecond-scale CPU work, so they run
+        inline on the loop rather than in an executor.
+        """
+        await self._acquire_lock_async()
+        try:
+            return await self._process_message_async(user_input, include_context)
+        finally:
+            self._lock.release()
+
+    async def _acquire_lock_async(self):
+        if self._lock.acquire(blocking=False):
+            return
+        # Contended: wait in a worker thread so the event loop stays free
+        acquire = asyncio.ensure_future(asyncio.to_thread(self._lock.acquire))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # Release the lock once the abandoned acquire completes
+            acquire.add_done_callback(lambda _: self._lock.release())
+            raise
+
+    async def _process_message_async(
+        self, user_input: str, include_context: bool
+    ) -> Dict:
+        timer, disclaimer = self._begin_turn()
+
+        speculative = None
+        if SPECULATIVE_GENERATION:
+            # Timed separately so a discarded call leaves no spans behind
+            speculative_timer = SpanTimer()
+            speculative = asyncio.ensure_future(
+                self._generate_response_async(user_input, include_context, speculative_timer))
+            # Let the request go out before moderating
+            await asyncio.sleep(0)
+
+        input_moderation = self._moderate_input(user_input, timer)
+        flagged = self._respond_to_flagged_input(user_input, input_moderation, timer, disclaimer)
+        if flagged is not None:
+            if speculative:
+                speculative.cancel()
+                _record_speculation("wasted")
+            return flagged
+
+        if speculative:
+            model_response = await speculative
+            timer.merge(speculative_timer)
+            _record_speculation("used")
+        else:
+            model_response = await self._generate_response_async(user_input, include_context, timer)
+        return self._complete_turn(
+            user_input, model_response, input_moderation, timer, disclaimer, self.async_model)
+
+    def _process_message(self, user_input: str, include_context: bool) -> Dict:
+        timer, disclaimer = self._begin_turn()
+
+        speculative = None
+        if SPECULATIVE_GENERATION:
+            # Its own timer, since it runs alongside input moderation on another thread
+            speculative_timer = SpanTimer()
+            speculative = run_in_thread(
+                "speculative-generation", self._generate_response,
+                user_input, include_context, speculative_timer)
+
+        input_moderation = self._moderate_input(user_input, timer)
+        flagged = self._respond_to_flagged_input(user_input, input_moderation, timer, disclaimer)
+        if flagged is not None:
+            if speculative:
+                # A blocking HTTP call can't be interrupted; its result is dropped
+                speculative.cancel()
+                _record_speculation("wasted")
+            return flagged
+
+        if speculative:
+            model_response = speculative.result()
+            timer.merge(speculative_timer)
+            _record_speculation("used")
+        else:
+            model_response = self._generate_response(user_input, include_context, timer)
+        return self._complete_turn(
+            user_input, model_response, input_moderation, timer, disclaimer, self.model)
+
+    def process_message_stream(
+        self, user_input: str, include_context: bool = True
+    ) -> Iterator[Dict]:
+        """
+        Process a message, yielding events as the model response streams in.
+
+        Yields {"type": "token", "text": ..., "html": ...} for each chunk of
+        raw model output, then a single {"type": "done", ...} carrying the
+        same fields as process_message(). "html" is the rendering of the
+        lines completed by this chunk (empty while a line or code block is
+        unfinished), so clients can show formatted text as it streams.
+
+        Output moderation runs on a rolling window over the streamed text, so
+        a violation cuts the stream before the offending chunk is sent and the
+        done event carries the fallback response.
+        """
+        with self._lock:
+            yield from self._process_message_stream(user_input, include_context)
+
+    def _process_message_stream(
+        self, user_input: str, include_context: bool
+    ) -> Iterator[Dict]:
+        timer, disclaimer = self._begin_turn()
+
+        stream = first_chunk = None
+        stream_timer = timer
+        if SPECULATIVE_GENERATION:
+            # Its own timer, since the first read runs alongside input
+            # moderation on another thread
+            stream_timer = SpanTimer()
+            stream = self._start_stream(user_input, include_context, stream_timer)
+            # Send the request and wait for the first token while moderating
+            first_chunk = run_in_thread("speculative-generation", next, stream, None)
+
+        input_moderation = self._moderate_input(user_input, timer)
+        flagged = self._respond_to_flagged_input(user_input, input_moderation, timer, disclaimer)
+        if flagged is not None:
+            if first_chunk:
+                first_chunk.cancel()
+                # Closing releases the connection once the first read returns
+                first_chunk.add_done_callback(lambda _: stream.close())
+                _record_speculation("wasted")
+            yield {"type": "done", **flagged}
+            return
+
+        renderer = StreamingMarkdownRenderer()
+        if disclaimer:
+            text = f"{disclaimer}\n\n---\n\n"
+            yield {"type": "token", "text": text, "html": renderer.feed(text)}
 
-        model_response = self._generate_response(user_input, include_context)
-        output_moderation = self._moderate_output(
-            user_input, model_response["response"]
+        model_response = {
+            "model": self.model.model_name,
+            "deterministic": TEMPERATURE == 0,
+        }
+        # Streamed text is moderated as it arrives, in place of the
+        # whole-response check in _moderate_model_response()
+        output_moderation = _ALLOWED
+        chunks: List[str] = []
+        # Every window is checked against the same rules, even if they reload mid-stream
+        rules = self.moderator.rules
+        # Text already checked that a keyword could still straddle
+        tail = ""
+        tail_size = rules.output_window_size - 1
+
+        try:
+            if first_chunk:
+                first = first_chunk.result()
+                _record_speculation("used")
+                deltas = chain([first], stream) if first is not None else stream
+            else:
+                stream = deltas = self._start_stream(user_input, include_context, timer)
+            try:
+                for delta in deltas:
+                    window = tail + delta
+                    with timer.span("output_moderation"):
+                        output_moderation = self.moderator.moderate_output(window, rules)
+                    if output_moderation.action != ModerationAction.ALLOW:
+                        break
+                    chunks.append(delta)
+                    with timer.span("formatting"):
+                        html = renderer.feed(delta)
+                    yield {"type": "token", "text": delta, "html": html}
+                    tail = window[-tail_size:] if tail_size > 0 else ""
+            finally:
+                stream.close()
+                if stream_timer is not timer:
+                    timer.merge(stream_timer)
+            model_response["response"] = "".join(chunks)
+        except Exception as e:
+            logger.error(f"Model streaming failed: {e}")
+            model_response = _generation_error(e)
+
+        final_response = self._complete_turn(
+            user_input, model_response, input_moderation, timer, disclaimer,
+            output_moderation=output_moderation)
+        final_response["cut"] = output_moderation.action != ModerationAction.ALLOW
+        yield {"type": "done", **final_response}
+
+    def _begin_turn(self):
+        """Start timing a turn; returns (timer, disclaimer for a first turn or None)."""
+        disclaimer = self.moderator.get_disclaimer() if self.first_interaction else None
+        self.first_interaction = False
+        return SpanTimer(), disclaimer
+
+    def _respond_to_flagged_input(
+        self,
+        user_input: str,
+        input_moderation: ModerationResult,
+        timer: SpanTimer,
+        disclaimer: Optional[str],
+    ) -> Optional[Dict]:
+        """The final response for blocked or redirected input, or None if it is allowed."""
+        if input_moderation.action == ModerationAction.ALLOW:
+            return None
+        blocked = input_moderation.action == ModerationAction.BLOCK
+        response = self._prepare_final_response(
+            user_input=user_input,
+            model_response={
+                "response": "",
+                "model": "blocked" if blocked else "safe_fallback",
+                "deterministic": True,
+            },
+            input_moderation=ModerationResult(
+                action=input_moderation.action, tags=[], reason="", confidence=0.0
+            ),
+            output_moderation=_ALLOWED,
         )
+        if disclaimer:
+            response["response"] = f"{disclaimer}\n\n---\n\n{response['response']}"
+        with timer.span("history_update"):
+            self._update_history(user_input, response["response"])
+        return self._add_turn_metadata(response, timer)
+
+    def _complete_turn(
+        self,
+        user_input: str,
+        model_response: Dict,
+        input_moderation: ModerationResult,
+        timer: SpanTimer,
+        disclaimer: Optional[str],
+        provider=None,
+        output_moderation: Optional[ModerationResult] = None,
+    ) -> Dict:
+        """
+        Moderate a generated response (unless output_moderation is already
+        known), then build, format and record the final response.
+        """
+        if output_moderation is None:
+            with timer.span("output_moderation"):
+                output_moderation = self._moderate_model_response(
+                    user_input, model_response, provider)
 
         final_response = self._prepare_final_response(
             user_input=user_input,
@@ -50,47 +329,85 @@ class ChatEngine:
             input_moderation=input_moderation,
             output_moderation=output_moderation,
         )
+        return self._finalize_response(
+            user_input, final_response, timer, disclaimer)
 
+    def _start_stream(
+        self, user_input: str, include_context: bool, timer: SpanTimer
+    ) -> Iterator[str]:
+        return self.model.generate_stream(
+            **self._generation_params(user_input, include_context, timer))
+
+    def _generation_params(
+        self, user_input: str, include_context: bool, timer: Optional[SpanTimer]
+    ) -> Dict:
+        """Arguments for the provider's generate() and generate_stream()."""
+        return {
+            "prompt": user_input,
+            "system_prompt": SYSTEM_PROMPT,
+            "profile_prompt": self.profile_prompt.text,
+            "conversation_history": self._get_context(include_context),
+            "timer": timer,
+            "user_id": self.session_id,
+            "priority": self.priority,
+        }
+
+    def _finalize_response(
+        self,
+        user_input: str,
+        final_response: Dict,
+        timer: SpanTimer,
+        disclaimer: Optional[str],
+    ) -> Dict:
         # Add disclaimer if applicable
         if disclaimer:
             final_response["response"] = f"{disclaimer}\n\n---\n\n{final_response['response']}"
 
         # 🔹 Clean and format AI response (Markdown → HTML)
-        final_response["response"] = self._format_ai_response(
-            final_response["response"])
-
-        self._update_history(user_input, final_response["response"])
-        final_response["latency_ms"] = int((time.time() - start_time) * 1000)
-        final_response["turn_count"] = self.turn_count
-        final_response["session_id"] = self.session_id
+        with timer.span("formatting"):
+            final_response["response"] = self._format_ai_response(
+                final_response["response"])
+
+        with timer.span("history_update"):
+            self._update_history(user_input, final_response["response"])
+        return self._add_turn_metadata(final_response, timer)
+
+    def _add_turn_metadata(self, response: Dict, timer: SpanTimer) -> Dict:
+        """Adds latency, per-stage timings and session info, and records metrics."""
+        response["latency_ms"] = int(timer.elapsed() * 1000)
+        response["timings"] = timer.as_dict()
+        response["turn_count"] = self.turn_count
+        response["session_id"] = self.session_id
+        get_metrics().observe_request(timer, response["safety_action"])
+        return response
 
-        return final_response
+    def _moderate_input(self, user_input: str, timer: SpanTimer) -> ModerationResult:
+        with timer.span("input_moderation"):
+            return self.moderator.moderate(user_prompt=user_input, tally=self.violations)
 
-    def _moderate_input(self, user_input: str) -> ModerationResult:
-        context = self.conversation_history[-5:
-                                            ] if self.conversation_history else None
-        return self.moderator.moderate(user_prompt=user_input, context=context)
+    def _get_context(self, include_context: bool) -> Optional[List[Dict]]:
+        # Rolling summary of older turns, then recent messages within the token budget
+        return (self.history.context() or None) if include_context else None
 
-    def _generate_response(self, user_input: str, include_context: bool) -> Dict:
+    def _generate_response(
+        self, user_input: str, include_context: bool, timer: Optional[SpanTimer] = None
+    ) -> Dict:
         try:
-            context = (
-                self.conversation_history[-5:]
-                if include_context and self.conversation_history
-                else None
-            )
             return self.model.generate(
-                prompt=user_input,
-                system_prompt=SYSTEM_PROMPT,
-                conversation_history=context,
-            )
+                **self._generation_params(user_input, include_context, timer))
+        except Exception as e:
+            logger.error(f"Model generation failed: {e}")
+            return _generation_error(e)
+
+    async def _generate_response_async(
+        self, user_input: str, include_context: bool, timer: Optional[SpanTimer] = None
+    ) -> Dict:
+        try:
+            return await self.async_model.generate(
+                **self._generation_params(user_input, include_context, timer))
         except Exception as e:
             logger.error(f"Model generation failed: {e}")
-            return {
-                "response": "I apologize, but I'm having trouble processing your message. Please try again.",
-                "error": str(e),
-                "model": "error",
-                "deterministic": False,
-            }
+            return _generation_error(e)
 
     def _moderate_output(
         self, user_input: str, model_response: str
@@ -99,6 +416,27 @@ class ChatEngine:
             user_prompt=user_input, model_response=model_response
         )
 
+    def _moderate_model_response(
+        self, user_input: str, model_response: Dict, provider
+    ) -> ModerationResult:
+        """Moderate a generated response, skipping cached ones that passed the current rules."""
+        if (model_response.get("cached")
+                and model_response.get("moderated") == self.moderator.rules_version):
+            return ModerationResult(
+                action=ModerationAction.ALLOW,
+                tags=[],
+                reason="Cached response already passed moderation",
+                confidence=1.0,
+                rules_version=model_response["moderated"],
+            )
+        output_moderation = self._moderate_output(
+            user_input, model_response["response"]
+        )
+        if output_moderation.action == ModerationAction.ALLOW:
+            provider.mark_response_moderated(
+                model_response.get("cache_key"), output_moderation.rules_version)
+        return output_moderation
+
     def _prepare_final_response(
         self,
         user_input: str,
@@ -136,105 +474,63 @@ class ChatEngine:
             "policy_tags": policy_tags,
             "model_name": model_response.get("model", "unknown"),
             "deterministic": model_response.get("deterministic", False),
+            "usage": model_response.get("usage"),
+            "cached": model_response.get("cached", False),
         }
 
     def _format_ai_response(self, text: str) -> str:
-        """Clean and format AI response (Markdown → HTML)."""
-        if not text:
-            return text
-
-        # Handle multiline code blocks first
-        text = re.sub(r"```(.*?)```", r"<pre><code>\1</code></pre>",
-                      text, flags=re.DOTALL)
-
-        # Inline code
-        text = re.sub(r"`([^`]+)`", r"<code>\1</code>", text)
-
-        # Bold (**bold**)
-        text = re.sub(r"\*\*(.*?)\*\*", r"<b>\1</b>", text)
-
-        # Italic (*italic*)
-        text = re.sub(r"(?<!\*)\*(?!\*)(.*?)\*(?<!\*)", r"<i>\1</i>", text)
-
-        # Links [text](url)
-        text = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r'<a href="\2">\1</a>', text)
-
-        # Replace newlines with <br> for HTML display
-        text = text.replace("\n", "<br>")
-
-        return text
+        """Clean and format AI response (Markdown → HTML, escaping everything else)."""
+        return render_markdown(text)
 
     def _update_history(self, user_input: str, assistant_response: str):
-        # Add new messages
-        self.conversation_history.append(
-            {"role": "user", "content": user_input})
-        self.conversation_history.append(
-            {"role": "assistant", "content": assistant_response})
+        # Older messages beyond the token budget are folded into the summary
+        self.history.add_turn(user_input, assistant_response)
+        self.violations.add({"role": "user", "content": user_input},
+                            {"role": "assistant", "content": assistant_response})
+        self.turn_count += 1
 
-        # Keep only last 5 messages
-        if len(self.conversation_history) > 5:
-            self.conversation_history = self.conversation_history[-5:]
+    def reset(self):
+        with self._lock:
+            self.history.clear()
+            self.violations.clear()
+            self.turn_count = 0
+            self.first_interaction = True
+            self.session_id = f"session_{int(time.time())}"
+            self.set_user_profile(user_profile_data)
+        logger.info(f"Chat engine reset. New session: {self.session_id}")
 
-        self.turn_count += 1
 
-    def _handle_block(self, user_input: str, start_time: float, disclaimer: str):
-        response = self._prepare_final_response(
-            user_input=user_input,
-            model_response={"response": "",
-                            "model": "blocked", "deterministic": True},
-            input_moderation=ModerationResult(
-                action=ModerationAction.BLOCK, tags=[], reason="", confidence=0.0
-            ),
-            output_moderation=ModerationResult(
-                action=ModerationAction.ALLOW, tags=[], reason="", confidence=0.0
-            ),
-        )
-        if disclaimer:
-            response["response"] = f"{disclaimer}\n\n---\n\n{response['response']}"
-        self._update_history(user_input, response["response"])
-        response["latency_ms"] = int((time.time() - start_time) * 1000)
-        response["turn_count"] = self.turn_count
-        response["session_id"] = self.session_id
-        return response
+def _generation_error(error: Exception) -> Dict:
+    """Model response used when generation fails."""
+    return {
+        "response": "I apologize, but I'm having trouble processing your message. Please try again.",
+        "error": str(error),
+        "model": "error",
+        "deterministic": False,
+    }
 
-    def _handle_safe_fallback(self, user_input: str, start_time: float, disclaimer: str):
-        response = self._prepare_final_response(
-            user_input=user_input,
-            model_response={
-                "response": "",
-                "model": "safe_fallback",
-                "deterministic": True,
-            },
-            input_moderation=ModerationResult(
-                action=ModerationAction.SAFE_FALLBACK, tags=[], reason="", confidence=0.0
-            ),
-            output_moderation=ModerationResult(
-                action=ModerationAction.ALLOW, tags=[], reason="", confidence=0.0
-            ),
-        )
-        if disclaimer:
-            response["response"] = f"{disclaimer}\n\n---\n\n{response['response']}"
-        self._update_history(user_input, response["response"])
-        response["latency_ms"] = int((time.time() - start_time) * 1000)
-        response["turn_count"] = self.turn_count
-        response["session_id"] = self.session_id
-        return response
 
-    def reset(self):
-        self.conversation_history = []
-        self.turn_count = 0
-        self.first_interaction = True
-        self.session_id = f"session_{int(time.time())}"
-        self.user_profile = {}
-        logger.info(f"Chat engine reset. New session: {self.session_id}")
+def _record_speculation(outcome: str):
+    get_metrics().counter(
+        "speculative_generations_total",
+        "Model calls started before input moderation finished, by outcome (used or wasted).",
+        label="outcome",
+    ).inc(outcome)
 
 
 _engine_instance = None
+_engine_lock = threading.Lock()
 
 
 def get_engine() -> ChatEngine:
+    """Get the process-wide ChatEngine (single-user scripts and tests).
+
+    The web app uses per-session engines from src.session_manager instead.
+    """
     global _engine_instance
     if _engine_instance is None:
-        _engine_instance = ChatEngine()
-        logger.info("Created new ChatEngine singleton instance")
+        with _engine_lock:
+            if _engine_instance is None:
+                _engine_instance = ChatEngine()
+                logger.info("Created new ChatEngine singleton instance")
     return _engine_instance
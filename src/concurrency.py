@@ -0,0 +1,29 @@
+"""
+Thread helpers shared by the chat pipeline.
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+
+def run_in_thread(name: str, fn: Callable, *args, **kwargs) -> Future:
+    """
+    Run fn(*args, **kwargs) on a new daemon thread, returning a Future for its result.
+
+    Used instead of a pool for work that mostly waits on the network, so
+    concurrency is never capped by a pool size. Cancelling the future
+    before the thread starts skips the call; after that it runs to the end.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
@@ -5,15 +5,59 @@ import json
 # -------------------------------
 # Model and API configuration
 # -------------------------------
-MODEL_PROVIDER = "openai"
+MODEL_PROVIDER = "openai"  # "openai", "local" (OpenAI-compatible server) or "fake" (offline)
 MODEL_NAME = "gpt-4o"
-MODEL_ENDPOINT = "https://api.openai.com/v1"
+MODEL_ENDPOINT = "https://api.openai.com/v1"  # OPENAI_BASE_URL in the environment overrides this
 TEMPERATURE = 0.0
 TOP_P = 1.0
 MAX_TOKENS = 500
-TIMEOUT_SECONDS = 60
+TIMEOUT_SECONDS = 60  # Overall deadline for a model call, including retries
 RANDOM_SEED = 42
 
+# -------------------------------
+# Model transport (connection pool, retries, circuit breaker)
+# -------------------------------
+MODEL_POOL_MAX_CONNECTIONS = 100  # Open connections to the API per process
+MODEL_POOL_MAX_KEEPALIVE = 20  # Idle connections kept warm for reuse
+MODEL_KEEPALIVE_EXPIRY_SECONDS = 60
+MODEL_HTTP2 = False  # Multiplex requests over one connection; needs httpx[http2]
+MODEL_CONNECT_TIMEOUT_SECONDS = 5
+MODEL_ATTEMPT_TIMEOUT_SECONDS = 30  # Per attempt; TIMEOUT_SECONDS bounds all attempts
+MODEL_MAX_RETRIES = 3  # Retries of connection errors, 408/409/429 and 5xx
+MODEL_RETRY_BASE_DELAY = 0.5  # Seconds; doubles per retry, with full jitter
+MODEL_RETRY_MAX_DELAY = 8.0
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive outage failures before failing fast; 0 disables
+CIRCUIT_RESET_SECONDS = 30  # How long to fail fast before sending a trial request
+
+# -------------------------------
+# Other model backends
+# -------------------------------
+# "local": any OpenAI-compatible server (vLLM, llama.cpp, Ollama, ...); an
+# API key, if it needs one, is read from LOCAL_MODEL_API_KEY
+LOCAL_MODEL_ENDPOINT = "http://localhost:8000/v1"
+LOCAL_MODEL_NAME = "qwen2.5-7b-instruct"
+# "fake": deterministic in-process replies for tests and offline load tests
+FAKE_MODEL_LATENCY_SECONDS = 0.0  # Before the reply or first chunk
+FAKE_MODEL_CHUNK_DELAY_SECONDS = 0.0  # Between streamed chunks
+
+# -------------------------------
+# Hedged requests
+# -------------------------------
+MODEL_HEDGE_PROVIDER = None  # Backend for hedged duplicates, e.g. "local"; None disables
+HEDGE_PERCENTILE = 95  # Hedge once the primary is slower than this percentile of recent calls
+HEDGE_MIN_SAMPLES = 20  # Until this many calls are seen, hedge after the default delay
+HEDGE_DEFAULT_DELAY_SECONDS = 5.0
+HEDGE_MIN_DELAY_SECONDS = 0.5
+HEDGE_WINDOW_SIZE = 200  # Recent primary latencies the percentile is taken over
+
+# -------------------------------
+# Client-side rate limits (per process; divide the account quota between workers)
+# -------------------------------
+MODEL_REQUESTS_PER_MINUTE = 500  # 0 disables
+MODEL_TOKENS_PER_MINUTE = 30000  # Prompt plus max_tokens reserved per request; 0 disables
+SCHEDULER_BURST_SECONDS = 10  # Quota that can be spent at once, in seconds' worth
+SCHEDULER_MAX_WAIT_SECONDS = 30  # Requests queued longer than this fail
+
 # -------------------------------
 # Logging configuration
 # -------------------------------
@@ -28,16 +72,66 @@ TESTS_DIR = os.path.join(BASE_DIR, "tests")
 OUTPUTS_FILE = os.path.join(TESTS_DIR, "outputs.jsonl")
 SCHEMA_FILE = os.path.join(TESTS_DIR, "expected_schema.json")
 PROFILE_FILE = os.path.join(BASE_DIR, "app", "data", "profiles.json")
+PROFILE_DB = os.path.join(BASE_DIR, "app", "data", "profiles.sqlite3")
+PROFILE_STORE_BACKEND = "json"  # "json" (profiles.json) or "sqlite" (PROFILE_DB)
+USAGE_LOG_DIR = os.path.join(BASE_DIR, "app", "data", "usage")  # One append-only log per user
+USAGE_LOG_LEGACY_FILE = os.path.join(BASE_DIR, "app", "data", "usage_log.json")  # Imported once
 
 # -------------------------------
 # Conversation context
 # -------------------------------
-CONTEXT_WINDOW_SIZE = 5  # Only last 5 messages remembered
+CONTEXT_WINDOW_SIZE = 5  # Recent messages the input moderator's escalation check counts (no per-turn cost)
+HISTORY_TOKEN_BUDGET = 1500  # Tokens of recent messages sent with each request
+HISTORY_SUMMARY_MODE = "extractive"  # "extractive" (local), "model" (LLM, in the background) or None
+HISTORY_SUMMARY_MAX_TOKENS = 200  # Rolling summary of messages evicted from the budget
+
+# -------------------------------
+# Session management
+# -------------------------------
+SESSION_MAX_COUNT = 1000  # Memory cap: most sessions kept in the pool at once
+SESSION_IDLE_TTL_SECONDS = 30 * 60  # Evict sessions idle for 30 minutes
+SESSION_COOKIE_KEY = "chat_session_id"
+
+# -------------------------------
+# Response cache (deterministic completions only)
+# -------------------------------
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+RESPONSE_CACHE_TTL_SECONDS = 24 * 60 * 60
+RESPONSE_CACHE_DB = None  # e.g. os.path.join(BASE_DIR, "cache", "responses.sqlite3")
+
+# -------------------------------
+# Text-to-speech audio cache
+# -------------------------------
+TTS_CACHE_DIR = os.path.join(BASE_DIR, "app", "data", "tts_cache")  # None for memory only
+TTS_CACHE_MAX_BYTES = 32 * 1024 * 1024  # In-memory tier size
+TTS_CACHE_MAX_DISK_BYTES = 512 * 1024 * 1024  # On-disk tier size; least recently used clips go first
+TTS_PRESYNTHESIZE = True  # Synthesise each reply's Chinese in the background after /chat
+TTS_MAX_WORKERS = 2  # Synthesis threads for /speak and /speak/stream
+TTS_BACKGROUND_WORKERS = 1  # Separate threads for pre-synthesis, so it never delays /speak
+TTS_BACKEND = "gtts"  # "gtts" (Google, needs network) or "offline" (local espeak-ng)
+TTS_CHUNK_MIN_CHARS = 12  # Sentences shorter than this are merged for streaming
+
+# -------------------------------
+# Batch evaluation (python -m src.evaluate)
+# -------------------------------
+EVAL_INPUT_FILE = os.path.join(TESTS_DIR, "inputs.jsonl")
+EVAL_MAX_WORKERS = 8  # Prompts in flight at once
 
 # -------------------------------
 # Safety
 # -------------------------------
 SAFETY_MODE = "permissive"
+# Start the model call while input moderation runs, discarding it if the
+# input is blocked. Saves moderation time per turn; blocked prompts still
+# reach the API and their calls are counted as wasted in /metrics.
+SPECULATIVE_GENERATION = False
+# Texts per task when python -m src.batch_moderation scans on a process pool
+MODERATION_BATCH_CHUNK_SIZE = 2000
+# Keyword lists, patterns, thresholds and fallback replies; edits take effect
+# without a restart
+MODERATION_RULES_FILE = os.path.join(BASE_DIR, "src", "moderation_rules.json")
+MODERATION_RULES_RELOAD_SECONDS = 5  # How often to check the file for changes; 0 disables
 
 # -------------------------------
 # Custom config for chatbot behavior
@@ -65,39 +159,20 @@ def _load_user_profile(file_path: str) -> Dict:
         return {}
 
 
-def _format_user_profile_for_prompt(profile_data: Dict) -> str:
-    """Formats user profile section for the system prompt."""
-    if not profile_data:
-        return ""
-
-    profile_str = "\n## Current User Profile\n"
-    profile_str += f"- User Name: {profile_data.get('name', 'Unknown')}\n"
-    profile_str += f"- Learning Level: **{profile_data.get('level', 'not specified')}**\n"
-
-    goal = profile_data.get("goal", [])
-    if isinstance(goal, list):
-        goal_str = ", ".join(goal) if goal else "to improve Chinese skills"
-    else:
-        goal_str = str(goal)
-    profile_str += f"- Goal: **{goal_str}**\n"
-
-    profile_str += "\n**Tailor your responses specifically to this user's background and needs.**\n"
-    return profile_str
-
-
-# Load and format profile section at import
+# Profile new chat engines start with; the web app replaces it with the
+# session's stored profile. src.prompts renders it into the prompt.
 user_profile_data = _load_user_profile(PROFILE_FILE)
-formatted_profile_section = _format_user_profile_for_prompt(user_profile_data)
 
 # -------------------------------
 # System prompt
 # -------------------------------
-SYSTEM_PROMPT = f"""
+# Static instructions only: this string must stay byte-identical across users
+# and turns so the provider can cache it as a prompt prefix. Per-user details
+# are rendered per profile by src.prompts and sent as a separate message
+# after it.
+SYSTEM_PROMPT = """
 You are a friendly and patient Chinese language practice partner (AI). Your goal is to help users improve their Mandarin in a supportive, engaging, and encouraging way. Keep responses concise (under 100 words) and adapt your explanations to the user's skill level.
 
-## User details
-{formatted_profile_section}
-
 ## Role
 - Focus exclusively on Chinese language practice; avoid unrelated advice.
 - Be positive, encouraging, and supportive, even when the user makes mistakes.
@@ -146,6 +221,15 @@ English: [Translation / purpose of this reply]
 """
 
 
+# Distinct user profiles whose rendered profile message and token count are
+# kept in memory
+PROMPT_CACHE_MAX_ENTRIES = 1024
+
+# Optional prompt_cache_key sent with each request so the provider routes
+# requests sharing the static prefix to the same cache. None disables it.
+PROMPT_CACHE_KEY = None
+
+
 # -------------------------------
 # Utility functions
 # -------------------------------
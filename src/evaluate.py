@@ -0,0 +1,216 @@
+"""
+Batch evaluation runner.
+
+Streams prompts from a JSONL file through ChatEngine.process_message on a
+bounded worker pool, validates every output record against the expected
+schema, and appends results to OUTPUTS_FILE as they complete. Rerunning
+with an existing output file resumes from where the last run stopped.
+
+Each input line is an object with a "prompt" and an optional "id" (defaults
+to the record number). Each prompt runs on a fresh engine, so results do not
+depend on order or on which worker handled them. Model calls run at
+batch priority, so the request scheduler keeps them within
+MODEL_REQUESTS_PER_MINUTE and MODEL_TOKENS_PER_MINUTE behind any
+interactive traffic in the same process.
+
+Usage:
+    python -m src.evaluate [--input tests/inputs.jsonl] [--workers 8]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, Optional, Set
+
+from .chat_engine import ChatEngine
+from .config import (
+    EVAL_INPUT_FILE,
+    EVAL_MAX_WORKERS,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    OUTPUTS_FILE,
+    SCHEMA_FILE,
+)
+from .io_utils import JsonlWriter, iter_jsonl, load_schema, validate_record
+from .scheduler import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+def iter_prompts(filepath: str) -> Iterator[Dict]:
+    """
+    Lazily read prompt records from a JSONL file.
+
+    Args:
+        filepath: Path to JSONL file
+
+    Yields:
+        Dicts with "id" and "prompt"
+    """
+    for number, record in enumerate(iter_jsonl(filepath), 1):
+        yield {"id": record.get("id", number), "prompt": record["prompt"]}
+
+
+def completed_ids(filepath: str) -> Set[str]:
+    """Ids already present in an output file, for resuming an interrupted run."""
+    done = set()
+    if not os.path.exists(filepath):
+        return done
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                # A line cut short by an interrupted write; that prompt reruns
+                continue
+    return done
+
+
+# Bytes read at a time when looking for the end of the last complete line
+_TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def _drop_partial_line(filepath: str):
+    """Cut a trailing line left unfinished by an interrupted write, so appends start clean."""
+    if not os.path.exists(filepath):
+        return
+    with open(filepath, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        if not end:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b'\n':
+            return
+        # Scan backwards for the last complete line, one block at a time
+        while end > 0:
+            start = max(0, end - _TAIL_BLOCK_SIZE)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return
+            end = start
+        f.truncate(0)
+
+
+def evaluate_prompt(record: Dict) -> Dict:
+    """Run one prompt through a fresh engine and build its output record."""
+    engine = ChatEngine(session_id=f"eval_{record['id']}", priority=PRIORITY_BATCH)
+    # Prompts are independent single turns, so skip the first-turn disclaimer
+    engine.first_interaction = False
+    response_data = engine.process_message(record["prompt"])
+    return {"id": record["id"], "prompt": record["prompt"], **response_data}
+
+
+def run_evaluation(
+    input_file: str = EVAL_INPUT_FILE,
+    output_file: str = OUTPUTS_FILE,
+    schema_file: Optional[str] = SCHEMA_FILE,
+    max_workers: int = EVAL_MAX_WORKERS,
+    resume: bool = True,
+) -> Dict:
+    """
+    Evaluate every prompt in input_file, appending results to output_file.
+
+    Records whose model call failed are not written, so a later run with
+    resume=True retries them. Records that fail schema validation are
+    written and counted.
+
+    Args:
+        input_file: JSONL file of prompts
+        output_file: JSONL file results are appended to
+        schema_file: JSON schema for output records, or None to skip validation
+        max_workers: Prompts in flight at once
+        resume: Skip ids already in output_file instead of starting over
+
+    Returns:
+        Summary counts and throughput
+    """
+    schema = None
+    if schema_file and os.path.exists(schema_file):
+        schema = load_schema(schema_file)
+    elif schema_file:
+        logger.warning(f"Schema file not found, skipping validation: {schema_file}")
+
+    if resume:
+        _drop_partial_line(output_file)
+    done = completed_ids(output_file) if resume else set()
+    if done:
+        logger.info(f"Resuming: {len(done)} records already in {output_file}")
+
+    summary = {"written": 0, "skipped": len(done), "failed": 0, "invalid": 0}
+    start = time.time()
+
+    with JsonlWriter(output_file, append=resume, flush_every=1) as out, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def collect(finished):
+            for future in finished:
+                record = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Prompt {record['id']} failed: {e}")
+                    summary["failed"] += 1
+                    continue
+                # The engine turns a failed model call into an apology reply
+                # from the "error" model rather than raising
+                if result.get("model_name") == "error":
+                    logger.error(f"Prompt {record['id']} failed: model call raised")
+                    summary["failed"] += 1
+                    continue
+                if schema is not None and not validate_record(result, schema):
+                    summary["invalid"] += 1
+                out.write(result)
+                summary["written"] += 1
+
+        # Only a bounded window of prompts is read ahead of the workers
+        pending = {}
+        for record in iter_prompts(input_file):
+            if str(record["id"]) in done:
+                continue
+            if len(pending) >= max_workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending[executor.submit(evaluate_prompt, record)] = record
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    elapsed = time.time() - start
+    processed = summary["written"] + summary["failed"]
+    summary["seconds"] = round(elapsed, 2)
+    summary["prompts_per_second"] = round(processed / elapsed, 2) if elapsed else 0.0
+    logger.info(f"Evaluation finished: {summary}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--input", default=EVAL_INPUT_FILE, help="JSONL file of prompts")
+    parser.add_argument("--output", default=OUTPUTS_FILE, help="JSONL file for results")
+    parser.add_argument("--schema", default=SCHEMA_FILE, help="JSON schema for results")
+    parser.add_argument("--workers", type=int, default=EVAL_MAX_WORKERS)
+    parser.add_argument("--restart", action="store_true",
+                        help="Overwrite the output file instead of resuming")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    summary = run_evaluation(
+        input_file=args.input,
+        output_file=args.output,
+        schema_file=args.schema,
+        max_workers=args.workers,
+        resume=not args.restart,
+    )
+    print(json.dumps(summary, ensure_ascii=False))
+    if summary["failed"] or summary["invalid"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Deterministic in-process stand-in for the OpenAI client.
+
+FakeModelProvider plugs these clients in place of the SDK, so the whole
+pipeline (scheduler, retries, response cache, moderation, formatting) runs
+offline: for tests, demos without credentials, and load tests. The reply
+depends only on the request, and latency is configurable to mimic a real
+backend.
+"""
+
+import asyncio
+import hashlib
+import time
+from types import SimpleNamespace
+from typing import Dict, Iterator, List
+
+from .config import FAKE_MODEL_CHUNK_DELAY_SECONDS, FAKE_MODEL_LATENCY_SECONDS
+from .tokenizer import count_tokens
+
+_REPLIES = [
+    "很好！Let's keep practising. 你今天想聊什么？(What would you like to talk about today?)",
+    "不错！Try answering in a full sentence: 我今天很忙。(I am very busy today.)",
+    "好问题！The word 已经 (yǐjīng) means \"already\". 例如：我已经吃饭了。",
+    "加油！Let's review: 谢谢 (xièxie) means \"thank you\". 你可以用它造一个句子吗？",
+]
+
+
+def fake_reply(messages: List[Dict]) -> str:
+    """Reply chosen by a hash of the conversation, echoing the last message."""
+    digest = hashlib.sha256(repr(messages).encode("utf-8")).digest()
+    prompt = messages[-1]["content"] if messages else ""
+    return f"{_REPLIES[digest[0] % len(_REPLIES)]}\n\nYou said: {prompt}"
+
+
+def _completion(model: str, text: str, messages: List[Dict]):
+    prompt_tokens = sum(count_tokens(m.get("content") or "") for m in messages)
+    return SimpleNamespace(
+        model=model,
+        created=int(time.time()),
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason="stop")],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=count_tokens(text),
+            prompt_tokens_details=None,
+        ),
+    )
+
+
+def _chunk(text: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+
+def _usage_chunk(text: str, messages: List[Dict]):
+    # Sent last when stream_options asks for usage, as the API does
+    return SimpleNamespace(choices=[], usage=_completion("", text, messages).usage)
+
+
+def _split_chunks(text: str) -> List[str]:
+    # Roughly token-sized pieces, like a real stream
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def _include_usage(kwargs: Dict) -> bool:
+    return bool((kwargs.get("stream_options") or {}).get("include_usage"))
+
+
+class _FakeCompletions:
+    def __init__(self, latency: float, chunk_delay: float):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+
+    def create(self, model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        time.sleep(self.latency)
+        text = fake_reply(messages)
+        if stream:
+            return self._stream(text, messages, _include_usage(kwargs))
+        return _completion(model, text, messages)
+
+    def _stream(self, text: str, messages: List[Dict], include_usage: bool) -> Iterator:
+        for piece in _split_chunks(text):
+            yield _chunk(piece)
+            time.sleep(self.chunk_delay)
+        if include_usage:
+            yield _usage_chunk(text, messages)
+
+
+class _AsyncFakeCompletions(_FakeCompletions):
+    async def create(self, model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        await asyncio.sleep(self.latency)
+        text = fake_reply(messages)
+        if stream:
+            return self._stream(text, messages, _include_usage(kwargs))
+        return _completion(model, text, messages)
+
+    async def _stream(self, text: str, messages: List[Dict], include_usage: bool):
+        for piece in _split_chunks(text):
+            yield _chunk(piece)
+            await asyncio.sleep(self.chunk_delay)
+        if include_usage:
+            yield _usage_chunk(text, messages)
+
+
+class _FakeModels:
+    def retrieve(self, model: str):
+        return SimpleNamespace(id=model)
+
+
+class _AsyncFakeModels:
+    async def retrieve(self, model: str):
+        return SimpleNamespace(id=model)
+
+
+class FakeClient:
+    """Duck-types the parts of openai.OpenAI that ModelProvider uses."""
+
+    def __init__(
+        self,
+        latency: float = FAKE_MODEL_LATENCY_SECONDS,
+        chunk_delay: float = FAKE_MODEL_CHUNK_DELAY_SECONDS,
+    ):
+        self.chat = SimpleNamespace(completions=_FakeCompletions(latency, chunk_delay))
+        self.models = _FakeModels()
+
+
+class AsyncFakeClient:
+    """Duck-types the parts of openai.AsyncOpenAI that AsyncModelProvider uses."""
+
+    def __init__(
+        self,
+        latency: float = FAKE_MODEL_LATENCY_SECONDS,
+        chunk_delay: float = FAKE_MODEL_CHUNK_DELAY_SECONDS,
+    ):
+        self.chat = SimpleNamespace(completions=_AsyncFakeCompletions(latency, chunk_delay))
+        self.models = _AsyncFakeModels()
@@ -5,24 +5,27 @@ This module is complete - students should NOT modify.
 
 import json
 import logging
+import mmap
 import os
+from array import array
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 import jsonschema
 
 logger = logging.getLogger(__name__)
 
 
-def read_jsonl(filepath: str) -> List[Dict]:
+def iter_jsonl(filepath: str) -> Iterator[Dict]:
     """
-    Read JSONL file and return list of dictionaries.
+    Lazily yield records from a JSONL file, one line at a time.
     
     Args:
         filepath: Path to JSONL file
         
-    Returns:
-        List of parsed JSON objects
+    Yields:
+        Parsed JSON objects
         
     Raises:
         FileNotFoundError: If file doesn't exist
@@ -31,38 +34,204 @@ def read_jsonl(filepath: str) -> List[Dict]:
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"File not found: {filepath}")
     
-    records = []
     with open(filepath, 'r', encoding='utf-8') as f:
         for line_num, line in enumerate(f, 1):
             line = line.strip()
             if not line:
                 continue
             try:
-                records.append(json.loads(line))
+                yield json.loads(line)
             except json.JSONDecodeError as e:
                 logger.error(f"Invalid JSON at line {line_num}: {e}")
                 raise
+
+
+def read_jsonl(filepath: str) -> List[Dict]:
+    """
+    Read JSONL file and return list of dictionaries.
     
+    Args:
+        filepath: Path to JSONL file
+        
+    Returns:
+        List of parsed JSON objects
+        
+    Raises:
+        FileNotFoundError: If file doesn't exist
+        json.JSONDecodeError: If JSON is invalid
+    """
+    records = list(iter_jsonl(filepath))
     logger.info(f"Read {len(records)} records from {filepath}")
     return records
 
 
-def write_jsonl(records: List[Dict], filepath: str):
+class JsonlWriter:
+    """
+    Incremental JSONL writer.
+    
+    Usage:
+        with JsonlWriter(path, append=True) as writer:
+            for record in records:
+                writer.write(record)
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        append: bool = False,
+        flush_every: int = 0,
+        fsync: bool = False,
+    ):
+        """
+        Args:
+            filepath: Output file path
+            append: Add to an existing file instead of truncating it
+            flush_every: Flush after this many records (0 = only on close)
+            fsync: Also fsync on each flush, so records survive a power loss
+        """
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        self.filepath = filepath
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.count = 0
+        self._file = open(filepath, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, record: Dict):
+        """Write one record."""
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.count += 1
+        if self.flush_every and self.count % self.flush_every == 0:
+            self.flush()
+
+    def write_all(self, records: Iterable[Dict]):
+        """Write every record from an iterable, consuming it lazily."""
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """Push buffered records to the OS (and to disk if fsync is set)."""
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_jsonl(records: Iterable[Dict], filepath: str, append: bool = False):
     """
-    Write list of dictionaries to JSONL file.
+    Write dictionaries to JSONL file.
     
     Args:
-        records: List of dictionaries to write
+        records: Dictionaries to write; any iterable, consumed lazily
         filepath: Output file path
+        append: Add to an existing file instead of overwriting it
     """
-    # Create directory if it doesn't exist
-    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with JsonlWriter(filepath, append=append) as writer:
+        writer.write_all(records)
     
-    with open(filepath, 'w', encoding='utf-8') as f:
-        for record in records:
-            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    logger.info(f"Wrote {writer.count} records to {filepath}")
+
+
+# Bytes copied at a time when counting lines in a memory-mapped file
+_COUNT_BLOCK_SIZE = 1 << 20
+
+
+class JsonlIndex:
+    """
+    Random access to records of a large JSONL file by record number.
     
-    logger.info(f"Wrote {len(records)} records to {filepath}")
+    The file is memory-mapped and only the start offset of each record is
+    kept (8 bytes per record), so a multi-GB file can be opened without
+    loading it. Blank lines are skipped, so record numbers match the order
+    iter_jsonl() yields them.
+    """
+
+    def __init__(self, filepath: str):
+        """
+        Args:
+            filepath: Path to JSONL file
+            
+        Raises:
+            FileNotFoundError: If file doesn't exist
+        """
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"File not found: {filepath}")
+        
+        self.filepath = filepath
+        self._file = open(filepath, 'rb')
+        self._map: Optional[mmap.mmap] = None
+        self._offsets = array('Q')
+        if os.path.getsize(filepath):
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._build_index()
+        logger.info(f"Indexed {len(self._offsets)} records in {filepath}")
+
+    def _build_index(self):
+        data = self._map
+        size = len(data)
+        start = 0
+        while start < size:
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = size
+            if data[start:end].strip():
+                self._offsets.append(start)
+            start = end + 1
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> Dict:
+        """
+        Parse the record at index.
+        
+        Raises:
+            IndexError: If index is out of range
+            json.JSONDecodeError: If JSON is invalid
+        """
+        start = self._offsets[index]
+        end = self._map.find(b'\n', start)
+        line = self._map[start:end if end != -1 else len(self._map)]
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError as e:
+            # Line numbers are only counted when needed, to keep the index small
+            line_num = self._count_lines(start) + 1
+            logger.error(f"Invalid JSON at line {line_num}: {e}")
+            raise
+
+    def _count_lines(self, end: int) -> int:
+        """Newlines before byte offset end, counted in bounded slices of the map."""
+        count = 0
+        for block_start in range(0, end, _COUNT_BLOCK_SIZE):
+            count += self._map[block_start:min(block_start + _COUNT_BLOCK_SIZE, end)].count(b'\n')
+        return count
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> "JsonlIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 def load_schema(schema_path: str) -> Dict:
@@ -88,6 +257,39 @@ def load_schema(schema_path: str) -> Dict:
     return schema
 
 
+# Distinct schemas whose compiled validators are kept
+_VALIDATOR_CACHE_SIZE = 16
+
+
+def get_validator(schema: Dict) -> jsonschema.protocols.Validator:
+    """
+    Return a compiled validator for schema, building it on first use.
+    
+    Validators are cached by the schema's canonical JSON, so equal schemas
+    share one and a schema edited after use gets a fresh one. Only the
+    most recently used schemas are kept.
+    
+    Args:
+        schema: JSON schema
+        
+    Returns:
+        Validator for the schema's declared draft
+        
+    Raises:
+        jsonschema.exceptions.SchemaError: If the schema is invalid
+    """
+    return _compile_validator(json.dumps(schema, ensure_ascii=False, sort_keys=True))
+
+
+@lru_cache(maxsize=_VALIDATOR_CACHE_SIZE)
+def _compile_validator(canonical_schema: str) -> jsonschema.protocols.Validator:
+    # Built from its own copy, so later edits to the caller's dict can't reach it
+    schema = json.loads(canonical_schema)
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
 def validate_record(record: Dict, schema: Dict) -> bool:
     """
     Validate a record against JSON schema.
@@ -100,14 +302,152 @@ def validate_record(record: Dict, schema: Dict) -> bool:
         True if valid, False otherwise
     """
     try:
-        jsonschema.validate(instance=record, schema=schema)
-        return True
-    except jsonschema.exceptions.ValidationError as e:
-        logger.error(f"Schema validation failed: {e.message}")
-        return False
+        validator = get_validator(schema)
     except jsonschema.exceptions.SchemaError as e:
         logger.error(f"Schema is invalid: {e.message}")
         raise
+    
+    error = jsonschema.exceptions.best_match(validator.iter_errors(record))
+    if error is not None:
+        logger.error(f"Schema validation failed: {error.message}")
+        return False
+    return True
+
+
+def _record_errors(validator, index: int, record: Dict) -> List[Dict]:
+    return [
+        {"index": index, "path": error.json_path, "message": error.message}
+        for error in validator.iter_errors(record)
+    ]
+
+
+# Validator of the current worker process in validate_records(processes=N)
+_worker_validator = None
+
+
+def _init_validation_worker(schema: Dict):
+    global _worker_validator
+    _worker_validator = get_validator(schema)
+
+
+def _validate_chunk(start: int, records: List[Dict]) -> List[Dict]:
+    errors = []
+    for offset, record in enumerate(records):
+        errors.extend(_record_errors(_worker_validator, start + offset, record))
+    return errors
+
+
+def _validate_lines(start: int, lines: List[str]) -> List[Dict]:
+    # Parsing happens in the worker too, so only raw text crosses processes
+    errors = []
+    for offset, line in enumerate(lines):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            errors.append({"index": start + offset, "path": "$", "message": f"Invalid JSON: {e}"})
+            continue
+        errors.extend(_record_errors(_worker_validator, start + offset, record))
+    return errors
+
+
+def validate_records(
+    records: Iterable[Dict],
+    schema: Dict,
+    processes: int = 0,
+    chunk_size: int = 1000,
+) -> List[Dict]:
+    """
+    Validate many records and collect every error.
+    
+    Args:
+        records: Dictionaries to validate; any iterable, e.g. iter_jsonl(path)
+        schema: JSON schema
+        processes: Worker processes for very large inputs (0 = validate in-process)
+        chunk_size: Records sent to a worker at a time
+        
+    Returns:
+        Errors ordered by record, as dicts with "index" (0-based record
+        number), "path" (JSON path of the failing value) and "message".
+        Empty if every record is valid.
+        
+    Raises:
+        jsonschema.exceptions.SchemaError: If the schema is invalid
+    """
+    validator = get_validator(schema)
+    if processes <= 0:
+        errors = []
+        for index, record in enumerate(records):
+            errors.extend(_record_errors(validator, index, record))
+        return errors
+    return _validate_in_pool(_validate_chunk, records, schema, processes, chunk_size)
+
+
+def validate_jsonl(
+    filepath: str,
+    schema: Dict,
+    processes: int = 0,
+    chunk_size: int = 1000,
+) -> List[Dict]:
+    """
+    Validate every record of a JSONL file, streaming it.
+    
+    With processes > 0, raw lines are handed to worker processes, which both
+    parse and validate them, so the parent only reads the file.
+    
+    Args:
+        filepath: Path to JSONL file
+        schema: JSON schema
+        processes: Worker processes (0 = validate in-process)
+        chunk_size: Lines sent to a worker at a time
+        
+    Returns:
+        Errors as from validate_records(); with processes > 0, lines that are
+        not valid JSON are reported as errors instead of raising
+        
+    Raises:
+        FileNotFoundError: If file doesn't exist
+        json.JSONDecodeError: If a line is not valid JSON (in-process only)
+    """
+    if processes <= 0:
+        return validate_records(iter_jsonl(filepath), schema)
+    
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"File not found: {filepath}")
+    get_validator(schema)
+    with open(filepath, 'r', encoding='utf-8') as f:
+        lines = (line for line in f if line.strip())
+        return _validate_in_pool(_validate_lines, lines, schema, processes, chunk_size)
+
+
+def _validate_in_pool(
+    worker, items: Iterable, schema: Dict, processes: int, chunk_size: int
+) -> List[Dict]:
+    # Imported here so the in-process path stays light
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import islice
+    
+    errors = []
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_validation_worker,
+        initargs=(schema,),
+    ) as executor:
+        # Keep a bounded number of chunks in flight so memory stays flat
+        pending = deque()
+        iterator = iter(items)
+        start = 0
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                break
+            pending.append(executor.submit(worker, start, chunk))
+            start += len(chunk)
+            if len(pending) > processes * 2:
+                errors.extend(pending.popleft().result())
+        while pending:
+            errors.extend(pending.popleft().result())
+    return errors
 
 
 def ensure_path(path: str) -> Path:
@@ -0,0 +1,197 @@
+"""
+Markdown to HTML for chat replies.
+
+Supports the subset the tutor uses: fenced code blocks, `inline code`,
+**bold**, *italic*, [links](url) and line breaks. Everything else is
+HTML-escaped, so model output can't inject markup, and links are only
+emitted for http(s), mailto and relative URLs.
+
+Rendering is a single left-to-right scan. Emphasis delimiters are matched
+with a stack in which each opener is pushed and popped at most once, and
+every forward search for a closing backtick, ``` or ")" either succeeds
+(consuming the text it skipped) or fails once and is not repeated. Cost is
+therefore linear in the reply length, however many stray '*' or '[' it
+contains; the previous regex passes could backtrack quadratically on those.
+
+StreamingMarkdownRenderer renders a streamed reply incrementally. Inline
+markup never spans lines, so each complete line can be rendered as soon as
+it arrives (code blocks once their closing fence arrives), and the
+concatenated output equals render_markdown() of the whole reply.
+"""
+
+import re
+from html import escape
+from typing import List, Optional
+
+_FENCE = "```"
+
+# Characters that may start or end markup; runs of anything else are
+# escaped and copied in one step
+_MARKUP = re.compile(r"[`*\[\]]")
+
+# Optional language name after an opening fence, e.g. ```python
+_INFO_STRING = re.compile(r"[\w+#.-]*\n")
+
+_SAFE_URL = re.compile(r"(?:https?:|mailto:|[^:]*(?:[/?#]|$))", re.IGNORECASE)
+
+
+def render_markdown(text: str) -> str:
+    """Render a reply to HTML in time linear in its length."""
+    if not text:
+        return text
+    out: List[str] = []
+    _render_blocks(text, out)
+    return "".join(out)
+
+
+class StreamingMarkdownRenderer:
+    """
+    Incremental render_markdown().
+
+    feed() returns HTML for the part of the text that can no longer change
+    (complete lines outside an unclosed code fence) and buffers the rest;
+    close() renders whatever is left.
+    """
+
+    def __init__(self):
+        self._lines: List[str] = []  # Complete lines held back by an open fence
+        self._partial: List[str] = []  # Chunks of the current, unfinished line
+        self._fence_open = False
+
+    def feed(self, chunk: str) -> str:
+        newline = chunk.rfind("\n")
+        if newline == -1:
+            self._partial.append(chunk)
+            return ""
+        self._partial.append(chunk[:newline + 1])
+        lines = "".join(self._partial)
+        self._partial = [chunk[newline + 1:]] if newline + 1 < len(chunk) else []
+
+        # Fences can't contain a newline, so counting per line matches the
+        # pairing render_markdown() does over the whole text
+        if lines.count(_FENCE) % 2:
+            self._fence_open = not self._fence_open
+        self._lines.append(lines)
+        if self._fence_open:
+            return ""
+        ready = "".join(self._lines)
+        self._lines = []
+        return render_markdown(ready)
+
+    def close(self) -> str:
+        """Render the buffered remainder (an unclosed fence is left as text)."""
+        rest = "".join(self._lines) + "".join(self._partial)
+        self._lines = []
+        self._partial = []
+        self._fence_open = False
+        return render_markdown(rest)
+
+
+def _render_blocks(text: str, out: List[str]):
+    # Pair fences left to right; text between a pair is a code block and an
+    # unpaired fence is ordinary text
+    pos = 0
+    while True:
+        start = text.find(_FENCE, pos)
+        end = text.find(_FENCE, start + 3) if start != -1 else -1
+        if end == -1:
+            _render_lines(text, pos, len(text), out)
+            return
+        _render_lines(text, pos, start, out)
+        code_start = start + 3
+        info = _INFO_STRING.match(text, code_start, end)
+        if info:
+            code_start = info.end()
+        out.append("<pre><code>")
+        out.append(escape(text[code_start:end], quote=False))
+        out.append("</code></pre>")
+        pos = end + 3
+
+
+def _render_lines(text: str, start: int, end: int, out: List[str]):
+    while start < end:
+        newline = text.find("\n", start, end)
+        line_end = end if newline == -1 else newline
+        _render_inline(text, start, line_end, out)
+        if newline == -1:
+            return
+        out.append("<br>")
+        start = newline + 1
+
+
+def _render_inline(text: str, pos: int, end: int, out: List[str]):
+    """Render text[pos:end], which contains no newline, appending to out."""
+    # Unmatched openers: (delimiter, index in out of its placeholder). A
+    # closer pops everything above its opener, which stays literal text.
+    stack: List[tuple] = []
+    open_count = {"**": 0, "*": 0, "[": 0}
+    # Set once a forward search fails, so it is never repeated
+    no_backtick = no_paren = False
+
+    search = _MARKUP.search
+    while pos < end:
+        match = search(text, pos, end)
+        if match is None:
+            out.append(escape(text[pos:end], quote=False))
+            return
+        if match.start() > pos:
+            out.append(escape(text[pos:match.start()], quote=False))
+        pos = match.start()
+        char = text[pos]
+
+        if char == "`":
+            close = -1 if no_backtick else text.find("`", pos + 1, end)
+            if close == -1:
+                no_backtick = True
+            if close > pos + 1:
+                out.append(f"<code>{escape(text[pos + 1:close], quote=False)}</code>")
+                pos = close + 1
+            else:
+                out.append("`")
+                pos += 1
+
+        elif char == "*":
+            delimiter = "**" if text.startswith("**", pos, end) else "*"
+            pos += len(delimiter)
+            if open_count[delimiter]:
+                index = _pop_opener(stack, open_count, delimiter)
+                tag = "b" if delimiter == "**" else "i"
+                out[index] = f"<{tag}>"
+                out.append(f"</{tag}>")
+            else:
+                stack.append((delimiter, len(out)))
+                open_count[delimiter] += 1
+                out.append(delimiter)
+
+        elif char == "[":
+            stack.append(("[", len(out)))
+            open_count["["] += 1
+            out.append("[")
+            pos += 1
+
+        else:  # "]"
+            url_end = -1
+            if open_count["["] and text.startswith("(", pos + 1, end) and not no_paren:
+                url_end = text.find(")", pos + 2, end)
+                no_paren = url_end == -1
+            if url_end > pos + 2:
+                index = _pop_opener(stack, open_count, "[")
+                url = text[pos + 2:url_end]
+                if _SAFE_URL.match(url):
+                    out[index] = f'<a href="{escape(url)}">'
+                    out.append("</a>")
+                else:
+                    out[index] = ""  # Keep the link text, drop the unsafe link
+                pos = url_end + 1
+            else:
+                out.append("]")
+                pos += 1
+
+
+def _pop_opener(stack: List[tuple], open_count: dict, delimiter: str) -> Optional[int]:
+    """Pop openers down to the nearest delimiter one; returns its out index."""
+    while True:
+        opened, index = stack.pop()
+        open_count[opened] -= 1
+        if opened == delimiter:
+            return index
@@ -0,0 +1,211 @@
+"""
+Request timing and Prometheus-style metrics.
+
+A SpanTimer collects how long each stage of one chat request took (input
+moderation, prompt build, model call, output moderation, formatting, history
+update). The engine returns those spans under a "timings" key and records
+them into process-wide histograms, which /metrics renders in the Prometheus
+text exposition format.
+
+Metrics are per process; with several workers, scrape each one.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Sequence
+
+# Histogram bucket upper bounds in seconds; spans range from microsecond
+# moderation checks to multi-second model calls
+DEFAULT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class SpanTimer:
+    """Collects named stage durations for one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: Dict[str, float] = {}  # name -> seconds
+
+    @contextmanager
+    def span(self, name: str):
+        """Time a block; repeated spans with the same name add up."""
+        span_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - span_start)
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def merge(self, other: "SpanTimer"):
+        """Add another timer's spans, e.g. from a call timed on another thread."""
+        for name, seconds in other.spans.items():
+            self.add(name, seconds)
+
+    def elapsed(self) -> float:
+        """Seconds since the timer was created."""
+        return time.perf_counter() - self.start
+
+    def as_dict(self) -> Dict[str, float]:
+        """Spans in milliseconds, e.g. {"input_moderation_ms": 0.012, ..., "total_ms": 812.4}."""
+        timings = {f"{name}_ms": round(seconds * 1000, 3) for name, seconds in self.spans.items()}
+        timings["total_ms"] = round(self.elapsed() * 1000, 3)
+        return timings
+
+
+class Histogram:
+    """Thread-safe histogram with one series per label value."""
+
+    def __init__(self, name: str, help_text: str, label: str = "",
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        # label value -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_value: str = ""):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, (counts, total, count) in sorted(self._series.items()):
+                labels = f'{self.label}="{label_value}",' if self.label else ""
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {count}')
+                suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {total}")
+                lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Counter:
+    """Thread-safe counter with one series per label value."""
+
+    def __init__(self, name: str, help_text: str, label: str = ""):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str = "", amount: float = 1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_value, value in sorted(self._values.items()):
+                labels = f'{{{self.label}="{label_value}"}}' if self.label else ""
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class Gauge:
+    """Thread-safe gauge with one series per label value."""
+
+    def __init__(self, name: str, help_text: str, label: str = ""):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, label_value: str = ""):
+        with self._lock:
+            self._values[label_value] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for label_value, value in sorted(self._values.items()):
+                labels = f'{{{self.label}="{label_value}"}}' if self.label else ""
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics rendered together for /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str, label: str = "",
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, label, buckets)
+            return self._metrics[name]
+
+    def counter(self, name: str, help_text: str, label: str = "") -> Counter:
+        """Get or create a counter."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text, label)
+            return self._metrics[name]
+
+    def gauge(self, name: str, help_text: str, label: str = "") -> Gauge:
+        """Get or create a gauge."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Gauge(name, help_text, label)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def observe_request(self, timer: SpanTimer, safety_action: str):
+        """Record one finished chat request."""
+        spans = self.histogram(
+            "chat_span_seconds", "Time spent in each chat pipeline stage.", label="span")
+        for name, seconds in timer.spans.items():
+            spans.observe(seconds, name)
+        self.histogram(
+            "chat_request_seconds", "End-to-end chat request latency."
+        ).observe(timer.elapsed())
+        self.counter(
+            "chat_requests_total", "Chat requests by final safety action.", label="safety_action"
+        ).inc(safety_action)
+
+
+# Singleton instance
+_metrics_instance = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get singleton metrics registry instance."""
+    global _metrics_instance
+    if _metrics_instance is None:
+        with _metrics_lock:
+            if _metrics_instance is None:
+                _metrics_instance = MetricsRegistry()
+    return _metrics_instance
@@ -2,58 +2,152 @@
 Model provider module for openai integration.
 """
 
+import asyncio
 import json
 import logging
+import threading
 import time
 import os
-from typing import Dict, List, Optional
-
-from openai import OpenAI, APIError
-from dotenv import load_dotenv
-
-load_dotenv()
+from typing import AsyncIterator, Dict, Iterator, List, Optional
 
 from .config import (
+    LOCAL_MODEL_ENDPOINT,
+    LOCAL_MODEL_NAME,
     MODEL_ENDPOINT,
+    MODEL_HEDGE_PROVIDER,
     MODEL_NAME,
+    MODEL_PROVIDER,
+    PROMPT_CACHE_KEY,
+    RESPONSE_CACHE_ENABLED,
     TIMEOUT_SECONDS,
     get_model_config,
 )
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+from .fake_model import AsyncFakeClient, FakeClient
+from .metrics import SpanTimer
+from .prompts import get_prompt_compiler
+from .response_cache import get_response_cache, make_cache_key
+from .router import AsyncHedgedRouter, HedgedRouter
+from .scheduler import PRIORITY_INTERACTIVE, RequestScheduler, Reservation, get_scheduler
+from .tokenizer import count_tokens
+from .transport import (
+    RetryPolicy,
+    create_async_http_client,
+    create_http_client,
+    get_circuit_breaker,
+    record_retry,
 )
 
 logger = logging.getLogger(__name__)
-logging.info("Logging is now configured!")
+
+
+def _api_error():
+    """
+    Return openai.APIError. The openai SDK takes ~0.6s to import, so it is
+    loaded on first use rather than when this module is imported.
+    """
+    from openai import APIError
+    return APIError
+
+
+def _estimate_request_tokens(api_params: Dict) -> int:
+    """Most tokens a request can use: its prompt plus max_tokens of completion."""
+    # System and profile prompts have their counts cached by the prompt compiler
+    message_tokens = get_prompt_compiler().message_tokens
+    prompt_tokens = sum(message_tokens(message) for message in api_params["messages"])
+    return prompt_tokens + (api_params.get("max_tokens") or 0)
+
+
+def _usage_total(usage) -> Optional[int]:
+    if usage is None:
+        return None
+    return usage.prompt_tokens + usage.completion_tokens
+
+
+def _streamed_tokens(api_params: Dict, usage, chunks: List[str]) -> int:
+    """Tokens a stream used: the reported usage, else the prompt plus the text streamed."""
+    if usage is not None:
+        return _usage_total(usage)
+    # Stopped before the usage chunk, or the server doesn't send one
+    prompt_tokens = _estimate_request_tokens(api_params) - (api_params.get("max_tokens") or 0)
+    return prompt_tokens + count_tokens("".join(chunks))
+
+
+def _usage_to_dict(usage) -> Optional[Dict]:
+    """Extract token counts, including prompt-cache hits, from completion usage."""
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+    }
 
 
 class ModelProvider:
     """Handles communication with openai API."""
     
+    # Backend settings, overridden by providers for other OpenAI-compatible APIs
+    endpoint = MODEL_ENDPOINT
+    # Environment variable that overrides endpoint when set, as in the SDK
+    base_url_env: Optional[str] = "OPENAI_BASE_URL"
+    default_model = MODEL_NAME
+    api_key_env = "OPENAI_API_KEY"
+    api_key_required = True
+    rate_limited = True  # Admit requests through the shared scheduler
+    
     def __init__(self):
-        """Initialize the model provider with retry logic."""
-        self.api_key = os.getenv("OPENAI_API_KEY")
+        """
+        Initialize the model provider with retry logic.
+        
+        Transient failures are retried per RetryPolicy, and calls fail fast
+        while the endpoint's circuit breaker is open (see transport.py).
+        Construction makes no network calls; use verify_connection() or
+        verify_connection_in_background() to check the API is reachable.
+        """
+        from dotenv import load_dotenv
+        load_dotenv()
+        
+        self.api_key = os.getenv(self.api_key_env)
         if not self.api_key:
-            raise RuntimeError(
-                "OPENAI_API_KEY environment variable not found. "
-                "Please set it in your environment or in a .env file."
-            )
+            if self.api_key_required:
+                raise RuntimeError(
+                    f"{self.api_key_env} environment variable not found. "
+                    "Please set it in your environment or in a .env file."
+                )
+            self.api_key = "unused"  # The SDK requires one; keyless servers ignore it
+        if self.base_url_env and os.getenv(self.base_url_env):
+            # Proxies and gateways configured for the SDK keep working
+            self.endpoint = os.getenv(self.base_url_env)
         
         # initialize OpenAI Client
-        self.client = OpenAI(api_key=self.api_key)
-        self.model_name = MODEL_NAME
+        self.client = self._create_client()
+        self.model_name = self.default_model
+        self.retry_policy = RetryPolicy()
+        self.breaker = get_circuit_breaker(self.endpoint)
+        self.scheduler = get_scheduler() if self.rate_limited else RequestScheduler(0, 0)
+        # Opt-in cache of deterministic completions, shared by all providers
+        self.response_cache = get_response_cache() if RESPONSE_CACHE_ENABLED else None
         
-        logger.info(f"Successfully configured ModelProvider for {MODEL_ENDPOINT} using model {self.model_name}")
-        self._verify_connection()
+        logger.info(f"Successfully configured {type(self).__name__} for {self.endpoint} using model {self.model_name}")
 
-    def _verify_connection(self):
+    def _create_client(self):
+        """Create the OpenAI client used for requests."""
+        from openai import OpenAI
+        # Retries are handled by _create_completion, not the SDK
+        return OpenAI(
+            api_key=self.api_key,
+            base_url=self.endpoint,
+            max_retries=0,
+            http_client=create_http_client(),
+        )
+
+    def verify_connection(self):
         """Verify openai is running and model is available."""
         try:
             self.client.models.retrieve(self.model_name)
             logger.info(f"Model '{self.model_name}' is accessible via OpenAI API.")
-        except APIError as e:
+        except _api_error() as e:
             if e.status_code == 404:
                 raise RuntimeError(f"Model '{self.model_name}' not found or inaccessible. Check model name.")
             if e.status_code == 401:
@@ -67,6 +161,10 @@ class ModelProvider:
         prompt: str,
         system_prompt: Optional[str] = None,
         conversation_history: Optional[List[Dict]] = None,
+        profile_prompt: Optional[str] = None,
+        timer: Optional[SpanTimer] = None,
+        user_id: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
         **kwargs
     ) -> Dict:
         """
@@ -76,74 +174,280 @@ class ModelProvider:
             prompt: User input prompt
             system_prompt: System prompt for behavior
             conversation_history: Previous conversation turns
+            profile_prompt: Per-user system message sent after system_prompt
+            timer: Receives prompt_build, queue_wait and model_call spans
+            user_id: Rate limiter fairness key
+            priority: Rate limiter priority (scheduler.PRIORITY_*)
             **kwargs: Additional parameters to override defaults
             
         Returns:
             Dict containing response and metadata
         """
         start_time = time.time()
+        timer = timer or SpanTimer()
+        with timer.span("prompt_build"):
+            api_params = self._build_api_params(
+                prompt, system_prompt, conversation_history, profile_prompt, **kwargs)
         
-        # Prepare the full prompt
-        full_prompt = self._build_prompt(prompt, system_prompt, conversation_history)
-        
-        # Get model configuration
-        config = get_model_config()
-        
-        # Override with any provided kwargs
-        if kwargs:
-            config["options"].update(kwargs)
-        
-        # Prepare request
-        api_params = {
-            "model": config["model"],
-            "messages": full_prompt,
-            "temperature": config["temperature"],
-            "top_p": config["top_p"],
-            "max_tokens": config["max_tokens"],
-            "seed": config["seed"],
-            "timeout": TIMEOUT_SECONDS,
-            **kwargs # Apply any additional overrides
-        }
+        cache_key = self._cache_key(api_params)
+        cached = self._get_cached(cache_key, start_time)
+        if cached:
+            return cached
         
         try:
             logger.debug(f"Sending request to OpenAI with parameters: {api_params}")
             
             # API Call
-            completion = self.client.chat.completions.create(**api_params)
+            with timer.span("queue_wait"):
+                reservation = self._reserve(api_params, user_id, priority)
+            with timer.span("model_call"):
+                completion = self._create_completion(api_params, reservation)
+            reservation.settle(_usage_total(completion.usage))
             
             response_text = completion.choices[0].message.content
             
             elapsed_ms = int((time.time() - start_time) * 1000)
             
-            return {
+            return self._store_cached(cache_key, {
                 "response": response_text,
                 "model": completion.model,
                 "created_at": str(completion.created),
                 "done": True,
                 "latency_ms": elapsed_ms,
                 "deterministic": api_params["temperature"] == 0,
-            }
+                "usage": _usage_to_dict(completion.usage),
+            })
+            
+        except _api_error() as e:
+            logger.error(f"OpenAI API Error: {e}")
+            raise RuntimeError(f"OpenAI API Error: {e}")
+        except Exception as e:
+            logger.error(f"Model generation failed: {e}")
+            raise RuntimeError(f"Failed to generate response: {e}")
+    
+    def generate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        profile_prompt: Optional[str] = None,
+        timer: Optional[SpanTimer] = None,
+        user_id: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Generate response from the model, yielding text as it arrives.
+        
+        Args:
+            prompt: User input prompt
+            system_prompt: System prompt for behavior
+            conversation_history: Previous conversation turns
+            profile_prompt: Per-user system message sent after system_prompt
+            timer: Receives prompt_build, queue_wait, time_to_first_token and
+                model_call spans; model_call includes time the consumer spends
+                between chunks
+            user_id: Rate limiter fairness key
+            priority: Rate limiter priority (scheduler.PRIORITY_*)
+            **kwargs: Additional parameters to override defaults
             
-        except APIError as e:
+        Yields:
+            Chunks of response text in order
+        """
+        start_time = time.time()
+        timer = timer or SpanTimer()
+        with timer.span("prompt_build"):
+            api_params = self._build_api_params(
+                prompt, system_prompt, conversation_history, profile_prompt, stream=True, **kwargs)
+            # The final chunk then reports usage, to settle the reservation with
+            api_params.setdefault("stream_options", {"include_usage": True})
+        
+        cache_key = self._cache_key(api_params)
+        cached = self._get_cached(cache_key, start_time)
+        if cached:
+            yield cached["response"]
+            return
+        
+        try:
+            logger.debug(f"Sending streaming request to OpenAI with parameters: {api_params}")
+            with timer.span("queue_wait"):
+                reservation = self._reserve(api_params, user_id, priority)
+            request_start = time.perf_counter()
+            stream = self._create_completion(api_params, reservation)
+        except _api_error() as e:
             logger.error(f"OpenAI API Error: {e}")
             raise RuntimeError(f"OpenAI API Error: {e}")
         except Exception as e:
             logger.error(f"Model generation failed: {e}")
             raise RuntimeError(f"Failed to generate response: {e}")
+        
+        chunks = []
+        usage = None
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not chunks:
+                        timer.add("time_to_first_token", time.perf_counter() - request_start)
+                    chunks.append(delta)
+                    yield delta
+        except _api_error() as e:
+            logger.error(f"OpenAI API Error during streaming: {e}")
+            raise RuntimeError(f"OpenAI API Error: {e}")
+        except Exception as e:
+            logger.error(f"Model streaming failed: {e}")
+            raise RuntimeError(f"Failed to stream response: {e}")
+        finally:
+            timer.add("model_call", time.perf_counter() - request_start)
+            reservation.settle(_streamed_tokens(api_params, usage, chunks))
+            # Release the HTTP connection if the consumer stopped early
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+        
+        # Only reached when the consumer read the whole stream
+        self._store_cached(cache_key, {
+            "response": "".join(chunks),
+            "model": self.model_name,
+            "done": True,
+            "latency_ms": int((time.time() - start_time) * 1000),
+            "deterministic": api_params["temperature"] == 0,
+            "usage": _usage_to_dict(usage),
+        })
+    
+    def _reserve(self, api_params: Dict, user_id: Optional[str], priority: int) -> Reservation:
+        """Wait for the rate limiter to admit a request."""
+        return self.scheduler.acquire(
+            user_id or "", _estimate_request_tokens(api_params), priority)
+    
+    def _create_completion(self, api_params: Dict, reservation: Reservation):
+        """
+        Call chat.completions.create, retrying transient failures.
+        
+        api_params["timeout"] is the deadline for all attempts together;
+        each attempt is limited to the per-attempt timeout or the time left,
+        whichever is shorter. Each retry is admitted by the rate limiter
+        again. Streams are only retried until the response starts, never
+        mid-stream.
+        """
+        params = dict(api_params)
+        deadline = time.monotonic() + params.pop("timeout", TIMEOUT_SECONDS)
+        retry = 0
+        while True:
+            try:
+                self.breaker.before_call()
+                result = self.client.chat.completions.create(
+                    **params, timeout=self.retry_policy.attempt_timeout_for(deadline))
+            except Exception as e:
+                reservation.release()
+                self.breaker.record_failure(e)
+                retry += 1
+                delay = self.retry_policy.next_delay(retry, e, deadline)
+                if delay is None:
+                    raise
+                record_retry(e, delay)
+                time.sleep(delay)
+                reservation.renew()
+            else:
+                self.breaker.record_success()
+                return result
+    
+    def _cache_key(self, api_params: Dict) -> Optional[str]:
+        """Cache key for a request, or None if it must not be cached."""
+        if self.response_cache is None or api_params.get("temperature") != 0:
+            return None
+        return make_cache_key(api_params)
+    
+    def _get_cached(self, cache_key: Optional[str], start_time: float) -> Optional[Dict]:
+        """Look up a cached response dict, marked with cached=True."""
+        if cache_key is None:
+            return None
+        cached = self.response_cache.get(cache_key)
+        if cached is None:
+            return None
+        cached["cached"] = True
+        cached["cache_key"] = cache_key
+        cached["latency_ms"] = int((time.time() - start_time) * 1000)
+        return cached
+    
+    def _store_cached(self, cache_key: Optional[str], result: Dict) -> Dict:
+        """Cache a fresh response dict and return it, marked with cached=False."""
+        result["cached"] = False
+        if cache_key is not None and result.get("response"):
+            self.response_cache.set(cache_key, {**result, "moderated": False})
+            result["cache_key"] = cache_key
+        return result
+    
+    def mark_response_moderated(self, cache_key: Optional[str], rules_version: str):
+        """Record that a cached response passed output moderation under rules_version."""
+        if cache_key is not None and self.response_cache is not None:
+            self.response_cache.mark_moderated(cache_key, rules_version)
+    
+    def _build_api_params(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        profile_prompt: Optional[str] = None,
+        **kwargs
+    ) -> Dict:
+        """
+        Build chat completion request parameters.
+        
+        Args:
+            prompt: User input prompt
+            system_prompt: System prompt for behavior
+            conversation_history: Previous conversation turns
+            profile_prompt: Per-user system message sent after system_prompt
+            **kwargs: Additional parameters to override defaults
+            
+        Returns:
+            Keyword arguments for client.chat.completions.create
+        """
+        # Prepare the full prompt
+        full_prompt = self._build_prompt(
+            prompt, system_prompt, conversation_history, profile_prompt)
+        
+        # Get model configuration
+        config = get_model_config()
+        
+        api_params = {
+            "model": self.model_name,
+            "messages": full_prompt,
+            "temperature": config["temperature"],
+            "top_p": config["top_p"],
+            "max_tokens": config["max_tokens"],
+            "seed": config["seed"],
+            "timeout": TIMEOUT_SECONDS,
+        }
+        if PROMPT_CACHE_KEY:
+            api_params["prompt_cache_key"] = PROMPT_CACHE_KEY
+        api_params.update(kwargs)  # Apply any additional overrides
+        return api_params
     
     def _build_prompt(
         self,
         user_prompt: str,
         system_prompt: Optional[str] = None,
         conversation_history: Optional[List[Dict]] = None,
+        profile_prompt: Optional[str] = None,
     ) -> List[Dict]:
         """
         Build full prompt with system prompt and conversation history.
         
+        Messages are ordered from most to least stable (static system prompt,
+        per-user profile, sliding history, current input) so the longest
+        possible prefix is shared between requests for provider-side caching.
+        
         Args:
             user_prompt: Current user input
-            system_prompt: System instructions
+            system_prompt: Static system instructions, identical for all users
             conversation_history: List of previous turns
+            profile_prompt: Per-user system instructions
             
         Returns:
             List of messages (Dicts)
@@ -154,6 +458,10 @@ class ModelProvider:
         if system_prompt:
             parts.append({"role": "system", "content": system_prompt})
         
+        # Add per-user profile after the shared prefix
+        if profile_prompt:
+            parts.append({"role": "system", "content": profile_prompt})
+        
         # Add conversation history if provided
         if conversation_history:
             parts.extend(conversation_history)
@@ -177,17 +485,344 @@ class ModelProvider:
             return False
 
 
+class AsyncModelProvider(ModelProvider):
+    """Handles non-blocking communication with openai API for asyncio servers."""
+
+    def _create_client(self):
+        """Create the asyncio OpenAI client used for requests."""
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.endpoint,
+            max_retries=0,
+            http_client=create_async_http_client(),
+        )
+
+    async def verify_connection(self):
+        """Verify openai is running and model is available."""
+        try:
+            await self.client.models.retrieve(self.model_name)
+            logger.info(f"Model '{self.model_name}' is accessible via OpenAI API.")
+        except _api_error() as e:
+            if e.status_code == 404:
+                raise RuntimeError(f"Model '{self.model_name}' not found or inaccessible. Check model name.")
+            if e.status_code == 401:
+                raise RuntimeError("OpenAI API Key is invalid or expired (401 error).")
+            raise RuntimeError(f"Failed to verify OpenAI connection: {e}")
+        except Exception as e:
+            raise RuntimeError(f"Failed to verify OpenAI connection: {e}")
+
+    async def _reserve(
+        self, api_params: Dict, user_id: Optional[str], priority: int
+    ) -> Reservation:
+        """Wait for the rate limiter to admit a request without blocking the loop."""
+        return await self.scheduler.acquire_async(
+            user_id or "", _estimate_request_tokens(api_params), priority)
+
+    async def _create_completion(self, api_params: Dict, reservation: Reservation):
+        """Call chat.completions.create, retrying transient failures without blocking the loop."""
+        params = dict(api_params)
+        deadline = time.monotonic() + params.pop("timeout", TIMEOUT_SECONDS)
+        retry = 0
+        while True:
+            try:
+                self.breaker.before_call()
+                result = await self.client.chat.completions.create(
+                    **params, timeout=self.retry_policy.attempt_timeout_for(deadline))
+            except asyncio.CancelledError:
+                reservation.release()
+                raise
+            except Exception as e:
+                reservation.release()
+                self.breaker.record_failure(e)
+                retry += 1
+                delay = self.retry_policy.next_delay(retry, e, deadline)
+                if delay is None:
+                    raise
+                record_retry(e, delay)
+                await asyncio.sleep(delay)
+                await reservation.renew_async()
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def generate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        profile_prompt: Optional[str] = None,
+        timer: Optional[SpanTimer] = None,
+        user_id: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        **kwargs
+    ) -> Dict:
+        """
+        Generate response from the model without blocking the event loop.
+        
+        Args:
+            prompt: User input prompt
+            system_prompt: System prompt for behavior
+            conversation_history: Previous conversation turns
+            profile_prompt: Per-user system message sent after system_prompt
+            timer: Receives prompt_build, queue_wait and model_call spans
+            user_id: Rate limiter fairness key
+            priority: Rate limiter priority (scheduler.PRIORITY_*)
+            **kwargs: Additional parameters to override defaults
+            
+        Returns:
+            Dict containing response and metadata
+        """
+        start_time = time.time()
+        timer = timer or SpanTimer()
+        with timer.span("prompt_build"):
+            api_params = self._build_api_params(
+                prompt, system_prompt, conversation_history, profile_prompt, **kwargs)
+        
+        cache_key = self._cache_key(api_params)
+        cached = self._get_cached(cache_key, start_time)
+        if cached:
+            return cached
+        
+        try:
+            logger.debug(f"Sending async request to OpenAI with parameters: {api_params}")
+            with timer.span("queue_wait"):
+                reservation = await self._reserve(api_params, user_id, priority)
+            with timer.span("model_call"):
+                completion = await self._create_completion(api_params, reservation)
+            reservation.settle(_usage_total(completion.usage))
+            response_text = completion.choices[0].message.content
+            elapsed_ms = int((time.time() - start_time) * 1000)
+            
+            return self._store_cached(cache_key, {
+                "response": response_text,
+                "model": completion.model,
+                "created_at": str(completion.created),
+                "done": True,
+                "latency_ms": elapsed_ms,
+                "deterministic": api_params["temperature"] == 0,
+                "usage": _usage_to_dict(completion.usage),
+            })
+            
+        except _api_error() as e:
+            logger.error(f"OpenAI API Error: {e}")
+            raise RuntimeError(f"OpenAI API Error: {e}")
+        except Exception as e:
+            logger.error(f"Model generation failed: {e}")
+            raise RuntimeError(f"Failed to generate response: {e}")
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        profile_prompt: Optional[str] = None,
+        timer: Optional[SpanTimer] = None,
+        user_id: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Generate response from the model, yielding text as it arrives.
+        
+        Args:
+            prompt: User input prompt
+            system_prompt: System prompt for behavior
+            conversation_history: Previous conversation turns
+            profile_prompt: Per-user system message sent after system_prompt
+            timer: Receives prompt_build, queue_wait, time_to_first_token and
+                model_call spans; model_call includes time the consumer spends
+                between chunks
+            user_id: Rate limiter fairness key
+            priority: Rate limiter priority (scheduler.PRIORITY_*)
+            **kwargs: Additional parameters to override defaults
+            
+        Yields:
+            Chunks of response text in order
+        """
+        start_time = time.time()
+        timer = timer or SpanTimer()
+        with timer.span("prompt_build"):
+            api_params = self._build_api_params(
+                prompt, system_prompt, conversation_history, profile_prompt, stream=True, **kwargs)
+            # The final chunk then reports usage, to settle the reservation with
+            api_params.setdefault("stream_options", {"include_usage": True})
+        
+        cache_key = self._cache_key(api_params)
+        cached = self._get_cached(cache_key, start_time)
+        if cached:
+            yield cached["response"]
+            return
+        
+        try:
+            with timer.span("queue_wait"):
+                reservation = await self._reserve(api_params, user_id, priority)
+            request_start = time.perf_counter()
+            stream = await self._create_completion(api_params, reservation)
+        except _api_error() as e:
+            logger.error(f"OpenAI API Error: {e}")
+            raise RuntimeError(f"OpenAI API Error: {e}")
+        except Exception as e:
+            logger.error(f"Model generation failed: {e}")
+            raise RuntimeError(f"Failed to generate response: {e}")
+        
+        chunks = []
+        usage = None
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not chunks:
+                        timer.add("time_to_first_token", time.perf_counter() - request_start)
+                    chunks.append(delta)
+                    yield delta
+        except _api_error() as e:
+            logger.error(f"OpenAI API Error during streaming: {e}")
+            raise RuntimeError(f"OpenAI API Error: {e}")
+        except Exception as e:
+            logger.error(f"Model streaming failed: {e}")
+            raise RuntimeError(f"Failed to stream response: {e}")
+        finally:
+            timer.add("model_call", time.perf_counter() - request_start)
+            reservation.settle(_streamed_tokens(api_params, usage, chunks))
+            close = getattr(stream, "close", None)
+            if close:
+                await close()
+        
+        self._store_cached(cache_key, {
+            "response": "".join(chunks),
+            "model": self.model_name,
+            "done": True,
+            "latency_ms": int((time.time() - start_time) * 1000),
+            "deterministic": api_params["temperature"] == 0,
+            "usage": _usage_to_dict(usage),
+        })
+
+    async def health_check(self) -> bool:
+        """
+        Check if model provider is healthy.
+        
+        Returns:
+            True if healthy, False otherwise
+        """
+        try:
+            await self.client.models.retrieve(self.model_name)
+            return True
+        except Exception:
+            return False
+
+
+class _LocalBackend:
+    """Settings for a self-hosted OpenAI-compatible server."""
+
+    endpoint = LOCAL_MODEL_ENDPOINT
+    default_model = LOCAL_MODEL_NAME
+    api_key_env = "LOCAL_MODEL_API_KEY"
+    base_url_env = None  # LOCAL_MODEL_ENDPOINT only; OPENAI_BASE_URL is for the OpenAI backend
+    api_key_required = False
+    rate_limited = False  # Not subject to the OpenAI account quota
+
+
+class LocalModelProvider(_LocalBackend, ModelProvider):
+    """Handles communication with an OpenAI-compatible local server."""
+
+
+class AsyncLocalModelProvider(_LocalBackend, AsyncModelProvider):
+    """Handles non-blocking communication with an OpenAI-compatible local server."""
+
+
+class _FakeBackend:
+    """Settings for the in-process fake backend."""
+
+    endpoint = "fake://local"
+    base_url_env = None
+    default_model = "fake"
+    api_key_required = False
+
+
+class FakeModelProvider(_FakeBackend, ModelProvider):
+    """Deterministic offline backend; still goes through the scheduler, cache and retries."""
+
+    def _create_client(self):
+        return FakeClient()
+
+
+class AsyncFakeModelProvider(_FakeBackend, AsyncModelProvider):
+    """Deterministic offline backend for asyncio servers."""
+
+    def _create_client(self):
+        return AsyncFakeClient()
+
+
+# Registered backends by name: (sync provider, asyncio provider)
+MODEL_PROVIDERS = {
+    "openai": (ModelProvider, AsyncModelProvider),
+    "local": (LocalModelProvider, AsyncLocalModelProvider),
+    "fake": (FakeModelProvider, AsyncFakeModelProvider),
+}
+
+
+def create_provider(name: str = MODEL_PROVIDER, asynchronous: bool = False) -> ModelProvider:
+    """Instantiate a registered backend."""
+    if name not in MODEL_PROVIDERS:
+        raise ValueError(f"Unknown model provider: {name}. Choose from {sorted(MODEL_PROVIDERS)}")
+    sync_class, async_class = MODEL_PROVIDERS[name]
+    return async_class() if asynchronous else sync_class()
+
+
+def _create_configured_provider(asynchronous: bool):
+    # MODEL_PROVIDER, wrapped in a hedging router if a second backend is configured
+    primary = create_provider(MODEL_PROVIDER, asynchronous)
+    if not MODEL_HEDGE_PROVIDER:
+        return primary
+    secondary = create_provider(MODEL_HEDGE_PROVIDER, asynchronous)
+    logger.info(f"Hedging {MODEL_PROVIDER} requests to {MODEL_HEDGE_PROVIDER}")
+    router_class = AsyncHedgedRouter if asynchronous else HedgedRouter
+    return router_class(primary, secondary)
+
+
 # Singleton instance
 _provider_instance = None
+_provider_lock = threading.Lock()
 
 
 def get_provider() -> ModelProvider:
-    """Get or create singleton model provider instance."""
+    """Get or create singleton model provider instance (thread-safe)."""
     global _provider_instance
     if _provider_instance is None:
-        _provider_instance = ModelProvider()
+        with _provider_lock:
+            if _provider_instance is None:
+                _provider_instance = _create_configured_provider(asynchronous=False)
     return _provider_instance
 
-logging.info("Creating ModelProvider instance")
-provider = get_provider()
-logging.info("ModelProvider instance created")
\ No newline at end of file
+_async_provider_instance = None
+
+
+def get_async_provider() -> AsyncModelProvider:
+    """Get or create singleton async model provider instance (thread-safe)."""
+    global _async_provider_instance
+    if _async_provider_instance is None:
+        with _provider_lock:
+            if _async_provider_instance is None:
+                _async_provider_instance = _create_configured_provider(asynchronous=True)
+    return _async_provider_instance
+
+def verify_connection_in_background() -> threading.Thread:
+    """
+    Create the provider and verify the API off the startup path.
+
+    Failures are logged rather than raised; requests will surface them too.
+    """
+    def _verify():
+        try:
+            get_provider().verify_connection()
+        except Exception as e:
+            logger.warning(f"Model provider verification failed: {e}")
+
+    thread = threading.Thread(target=_verify, name="verify-model-provider", daemon=True)
+    thread.start()
+    return thread
\ No newline at end of file
@@ -1,15 +1,37 @@
 """
 Content moderation module for safety enforcement.
 Students must complete TODO sections according to POLICY.md.
+
+Keyword lists, patterns, confidences, thresholds and fallback replies live
+in MODERATION_RULES_FILE. The file is compiled into an immutable RuleSet,
+and a background thread recompiles it whenever it changes and swaps the new
+snapshot in with a single reference assignment. Each moderation call reads
+the snapshot once and uses it throughout, so a call in flight during a
+reload sees one consistent rule set, and readers never take a lock. A file
+that fails to load is logged and the previous rules stay in force.
 """
 
+import hashlib
+import json
 import logging
+import os
 import re
+import time
+import threading
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, List, Optional
-
-from .config import SAFETY_MODE
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from .config import (
+    CONTEXT_WINDOW_SIZE,
+    MODERATION_RULES_FILE,
+    MODERATION_RULES_RELOAD_SECONDS,
+    SAFETY_MODE,
+)
+from .metrics import get_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -30,131 +52,313 @@ class ModerationResult:
     confidence: float  # Confidence level (0-1)
     # Response to use if action != ALLOW
     fallback_response: Optional[str] = None
+    rules_version: Optional[str] = None  # RuleSet.version that produced this result
 
 
-class Moderator:
-    """Handles content moderation according to safety policy."""
+@dataclass(frozen=True)
+class RuleHit:
+    """A single keyword or pattern rule that matched a text."""
+    category: str  # Rule category, e.g. "racial_bias" or "bias"
+    kind: str  # "keyword" or "pattern"
+    tag: str  # Policy tag reported in ModerationResult.tags
 
-    def __init__(self):
-        """Initialize the moderator with safety rules."""
-        self.safety_mode = SAFETY_MODE
-        self._initialize_rules()
-
-    def _initialize_rules(self):
-        """Initialize moderation rules based on POLICY.md."""
-
-        # Define racial bias / racism detection keywords
-        self.racial_bias_keywords = [
-            "chink", "ah tiong", "bangla", "keling", "malay pig", "go back china",
-            "dirty indian", "smelly foreigner", "yellow monkey", "blackie",
-            "inferior race", "your race is", "better race than",
-            "hate chinese", "hate malay", "hate indian"
-        ]
-
-        # Racial bias regex patterns
-        self.racial_bias_patterns = [
-            r"\b(chinese|malay|indian|foreigner|expat)\s+(are|is)\s+(lazy|dirty|stupid|smelly|inferior)\b",
-            r"\b(go back to|send them back to)\s+(china|india|bangladesh|malaysia)\b",
-            r"\b(i hate|we hate)\s+(chinese|malays|indians|foreigners)\b",
-            r"\b(too many|flooded with)\s+(foreigners|prc|workers)\b"
-        ]
-
-        # Define general bias keywords (other than racial)
-        self.bias_keywords = [
-            "women are weak", "men are better", "useless women", "toxic men",
-            "old people are useless", "youngsters are stupid",
-            "muslims are", "christians are", "hindus are", "buddhists are",
-            "filipinos are lazy", "thais are stupid", "japanese are weird"
-        ]
-
-        # Bias regex patterns
-        self.bias_patterns = [
-            r"\b(all|most)\s+(women|men)\s+(are|are so)\s+(weak|dumb|emotional|useless)\b",
-            r"\b(old|young)\s+(people|folks)\s+(are|are so)\s+(stupid|slow|useless)\b",
-            r"\b(all|most)\s+(muslims|christians|buddhists|hindus)\s+(are|are so)\b",
-            r"\b(i hate|we hate)\s+(women|men|old people|religion)\b"
-        ]
-
-        # Confidence thresholds
-        self.confidence_thresholds = {
-            "strict": {
-                "racial_bias": 0.3,
-                "bias": 0.4,
-            },
-            "balanced": {
-                "racial_bias": 0.6,
-                "bias": 0.7,
-            },
-            "permissive": {
-                "racial_bias": 0.9,
-                "bias": 0.95,
-            }
-        }
 
-        # Fallback response templates
-        self.fallback_templates = {
-            "racial_bias": """
-I need to pause here 🚫. The message contains racially biased or discriminatory language.  
-This chatbot is designed to support inclusive and respectful learning of Mandarin, so racism or derogatory terms won’t be part of our conversations.  
+class RuleMatcher:
+    """
+    Compiled keyword and regex rules, scanned once per text.
 
-👉 Let’s keep the practice positive and constructive.  
-Would you like me to suggest respectful vocabulary for describing people of different backgrounds instead?
-            """,
+    Each text is lowercased once and checked against every category in one
+    call. scan() memoises results, so the input and output moderation passes
+    over the same user prompt, and context checks over history, reuse the
+    first scan. Texts seen only once, such as streamed output windows or a
+    corpus, go through scan_uncached() so they don't evict those entries.
+    """
 
-            "bias": """
-I noticed your message may include biased or discriminatory language about gender, religion, or age.  
-This chatbot’s purpose is to **help everyone learn Chinese respectfully**, without reinforcing stereotypes or unfair judgments.  
+    def __init__(
+        self,
+        keywords: Dict[str, List[str]],
+        patterns: Dict[str, List[str]],
+        cache_size: int = 1024,
+    ):
+        """
+        Args:
+            keywords: Category -> substrings to look for in lowercased text
+            patterns: Category -> regex patterns searched in lowercased text
+            cache_size: Number of recent texts whose hits are memoised
+        """
+        # Hits are reported per category as keywords first, then patterns,
+        # each in list order
+        self._rules = []
+        for category in dict.fromkeys([*keywords, *patterns]):
+            for keyword in keywords.get(category, []):
+                hit = RuleHit(category, "keyword", f"{category}_keyword:{keyword}")
+                self._rules.append((hit, lambda text, keyword=keyword: keyword in text))
+            for pattern in patterns.get(category, []):
+                hit = RuleHit(category, "pattern", f"{category}_pattern:{pattern}")
+                self._rules.append((hit, re.compile(pattern).search))
+        self.scan = lru_cache(maxsize=cache_size)(self.scan_uncached)
+
+    def scan_uncached(self, text: str) -> Tuple[RuleHit, ...]:
+        """Return every rule that matches text, without memoising the result."""
+        text_lower = text.lower()
+        return tuple(hit for hit, matches in self._rules if matches(text_lower))
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    """One compiled, read-only version of the moderation rules."""
+    version: str  # Declared version plus a digest of the file contents
+    matcher: RuleMatcher
+    hit_confidence: Mapping[str, Mapping[str, float]]  # Category -> kind -> confidence
+    confidence_thresholds: Mapping[str, Mapping[str, float]]  # Mode -> category -> threshold
+    fallback_templates: Mapping[str, str]
+    # Rolling window for streamed output checks: a keyword split across
+    # chunks is always fully contained in the last window of text
+    output_window_size: int
+
+    def category_confidence(
+        self, hits: Tuple[RuleHit, ...], category: str
+    ) -> Tuple[float, List[str]]:
+        """Highest hit confidence in a category and the tags of its hits."""
+        confidence = 0.0
+        detected_tags = []
+        for hit in hits:
+            if hit.category == category:
+                confidence = max(confidence, self.hit_confidence[category][hit.kind])
+                detected_tags.append(hit.tag)
+        return confidence, detected_tags
+
+
+_CATEGORIES = ("racial_bias", "bias")
+_TEMPLATES = ("racial_bias", "bias", "disclaimer")
+
+
+def load_rules(file_path: str) -> RuleSet:
+    """
+    Read and compile a moderation rules file.
+
+    Args:
+        file_path: JSON file with "version", "keywords", "patterns",
+            "hit_confidence", "confidence_thresholds" and "fallback_templates"
+
+    Returns:
+        Compiled rule set
+
+    Raises:
+        OSError: If the file can't be read
+        ValueError: If it is not valid JSON or a rule is missing or invalid
+    """
+    with open(file_path, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw)
+    try:
+        keywords = {c: [k.lower() for k in data["keywords"][c]] for c in _CATEGORIES}
+        patterns = {c: list(data["patterns"][c]) for c in _CATEGORIES}
+        for category in _CATEGORIES:
+            # An empty keyword is a substring of every text
+            if any(not keyword.strip() for keyword in keywords[category]):
+                raise ValueError(f"empty {category} keyword")
+            if not all(isinstance(pattern, str) for pattern in patterns[category]):
+                raise ValueError(f"{category} patterns must be strings")
+        hit_confidence = {
+            c: MappingProxyType({kind: float(data["hit_confidence"][c][kind])
+                                 for kind in ("keyword", "pattern")})
+            for c in _CATEGORIES
+        }
+        thresholds = {
+            mode: MappingProxyType({c: float(values[c]) for c in _CATEGORIES})
+            for mode, values in data["confidence_thresholds"].items()
+        }
+        templates = {name: str(data["fallback_templates"][name]) for name in _TEMPLATES}
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid moderation rules in {file_path}: {e!r}") from e
+    if SAFETY_MODE not in thresholds:
+        raise ValueError(f"Moderation rules in {file_path} have no thresholds for {SAFETY_MODE}")
+    try:
+        # Compile every keyword list and pattern once. Keywords use substring
+        # search, which beats a merged alternation regex in CPython's re.
+        matcher = RuleMatcher(keywords=keywords, patterns=patterns)
+    except re.error as e:
+        raise ValueError(f"Invalid moderation pattern in {file_path}: {e}") from e
+
+    all_keywords = [keyword for category in _CATEGORIES for keyword in keywords[category]]
+    return RuleSet(
+        version=f"{data.get('version', 0)}:{hashlib.sha256(raw).hexdigest()[:12]}",
+        matcher=matcher,
+        hit_confidence=MappingProxyType(hit_confidence),
+        confidence_thresholds=MappingProxyType(thresholds),
+        fallback_templates=MappingProxyType(templates),
+        output_window_size=max((len(keyword) for keyword in all_keywords), default=1),
+    )
+
+
+class ViolationTally:
+    """
+    Running count of racial bias keyword hits in a session's recent messages.
+
+    Each message is scanned once, when it is added; its count is kept until
+    it falls out of the window, so the escalation check costs O(1) per turn
+    however large window_size is. Not thread-safe: the chat engine updates it
+    under its session lock.
+    """
+
+    def __init__(self, moderator: "Moderator", window_size: int = CONTEXT_WINDOW_SIZE):
+        """
+        Args:
+            moderator: Moderator whose rules count violations
+            window_size: Most recent messages (of any role) counted
+        """
+        self.moderator = moderator
+        self.window_size = window_size
+        self.total = 0
+        self._counts = deque()  # Per-message counts, oldest first
+
+    def add(self, *messages: Dict):
+        """Count messages entering the window and drop those leaving it."""
+        for message in messages:
+            count = self.moderator.count_violations(message)
+            self._counts.append(count)
+            self.total += count
+        while len(self._counts) > self.window_size:
+            self.total -= self._counts.popleft()
+
+    def clear(self):
+        self._counts.clear()
+        self.total = 0
 
-👉 Let’s shift focus to language practice!  
-For example, instead of stereotypes, we can learn neutral and polite phrases for describing people. Want to try?
-            """,
 
-            "disclaimer": """Welcome to your Chinese Language Practice Partner! 🌟
+class Moderator:
+    """Handles content moderation according to safety policy."""
 
-NOTE:
-- This AI helps you practice and improve Mandarin.  
-- It is not a certified teacher.  
-- Conversations are for learning purposes only and are not monitored by a human.  
-- Do not share personal information.
+    def __init__(self, rules_file: str = MODERATION_RULES_FILE):
+        """
+        Initialize the moderator with safety rules.
 
-What I Offer:
-- Conversational practice with Chinese characters, Hanyu Pinyin, and English meaning  
-- Vocabulary and grammar support  
-- Sentence corrections and cultural tips  
+        Args:
+            rules_file: Moderation rules to load now and reload on change
 
-Focus on improving your Chinese, what would you like to practice today?""",
-        }
+        Raises:
+            OSError, ValueError: If the rules file can't be loaded
+        """
+        self.safety_mode = SAFETY_MODE
+        self.rules_file = rules_file
+        self._rules_stamp = _file_stamp(rules_file)
+        # Replaced, never mutated; read it once per call for a consistent view
+        self.rules: RuleSet = load_rules(rules_file)
+        self._reload_lock = threading.Lock()  # Serialises reloads, not readers
+        self._watcher: Optional[threading.Thread] = None
+        logger.info(f"Loaded moderation rules {self.rules.version} from {rules_file}")
+
+    @property
+    def rules_version(self) -> str:
+        return self.rules.version
+
+    @property
+    def output_window_size(self) -> int:
+        return self.rules.output_window_size
+
+    @property
+    def confidence_thresholds(self) -> Mapping[str, Mapping[str, float]]:
+        return self.rules.confidence_thresholds
+
+    def reload_rules(self, force: bool = False) -> bool:
+        """
+        Recompile the rules file if it changed and swap it in.
+
+        Args:
+            force: Reload even if the file looks unchanged
+
+        Returns:
+            True if a new rule set was swapped in
+        """
+        with self._reload_lock:
+            stamp = _file_stamp(self.rules_file)
+            if stamp == self._rules_stamp and not force:
+                return False
+            # Remember the failed version too, so a broken file is reported once
+            self._rules_stamp = stamp
+            try:
+                rules = load_rules(self.rules_file)
+            except (OSError, ValueError) as e:
+                logger.error(f"Keeping moderation rules {self.rules.version}: {e}")
+                _record_reload("error")
+                return False
+            if rules.version == self.rules.version:
+                return False
+            previous, self.rules = self.rules.version, rules
+        _record_reload("ok")
+        logger.info(f"Moderation rules updated from {previous} to {rules.version}")
+        return True
+
+    def watch_rules(self, interval: float = MODERATION_RULES_RELOAD_SECONDS):
+        """Check the rules file for changes every interval seconds in the background."""
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_rules()
+                except Exception as e:
+                    logger.error(f"Moderation rules reload failed: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="moderation-rules", daemon=True)
+        self._watcher.start()
 
     def moderate(
         self,
         user_prompt: str,
         model_response: Optional[str] = None,
         context: Optional[List[Dict]] = None,
+        tally: Optional[ViolationTally] = None,
     ) -> ModerationResult:
-        """Perform moderation on user input and/or model output."""
+        """
+        Perform moderation on user input and/or model output.
+
+        Escalation across turns is judged from tally when given (no rescan),
+        otherwise by scanning context.
+        """
+        rules = self.rules
+        result = self._moderate(rules, user_prompt, model_response, context, tally)
+        result.rules_version = rules.version
+        return result
+
+    def _moderate(
+        self,
+        rules: RuleSet,
+        user_prompt: str,
+        model_response: Optional[str],
+        context: Optional[List[Dict]],
+        tally: Optional[ViolationTally],
+    ) -> ModerationResult:
+        hits = rules.matcher.scan(user_prompt)
 
         # Step 1: Check for racial bias
-        racial_bias_check = self._check_racial_bias(user_prompt)
+        racial_bias_check = self._check_racial_bias(rules, user_prompt, hits)
         if racial_bias_check.action != ModerationAction.ALLOW:
             logger.warning(f"Racial bias detected: {racial_bias_check.reason}")
             return racial_bias_check
 
         # Step 2: Check for general bias
-        bias_check = self._check_bias(user_prompt)
+        bias_check = self._check_bias(rules, user_prompt, hits)
         if bias_check.action != ModerationAction.ALLOW:
             logger.warning(f"Bias detected: {bias_check.reason}")
             return bias_check
 
         # If model response provided, check it
         if model_response:
-            output_check = self._check_model_output(model_response)
+            output_check = self._check_model_output(rules, model_response)
             if output_check.action != ModerationAction.ALLOW:
                 logger.warning(f"Output violation: {output_check.reason}")
                 return output_check
 
         # Check context for concerning patterns
-        if context:
-            context_check = self._check_context_patterns(context)
+        if tally is not None or context:
+            if tally is not None:
+                context_check = self._check_violation_count(rules, tally.total)
+            else:
+                context_check = self._check_context_patterns(rules, context)
             if context_check.action != ModerationAction.ALLOW:
                 logger.info(f"Context concern: {context_check.reason}")
                 return context_check
@@ -167,25 +371,38 @@ Focus on improving your Chinese, what would you like to practice today?""",
             confidence=1.0,
         )
 
-    def _check_racial_bias(self, text: str) -> ModerationResult:
+    def moderate_output(
+        self, model_response: str, rules: Optional[RuleSet] = None
+    ) -> ModerationResult:
+        """
+        Check model output only, e.g. a rolling window of a streamed response.
+
+        Use a window of at least rules.output_window_size - 1 previously
+        checked characters plus the new text so no keyword is missed at a
+        chunk boundary.
+
+        Args:
+            model_response: Text to check
+            rules: Rule snapshot to check against (defaults to the current
+                rules); pass the same one for every window of a stream
+        """
+        rules = rules or self.rules
+        # Each window is scanned once; memoising it would only evict prompts
+        output_check = self._check_model_output(rules, model_response, cached=False)
+        output_check.rules_version = rules.version
+        if output_check.action != ModerationAction.ALLOW:
+            logger.warning(f"Output violation: {output_check.reason}")
+        return output_check
+
+    def _check_racial_bias(
+        self, rules: RuleSet, text: str, hits: Optional[Tuple[RuleHit, ...]] = None
+    ) -> ModerationResult:
         """Check for racial bias indicators."""
-        text_lower = text.lower()
-        confidence = 0.0
-        detected_tags = []
-
-        # Keywords
-        for keyword in self.racial_bias_keywords:
-            if keyword in text_lower:
-                confidence = max(confidence, 0.7)
-                detected_tags.append(f"racial_bias_keyword:{keyword}")
+        if hits is None:
+            hits = rules.matcher.scan(text)
+        confidence, detected_tags = rules.category_confidence(hits, "racial_bias")
 
-        # Regex patterns
-        for pattern in self.racial_bias_patterns:
-            if re.search(pattern, text_lower):
-                confidence = max(confidence, 0.9)
-                detected_tags.append(f"racial_bias_pattern:{pattern}")
-
-        threshold = self.confidence_thresholds[self.safety_mode]["racial_bias"]
+        threshold = rules.confidence_thresholds[self.safety_mode]["racial_bias"]
 
         if confidence >= threshold:
             return ModerationResult(
@@ -193,7 +410,7 @@ Focus on improving your Chinese, what would you like to practice today?""",
                 tags=detected_tags,
                 reason="Racial bias indicator detected.",
                 confidence=confidence,
-                fallback_response=self.fallback_templates["racial_bias"]
+                fallback_response=rules.fallback_templates["racial_bias"]
             )
 
         return ModerationResult(
@@ -203,25 +420,15 @@ Focus on improving your Chinese, what would you like to practice today?""",
             confidence=confidence,
         )
 
-    def _check_bias(self, text: str) -> ModerationResult:
+    def _check_bias(
+        self, rules: RuleSet, text: str, hits: Optional[Tuple[RuleHit, ...]] = None
+    ) -> ModerationResult:
         """Check for general bias indicators."""
-        text_lower = text.lower()
-        confidence = 0.0
-        detected_tags = []
-
-        # Keywords
-        for keyword in self.bias_keywords:
-            if keyword in text_lower:
-                confidence = max(confidence, 0.7)
-                detected_tags.append(f"bias_keyword:{keyword}")
+        if hits is None:
+            hits = rules.matcher.scan(text)
+        confidence, detected_tags = rules.category_confidence(hits, "bias")
 
-        # Regex patterns
-        for pattern in self.bias_patterns:
-            if re.search(pattern, text_lower):
-                confidence = max(confidence, 0.85)
-                detected_tags.append(f"bias_pattern:{pattern}")
-
-        threshold = self.confidence_thresholds[self.safety_mode]["bias"]
+        threshold = rules.confidence_thresholds[self.safety_mode]["bias"]
 
         if confidence >= threshold:
             return ModerationResult(
@@ -229,7 +436,7 @@ Focus on improving your Chinese, what would you like to practice today?""",
                 tags=detected_tags,
                 reason="Bias detected.",
                 confidence=confidence,
-                fallback_response=self.fallback_templates["bias"]
+                fallback_response=rules.fallback_templates["bias"]
             )
 
         return ModerationResult(
@@ -239,20 +446,20 @@ Focus on improving your Chinese, what would you like to practice today?""",
             confidence=confidence,
         )
 
-    def _check_model_output(self, response: str) -> ModerationResult:
+    def _check_model_output(
+        self, rules: RuleSet, response: str, cached: bool = True
+    ) -> ModerationResult:
         """Check model output for bias-like statements."""
-        response_lower = response.lower()
-
-        # Check for general bias in model's output
-        for keyword in self.bias_keywords + self.racial_bias_keywords:
-            if keyword in response_lower:
-                return ModerationResult(
-                    action=ModerationAction.SAFE_FALLBACK,
-                    tags=["model_output_bias_violation"],
-                    reason="Model's output contains bias keywords.",
-                    confidence=0.9,
-                    fallback_response=self.fallback_templates["bias"]
-                )
+        scan = rules.matcher.scan if cached else rules.matcher.scan_uncached
+        # Check for general or racial bias keywords in model's output
+        if any(hit.kind == "keyword" for hit in scan(response)):
+            return ModerationResult(
+                action=ModerationAction.SAFE_FALLBACK,
+                tags=["model_output_bias_violation"],
+                reason="Model's output contains bias keywords.",
+                confidence=0.9,
+                fallback_response=rules.fallback_templates["bias"]
+            )
 
         return ModerationResult(
             action=ModerationAction.ALLOW,
@@ -261,23 +468,34 @@ Focus on improving your Chinese, what would you like to practice today?""",
             confidence=1.0,
         )
 
-    def _check_context_patterns(self, context: List[Dict]) -> ModerationResult:
+    def new_tally(self, window_size: int = CONTEXT_WINDOW_SIZE) -> ViolationTally:
+        """Create an empty per-session violation tally."""
+        return ViolationTally(self, window_size)
+
+    def count_violations(self, message: Dict, rules: Optional[RuleSet] = None) -> int:
+        """Racial bias keyword hits in a user message (0 for other roles)."""
+        if message.get("role") != "user":
+            return 0
+        rules = rules or self.rules
+        return sum(
+            1 for hit in rules.matcher.scan(message.get("content", ""))
+            if hit.category == "racial_bias" and hit.kind == "keyword"
+        )
+
+    def _check_context_patterns(self, rules: RuleSet, context: List[Dict]) -> ModerationResult:
         """Check conversation history for repeated racial bias patterns."""
-        racial_bias_count = 0
-        for turn in context:
-            if turn.get("role") == "user":
-                content = turn.get("content", "").lower()
-                for keyword in self.racial_bias_keywords:
-                    if keyword in content:
-                        racial_bias_count += 1
+        return self._check_violation_count(
+            rules, sum(self.count_violations(turn, rules) for turn in context))
 
+    def _check_violation_count(self, rules: RuleSet, racial_bias_count: int) -> ModerationResult:
+        """Escalate once recent messages hold 3 or more racial bias keywords."""
         if racial_bias_count >= 3:
             return ModerationResult(
                 action=ModerationAction.SAFE_FALLBACK,
                 tags=["pattern_escalation", "repeated_racial_bias"],
                 reason="Escalating racial bias pattern detected",
                 confidence=0.8,
-                fallback_response=self.fallback_templates["racial_bias"],
+                fallback_response=rules.fallback_templates["racial_bias"],
             )
 
         return ModerationResult(
@@ -289,16 +507,41 @@ Focus on improving your Chinese, what would you like to practice today?""",
 
     def get_disclaimer(self) -> str:
         """Get initial disclaimer."""
-        return self.fallback_templates.get("disclaimer", "")
+        return self.rules.fallback_templates.get("disclaimer", "")
+
+
+def _file_stamp(file_path: str) -> Optional[Tuple[int, int]]:
+    """Modification time and size, to notice edits without reading the file."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _record_reload(result: str):
+    get_metrics().counter(
+        "moderation_rule_reloads_total",
+        "Moderation rule file reloads by result (ok or error).",
+        label="result",
+    ).inc(result)
 
 
 # Singleton instance
 _moderator_instance = None
+_moderator_lock = threading.Lock()
 
 
 def get_moderator() -> Moderator:
-    """Get singleton moderator instance."""
+    """Get singleton moderator instance (safe to call from any thread).
+
+    Its rules follow MODERATION_RULES_FILE, checked every
+    MODERATION_RULES_RELOAD_SECONDS.
+    """
     global _moderator_instance
     if _moderator_instance is None:
-        _moderator_instance = Moderator()
+        with _moderator_lock:
+            if _moderator_instance is None:
+                _moderator_instance = Moderator()
+                _moderator_instance.watch_rules()
     return _moderator_instance
@@ -0,0 +1,228 @@
+"""
+User profile storage.
+
+Profiles are small JSON objects keyed by user id. Two backends share one
+interface:
+
+* JsonProfileStore keeps the original profiles.json layout, but writes go
+  to a temporary file that is atomically renamed over the old one, under an
+  inter-process file lock, so concurrent workers can't lose updates or leave
+  a half-written file.
+* SQLiteProfileStore keeps one row per user in a WAL-mode database, so a
+  write touches only that user's row.
+
+Both keep an in-process read cache that is invalidated on write, and also
+when another process changes the underlying file or database.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+from .config import PROFILE_DB, PROFILE_FILE, PROFILE_STORE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileStore(ABC):
+    """Interface for user profile backends."""
+
+    @abstractmethod
+    def get(self, user_id: str) -> Optional[Dict]:
+        """Return a copy of the profile for user_id, or None if there is none."""
+
+    @abstractmethod
+    def set(self, user_id: str, profile: Dict):
+        """Create or replace the profile for user_id."""
+
+    def exists(self, user_id: str) -> bool:
+        return self.get(user_id) is not None
+
+
+class JsonProfileStore(ProfileStore):
+    """All profiles in one JSON file, rewritten atomically on each save."""
+
+    def __init__(self, path: str = PROFILE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._profiles: Optional[Dict] = None
+        # (mtime_ns, size) of the file the cache was read from
+        self._signature = None
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            profile = self._load().get(user_id)
+            return dict(profile) if profile is not None else None
+
+    def set(self, user_id: str, profile: Dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, self._file_lock():
+            # Re-read under the lock so another worker's save isn't overwritten
+            self._signature = None
+            profiles = dict(self._load())
+            profiles[user_id] = profile
+
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(profiles, f, indent=4, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self._profiles = profiles
+            self._signature = self._file_signature()
+
+    def _load(self) -> Dict:
+        # A stat per read is enough to notice saves made by other processes
+        signature = self._file_signature()
+        if self._profiles is None or signature != self._signature:
+            self._profiles = self._read_file()
+            self._signature = signature
+        return self._profiles
+
+    def _read_file(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError as e:
+            logger.error(f"Could not parse {self.path}: {e}")
+            return {}
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SQLiteProfileStore(ProfileStore):
+    """One row per user in a WAL-mode SQLite database."""
+
+    def __init__(self, db_path: str = PROFILE_DB, import_from: Optional[str] = PROFILE_FILE):
+        """
+        Args:
+            db_path: SQLite file
+            import_from: profiles.json to copy into a newly created database
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Optional[Dict]] = {}
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "user_id TEXT PRIMARY KEY, profile TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        if import_from:
+            self._import_json(import_from)
+        self._data_version = self._current_data_version()
+        logger.info(f"Profile store backed by {db_path}")
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._check_external_writes()
+            if user_id not in self._cache:
+                row = self._db.execute(
+                    "SELECT profile FROM profiles WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                self._cache[user_id] = json.loads(row[0]) if row else None
+            profile = self._cache[user_id]
+            return dict(profile) if profile is not None else None
+
+    def set(self, user_id: str, profile: Dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO profiles (user_id, profile, updated_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(profile, ensure_ascii=False), time.time()),
+            )
+            self._db.commit()
+            self._cache[user_id] = dict(profile)
+
+    def _check_external_writes(self):
+        # data_version changes only when another connection commits
+        version = self._current_data_version()
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def _current_data_version(self) -> int:
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _import_json(self, json_path: str):
+        if not os.path.exists(json_path):
+            return
+        if self._db.execute("SELECT 1 FROM profiles LIMIT 1").fetchone():
+            return
+        profiles = JsonProfileStore(json_path)._read_file()
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR IGNORE INTO profiles (user_id, profile, updated_at) VALUES (?, ?, ?)",
+            [(user_id, json.dumps(profile, ensure_ascii=False), now)
+             for user_id, profile in profiles.items()],
+        )
+        self._db.commit()
+        logger.info(f"Imported {len(profiles)} profile(s) from {json_path}")
+
+
+# Registered profile backends by name
+PROFILE_STORES = {
+    "json": JsonProfileStore,
+    "sqlite": SQLiteProfileStore,
+}
+
+
+def create_profile_store(backend: str = PROFILE_STORE_BACKEND) -> ProfileStore:
+    """Instantiate a registered profile backend with its configured path."""
+    if backend not in PROFILE_STORES:
+        raise ValueError(f"Unknown profile store: {backend}. Choose from {sorted(PROFILE_STORES)}")
+    return PROFILE_STORES[backend]()
+
+
+# Singleton instance
+_store_instance = None
+_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    """Get singleton profile store instance."""
+    global _store_instance
+    if _store_instance is None:
+        with _store_lock:
+            if _store_instance is None:
+                _store_instance = create_profile_store()
+    return _store_instance
@@ -0,0 +1,192 @@
+"""
+Per-user system prompt compilation.
+
+The static SYSTEM_PROMPT is shared by every request; the per-user part is a
+second system message rendered from the user's profile. PromptCompiler
+renders that message once per distinct profile and caches the text together
+with its token count, keyed by a hash of the profile, so a turn only looks
+up the session's CompiledPrompt: no string building and no re-tokenising of
+the prompt prefix. A changed profile hashes to a new key and is compiled on
+first use; least recently used profiles are evicted past
+PROMPT_CACHE_MAX_ENTRIES. Counts made while tiktoken is still loading are
+estimates, so the cache is dropped once it has loaded and every prompt is
+counted again on its next use.
+
+Profile fields come straight from the profile form, so they are cleaned
+before rendering: each becomes a single line of printable text with a
+length cap, and the level must be one the quiz assigns.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .config import PROMPT_CACHE_MAX_ENTRIES, SYSTEM_PROMPT
+from .metrics import get_metrics
+from .tokenizer import count_message_tokens, counts_are_exact
+
+logger = logging.getLogger(__name__)
+
+_PROFILE_TEMPLATE = (
+    "## User details\n"
+    "\n## Current User Profile\n"
+    "- User Name: {name}\n"
+    "- Learning Level: **{level}**\n"
+    "- Goal: **{goal}**\n"
+    "\n**Tailor your responses specifically to this user's background and needs.**\n"
+)
+
+# Levels the profile quiz assigns; anything else renders as "not specified"
+PROFILE_LEVELS = ("beginner", "intermediate", "advanced")
+_NAME_MAX_CHARS = 50  # The profile form's maxlength
+_GOAL_MAX_CHARS = 60
+_MAX_GOALS = 8
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """A rendered per-user system message."""
+    key: str  # Hash of the profile it was rendered from
+    text: str  # Message content; empty when there is no profile
+    tokens: int  # Tokens the message costs in a request (0 when empty)
+
+
+def profile_key(profile: Optional[Dict]) -> str:
+    """Hash a profile's canonical JSON, so equal profiles share a key."""
+    encoded = json.dumps(profile or {}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _clean_field(value, max_chars: int) -> str:
+    """One line of printable text: control characters and newlines become spaces."""
+    text = "".join(ch if ch.isprintable() else " " for ch in str(value))
+    return " ".join(text.split())[:max_chars].strip()
+
+
+def render_profile_prompt(profile: Optional[Dict]) -> str:
+    """Render the per-user system message for a profile ("" for no profile)."""
+    if not profile:
+        return ""
+    goal = profile.get("goal", [])
+    if isinstance(goal, list):
+        goals = [_clean_field(item, _GOAL_MAX_CHARS) for item in goal[:_MAX_GOALS]]
+        goal = ", ".join(item for item in goals if item)
+    else:
+        goal = _clean_field(goal, _GOAL_MAX_CHARS)
+    level = str(profile.get("level", "")).strip().lower()
+    return _PROFILE_TEMPLATE.format(
+        name=_clean_field(profile.get("name", ""), _NAME_MAX_CHARS) or "Unknown",
+        level=level if level in PROFILE_LEVELS else "not specified",
+        goal=goal or "to improve Chinese skills",
+    )
+
+
+class PromptCompiler:
+    """Thread-safe LRU of compiled profile prompts."""
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            max_entries: Compiled prompts kept before least recently used are dropped
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CompiledPrompt]" = OrderedDict()
+        # Content -> tokens of every cached message (SYSTEM_PROMPT on first use)
+        self._tokens: Dict[str, int] = {}
+        # Whether any cached count is an estimate from before tiktoken loaded
+        self._estimated = False
+        self._lock = threading.Lock()
+        self._lookups = get_metrics().counter(
+            "prompt_compile_lookups_total",
+            "Profile prompt lookups by result (hit or miss).",
+            label="result",
+        )
+
+    def compile(self, profile: Optional[Dict]) -> CompiledPrompt:
+        """Return the compiled prompt for a profile, rendering it on a miss."""
+        key = profile_key(profile)
+        with self._lock:
+            self._drop_estimates()
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+        if compiled is not None:
+            self._lookups.inc("hit")
+            return compiled
+
+        text = render_profile_prompt(profile)
+        tokens, exact = self._count(text) if text else (0, True)
+        compiled = CompiledPrompt(key=key, text=text, tokens=tokens)
+        with self._lock:
+            self._entries[key] = compiled
+            self._estimated = self._estimated or not exact
+            if text:
+                self._tokens[text] = tokens
+            while len(self._entries) > self.max_entries:
+                self._forget(self._entries.popitem(last=False)[1])
+        self._lookups.inc("miss")
+        logger.debug(f"Compiled profile prompt {key[:12]} ({tokens} tokens)")
+        return compiled
+
+    def invalidate(self, profile: Optional[Dict] = None):
+        """Drop one profile's compiled prompt, or all of them."""
+        with self._lock:
+            if profile is None:
+                self._entries.clear()
+                system_tokens = self._tokens.get(SYSTEM_PROMPT)
+                self._tokens = {} if system_tokens is None else {SYSTEM_PROMPT: system_tokens}
+                return
+            evicted = self._entries.pop(profile_key(profile), None)
+            if evicted is not None:
+                self._forget(evicted)
+
+    @staticmethod
+    def _count(text: str) -> Tuple[int, bool]:
+        # Checked first, so a count is never marked exact when it wasn't
+        exact = counts_are_exact()
+        return count_message_tokens({"content": text}), exact
+
+    def _drop_estimates(self):
+        # Called with the lock held
+        if self._estimated and counts_are_exact():
+            logger.debug("tiktoken loaded; dropping estimated prompt token counts")
+            self._entries.clear()
+            self._tokens.clear()
+            self._estimated = False
+
+    def _forget(self, evicted: CompiledPrompt):
+        # Profiles differing only in fields the template ignores render the same text
+        if not any(entry.text == evicted.text for entry in self._entries.values()):
+            self._tokens.pop(evicted.text, None)
+
+    def message_tokens(self, message: Dict) -> int:
+        """count_message_tokens(), answered from the cache for system prompts."""
+        content = message.get("content") or ""
+        with self._lock:
+            self._drop_estimates()
+            tokens = self._tokens.get(content)
+        if tokens is None and content == SYSTEM_PROMPT:
+            tokens, exact = self._count(content)
+            with self._lock:
+                self._tokens[content] = tokens
+                self._estimated = self._estimated or not exact
+        return count_message_tokens(message) if tokens is None else tokens
+
+
+# Singleton instance
+_compiler_instance = None
+_compiler_lock = threading.Lock()
+
+
+def get_prompt_compiler() -> PromptCompiler:
+    """Get singleton prompt compiler instance."""
+    global _compiler_instance
+    if _compiler_instance is None:
+        with _compiler_lock:
+            if _compiler_instance is None:
+                _compiler_instance = PromptCompiler()
+    return _compiler_instance
@@ -0,0 +1,196 @@
+"""
+Response cache for deterministic model completions.
+
+With TEMPERATURE = 0 and a fixed seed, identical requests produce the same
+completion, so common openers (e.g. "我想点咖啡") can be served without an API
+call. Entries live in an in-memory LRU, optionally backed by a SQLite file so
+they survive restarts and are shared between worker processes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from .config import (
+    RESPONSE_CACHE_DB,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Request parameters that do not affect the completion text
+_TRANSPORT_PARAMS = ("timeout", "stream", "stream_options", "prompt_cache_key")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalize width variants and whitespace so trivially different inputs share a key."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def make_cache_key(api_params: Dict) -> str:
+    """
+    Hash the parts of a chat completion request that determine its output.
+
+    Args:
+        api_params: Request parameters from ModelProvider._build_api_params
+
+    Returns:
+        Hex digest identifying the request
+    """
+    messages: List[Dict] = [dict(message) for message in api_params["messages"]]
+    if messages and messages[-1].get("role") == "user":
+        messages[-1]["content"] = normalize_prompt(messages[-1]["content"])
+    payload = {
+        name: value for name, value in api_params.items()
+        if name not in _TRANSPORT_PARAMS
+    }
+    payload["messages"] = messages
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of completion dicts with an optional SQLite tier."""
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        db_path: Optional[str] = RESPONSE_CACHE_DB,
+    ):
+        """
+        Args:
+            max_entries: Entries kept in memory before least recently used are dropped
+            ttl_seconds: Entries older than this are treated as misses
+            db_path: SQLite file for the on-disk tier, or None for memory only
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        # key -> (created_at, entry); order is least -> most recently used
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, created_at REAL NOT NULL, entry TEXT NOT NULL)"
+            )
+            self._db.commit()
+            logger.info(f"Response cache backed by {db_path}")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a copy of the cached entry for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                created_at, entry = item
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return dict(entry)
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created_at, entry FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[0] <= self.ttl_seconds:
+                    entry = json.loads(row[1])
+                    self._remember(key, row[0], entry)
+                    self.disk_hits += 1
+                    return dict(entry)
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, entry: Dict):
+        """Store an entry (a JSON-serialisable completion dict)."""
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, created_at, dict(entry))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, created_at, entry) VALUES (?, ?, ?)",
+                    (key, created_at, json.dumps(entry, ensure_ascii=False)),
+                )
+                self._db.commit()
+
+    def mark_moderated(self, key: str, rules_version: str):
+        """
+        Record that an entry passed output moderation, so later hits can skip it.
+
+        The entry stores rules_version, so hits are moderated again once the
+        moderation rules change.
+        """
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None or item[1].get("moderated") == rules_version:
+                return
+            item[1]["moderated"] = rules_version
+            if self._db is not None:
+                self._db.execute(
+                    "UPDATE responses SET entry = ? WHERE key = ?",
+                    (json.dumps(item[1], ensure_ascii=False), key),
+                )
+                self._db.commit()
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _remember(self, key: str, created_at: float, entry: Dict):
+        self._memory[key] = (created_at, entry)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+# Singleton instance
+_cache_instance = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Get singleton response cache instance."""
+    global _cache_instance
+    if _cache_instance is None:
+        with _cache_lock:
+            if _cache_instance is None:
+                _cache_instance = ResponseCache()
+    return _cache_instance
@@ -0,0 +1,353 @@
+"""
+Hedged model requests across two backends.
+
+HedgedRouter sends each request to a primary provider. If no answer has
+arrived once the primary is slower than HEDGE_PERCENTILE of its recent
+calls, it sends a duplicate to a secondary provider and uses whichever
+succeeds first; a request that fails on the primary goes to the secondary
+straight away. For streams the race is to the first token, after which the
+winning stream is read to the end and the other one closed.
+
+Hedging at the 95th percentile duplicates about 5% of requests and cuts
+the slowest tail down to roughly the hedge delay plus the secondary's
+latency. Routers look like providers to the engine, so enabling one is
+only a matter of setting MODEL_HEDGE_PROVIDER.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from .concurrency import run_in_thread
+from .config import (
+    HEDGE_DEFAULT_DELAY_SECONDS,
+    HEDGE_MIN_DELAY_SECONDS,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+    HEDGE_WINDOW_SIZE,
+)
+from .metrics import SpanTimer, get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Marks a stream that ended before its first chunk
+_STREAM_END = object()
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls, for percentile thresholds."""
+
+    def __init__(self, size: int = HEDGE_WINDOW_SIZE, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The p-th percentile in seconds, or None until min_samples are recorded."""
+        with self._lock:
+            if len(self._samples) < max(1, self.min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class HedgedRouter:
+    """Routes to a primary provider, hedging slow or failed calls to a secondary."""
+
+    def __init__(
+        self,
+        primary,
+        secondary,
+        percentile: float = HEDGE_PERCENTILE,
+        default_delay: float = HEDGE_DEFAULT_DELAY_SECONDS,
+        min_delay: float = HEDGE_MIN_DELAY_SECONDS,
+    ):
+        """
+        Args:
+            primary: Provider every request goes to first
+            secondary: Provider that receives hedged duplicates
+            percentile: Primary latency percentile after which to hedge
+            default_delay: Hedge delay in seconds until enough latencies are known
+            min_delay: Lower bound on the hedge delay in seconds
+        """
+        self.primary = primary
+        self.secondary = secondary
+        self.model_name = primary.model_name
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        # Whole-response latency for generate(), time to first token for streams
+        self._latency = {"generate": LatencyWindow(), "stream": LatencyWindow()}
+
+    def hedge_delay(self, kind: str) -> float:
+        """Seconds to wait for the primary before hedging ("generate" or "stream")."""
+        observed = self._latency[kind].percentile(self.percentile)
+        return self.default_delay if observed is None else max(self.min_delay, observed)
+
+    def verify_connection(self):
+        """Verify the primary; a failing secondary only logs a warning."""
+        self.primary.verify_connection()
+        try:
+            self.secondary.verify_connection()
+        except Exception as e:
+            logger.warning(f"Hedge provider verification failed: {e}")
+
+    def health_check(self) -> bool:
+        return self.primary.health_check() or self.secondary.health_check()
+
+    def mark_response_moderated(self, cache_key: Optional[str], rules_version: str):
+        # Keys include the model name, so only the provider that cached it matches
+        self.primary.mark_response_moderated(cache_key, rules_version)
+        self.secondary.mark_response_moderated(cache_key, rules_version)
+
+    def generate(self, prompt: str, timer: Optional[SpanTimer] = None, **kwargs) -> Dict:
+        """
+        Generate a response, hedging to the secondary if the primary is slow.
+
+        Takes the same arguments as ModelProvider.generate(). The result
+        also carries "hedged" (whether a duplicate was sent) and
+        "served_by" ("primary" or "secondary").
+        """
+        timer = timer or SpanTimer()
+        start = time.perf_counter()
+        calls: Dict[Future, tuple] = {}  # future -> (role, its timer)
+
+        def launch(role: str):
+            provider = self.primary if role == "primary" else self.secondary
+            call_timer = SpanTimer()
+            future = run_in_thread(
+                f"hedged-{role}", provider.generate, prompt, timer=call_timer, **kwargs)
+            calls[future] = (role, call_timer)
+            return future
+
+        primary = launch("primary")
+        # Observed even when it loses, so the threshold tracks the primary's real latency
+        primary.add_done_callback(
+            lambda f: not f.cancelled() and f.exception() is None
+            and self._latency["generate"].observe(time.perf_counter() - start))
+
+        done, _ = wait([primary], timeout=self.hedge_delay("generate"))
+        hedged = not done or primary.exception() is not None
+        if hedged:
+            launch("secondary")
+
+        pending = set(calls)
+        errors: Dict[str, BaseException] = {}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                role, call_timer = calls[future]
+                if future.exception() is not None:
+                    errors[role] = future.exception()
+                    continue
+                # The loser can't be interrupted mid-request; its result is dropped
+                for other in pending:
+                    other.cancel()
+                timer.merge(call_timer)
+                _record_hedge(hedged, role)
+                return {**future.result(), "hedged": hedged, "served_by": role}
+
+        _record_hedge(hedged, "none")
+        raise errors.get("primary") or errors["secondary"]
+
+    def generate_stream(
+        self, prompt: str, timer: Optional[SpanTimer] = None, **kwargs
+    ) -> Iterator[str]:
+        """
+        Stream a response from whichever provider produces a first token first.
+
+        Takes the same arguments as ModelProvider.generate_stream().
+        """
+        timer = timer or SpanTimer()
+        start = time.perf_counter()
+        # (role, stream, future of its first chunk, its timer)
+        calls: List[tuple] = []
+
+        def launch(role: str):
+            provider = self.primary if role == "primary" else self.secondary
+            call_timer = SpanTimer()
+            stream = provider.generate_stream(prompt, timer=call_timer, **kwargs)
+            first = run_in_thread(f"hedged-{role}", next, stream, _STREAM_END)
+            calls.append((role, stream, first, call_timer))
+            return first
+
+        primary = launch("primary")
+        primary.add_done_callback(
+            lambda f: not f.cancelled() and f.exception() is None
+            and self._latency["stream"].observe(time.perf_counter() - start))
+
+        done, _ = wait([primary], timeout=self.hedge_delay("stream"))
+        hedged = not done or primary.exception() is not None
+        if hedged:
+            launch("secondary")
+
+        winner = None
+        errors: Dict[str, BaseException] = {}
+        pending = {call[2] for call in calls}
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for call in calls:
+                if call[2] in done:
+                    if call[2].exception() is not None:
+                        errors[call[0]] = call[2].exception()
+                    elif winner is None:
+                        winner = call
+
+        for call in calls:
+            if call is not winner:
+                # Close once the pending first read returns
+                stream = call[1]
+                call[2].add_done_callback(lambda _, stream=stream: stream.close())
+
+        if winner is None:
+            _record_hedge(hedged, "none")
+            raise errors.get("primary") or errors["secondary"]
+
+        role, stream, first, call_timer = winner
+        _record_hedge(hedged, role)
+        try:
+            if first.result() is not _STREAM_END:
+                yield first.result()
+            yield from stream
+        finally:
+            stream.close()
+            timer.merge(call_timer)
+
+
+class AsyncHedgedRouter(HedgedRouter):
+    """HedgedRouter for asyncio providers; the losing request is cancelled."""
+
+    async def verify_connection(self):
+        await self.primary.verify_connection()
+        try:
+            await self.secondary.verify_connection()
+        except Exception as e:
+            logger.warning(f"Hedge provider verification failed: {e}")
+
+    async def health_check(self) -> bool:
+        return await self.primary.health_check() or await self.secondary.health_check()
+
+    async def generate(self, prompt: str, timer: Optional[SpanTimer] = None, **kwargs) -> Dict:
+        timer = timer or SpanTimer()
+        start = time.perf_counter()
+        calls: Dict[asyncio.Future, tuple] = {}
+
+        def launch(role: str):
+            provider = self.primary if role == "primary" else self.secondary
+            call_timer = SpanTimer()
+            task = asyncio.ensure_future(provider.generate(prompt, timer=call_timer, **kwargs))
+            calls[task] = (role, call_timer)
+            return task
+
+        primary = launch("primary")
+        primary.add_done_callback(
+            lambda t: not t.cancelled() and t.exception() is None
+            and self._latency["generate"].observe(time.perf_counter() - start))
+
+        try:
+            done, _ = await asyncio.wait([primary], timeout=self.hedge_delay("generate"))
+            hedged = not done or primary.exception() is not None
+            if hedged:
+                launch("secondary")
+
+            pending = set(calls)
+            errors: Dict[str, BaseException] = {}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    role, call_timer = calls[task]
+                    if task.exception() is not None:
+                        errors[role] = task.exception()
+                        continue
+                    timer.merge(call_timer)
+                    _record_hedge(hedged, role)
+                    return {**task.result(), "hedged": hedged, "served_by": role}
+        finally:
+            for task in calls:
+                task.cancel()
+
+        _record_hedge(hedged, "none")
+        raise errors.get("primary") or errors["secondary"]
+
+    async def generate_stream(
+        self, prompt: str, timer: Optional[SpanTimer] = None, **kwargs
+    ) -> AsyncIterator[str]:
+        timer = timer or SpanTimer()
+        start = time.perf_counter()
+        calls: List[tuple] = []
+
+        def launch(role: str):
+            provider = self.primary if role == "primary" else self.secondary
+            call_timer = SpanTimer()
+            stream = provider.generate_stream(prompt, timer=call_timer, **kwargs)
+            first = asyncio.ensure_future(_first_chunk(stream))
+            calls.append((role, stream, first, call_timer))
+            return first
+
+        primary = launch("primary")
+        primary.add_done_callback(
+            lambda t: not t.cancelled() and t.exception() is None
+            and self._latency["stream"].observe(time.perf_counter() - start))
+
+        winner = None
+        errors: Dict[str, BaseException] = {}
+        try:
+            done, _ = await asyncio.wait([primary], timeout=self.hedge_delay("stream"))
+            hedged = not done or primary.exception() is not None
+            if hedged:
+                launch("secondary")
+
+            pending = {call[2] for call in calls}
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for call in calls:
+                    if call[2] in done:
+                        if call[2].exception() is not None:
+                            errors[call[0]] = call[2].exception()
+                        elif winner is None:
+                            winner = call
+        finally:
+            for call in calls:
+                if call is not winner:
+                    call[2].cancel()
+                    # The generator can only be closed once its pending read has stopped
+                    await asyncio.gather(call[2], return_exceptions=True)
+                    await call[1].aclose()
+
+        if winner is None:
+            _record_hedge(hedged, "none")
+            raise errors.get("primary") or errors["secondary"]
+
+        role, stream, first, call_timer = winner
+        _record_hedge(hedged, role)
+        try:
+            if first.result() is not _STREAM_END:
+                yield first.result()
+            async for delta in stream:
+                yield delta
+        finally:
+            await stream.aclose()
+            timer.merge(call_timer)
+
+
+async def _first_chunk(stream: AsyncIterator[str]):
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return _STREAM_END
+
+
+def _record_hedge(hedged: bool, served_by: str):
+    get_metrics().counter(
+        "model_routed_requests_total",
+        "Routed model requests by which provider answered (hedged requests get a _hedged suffix).",
+        label="served_by",
+    ).inc(f"{served_by}_hedged" if hedged else served_by)
@@ -0,0 +1,316 @@
+"""
+Client-side rate limiting for model API calls.
+
+Every model request is admitted by a RequestScheduler before it is sent.
+Two token buckets track requests per minute and tokens per minute against
+MODEL_REQUESTS_PER_MINUTE and MODEL_TOKENS_PER_MINUTE, so a burst of users
+queues here instead of turning into provider 429s and retry storms. Queued
+requests are admitted strictly by priority (interactive chat, then
+background work such as history summaries, then batch evaluation) and
+round-robin across users within a priority, so one busy user can't starve
+the others.
+
+A request reserves its prompt tokens plus max_tokens up front; the unused
+part is refunded once the response reports its actual usage. Queue depth
+and wait times are exported on /metrics. Limits are per process.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from .config import (
+    MODEL_REQUESTS_PER_MINUTE,
+    MODEL_TOKENS_PER_MINUTE,
+    SCHEDULER_BURST_SECONDS,
+    SCHEDULER_MAX_WAIT_SECONDS,
+)
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_BATCH = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BACKGROUND: "background",
+    PRIORITY_BATCH: "batch",
+}
+
+
+class QueueTimeoutError(RuntimeError):
+    """Raised when a request waits longer than SCHEDULER_MAX_WAIT_SECONDS to be admitted."""
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second, up to capacity. Not thread-safe."""
+
+    def __init__(self, per_minute: float, burst_seconds: float = SCHEDULER_BURST_SECONDS):
+        """
+        Args:
+            per_minute: Sustained rate; 0 or less means unlimited
+            burst_seconds: Capacity, as seconds' worth of the rate
+        """
+        self.unlimited = per_minute <= 0
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken (0 if it can be taken now)."""
+        if self.unlimited:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+        # Larger requests than the bucket holds wait for a full bucket
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    """One queued request."""
+
+    __slots__ = ("user_id", "priority", "tokens", "enqueued_at", "granted", "notify")
+
+    def __init__(self, user_id: str, priority: int, tokens: int):
+        self.user_id = user_id
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.notify = None  # Called once the ticket is granted
+
+
+class Reservation:
+    """Quota held by one admitted request."""
+
+    def __init__(self, scheduler: "RequestScheduler", user_id: str, priority: int, tokens: int):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.priority = priority
+        self.tokens = tokens
+
+    def settle(self, used_tokens: Optional[int]):
+        """Refund reserved tokens the request didn't use, once its usage is known."""
+        if used_tokens is not None and used_tokens < self.tokens:
+            self.scheduler.refund(0, self.tokens - used_tokens)
+            self.tokens = used_tokens
+
+    def release(self):
+        """Refund the tokens of a request that failed; the request slot stays spent."""
+        self.scheduler.refund(0, self.tokens)
+
+    def renew(self):
+        """Wait to be admitted again, e.g. before retrying after release()."""
+        self.scheduler.acquire(self.user_id, self.tokens, self.priority)
+
+    async def renew_async(self):
+        await self.scheduler.acquire_async(self.user_id, self.tokens, self.priority)
+
+
+class RequestScheduler:
+    """Admits model requests within per-minute request and token quotas."""
+
+    def __init__(
+        self,
+        requests_per_minute: float = MODEL_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = MODEL_TOKENS_PER_MINUTE,
+        max_wait: float = SCHEDULER_MAX_WAIT_SECONDS,
+    ):
+        """
+        Args:
+            requests_per_minute: Request quota; 0 disables it
+            tokens_per_minute: Token quota; 0 disables it
+            max_wait: Longest a request may queue before QueueTimeoutError
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_wait = max_wait
+        # priority -> user -> that user's queued tickets; users rotate to the
+        # back after each admission
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Ticket]]"] = {}
+        self._depth: Dict[int, int] = {}
+        self._cond = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+
+        metrics = get_metrics()
+        self._depth_gauge = metrics.gauge(
+            "model_queue_depth", "Model requests waiting for rate limit quota.", label="priority")
+        self._wait_histogram = metrics.histogram(
+            "model_queue_wait_seconds", "Time model requests waited for rate limit quota.",
+            label="priority")
+
+    def acquire(
+        self, user_id: str, tokens: int, priority: int = PRIORITY_INTERACTIVE
+    ) -> Reservation:
+        """
+        Block until the request is admitted.
+
+        Args:
+            user_id: Fairness key; users at the same priority take turns
+            tokens: Tokens to reserve (prompt plus max completion tokens)
+            priority: One of the PRIORITY_* constants
+
+        Returns:
+            Reservation to settle() with the actual usage
+
+        Raises:
+            QueueTimeoutError: If not admitted within max_wait seconds
+        """
+        ticket = _Ticket(user_id, priority, tokens)
+        if self._admit_now(ticket):
+            return Reservation(self, user_id, priority, tokens)
+
+        granted = threading.Event()
+        ticket.notify = granted.set
+        self._enqueue(ticket)
+        if not granted.wait(self.max_wait) and not self._abandon(ticket):
+            raise QueueTimeoutError(f"Model request queued for over {self.max_wait:g}s")
+        return Reservation(self, user_id, priority, tokens)
+
+    async def acquire_async(
+        self, user_id: str, tokens: int, priority: int = PRIORITY_INTERACTIVE
+    ) -> Reservation:
+        """Same as acquire(), but waits without blocking the event loop."""
+        ticket = _Ticket(user_id, priority, tokens)
+        if self._admit_now(ticket):
+            return Reservation(self, user_id, priority, tokens)
+
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        ticket.notify = notify
+        self._enqueue(ticket)
+        try:
+            await asyncio.wait_for(granted, self.max_wait)
+        except asyncio.TimeoutError:
+            if not self._abandon(ticket):
+                raise QueueTimeoutError(f"Model request queued for over {self.max_wait:g}s")
+        except asyncio.CancelledError:
+            if self._abandon(ticket):
+                self.refund(1, tokens)
+            raise
+        return Reservation(self, user_id, priority, tokens)
+
+    def refund(self, requests: int, tokens: int):
+        """Return unused quota."""
+        with self._cond:
+            self.requests.refund(requests)
+            self.tokens.refund(tokens)
+            self._cond.notify()
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Requests waiting, by priority name."""
+        with self._cond:
+            return {PRIORITY_NAMES.get(p, str(p)): n for p, n in self._depth.items()}
+
+    def _admit_now(self, ticket: _Ticket) -> bool:
+        # Fast path: nobody is queued and there is quota for this request
+        with self._cond:
+            if any(self._depth.values()):
+                return False
+            now = time.monotonic()
+            if self.requests.wait_time(1, now) or self.tokens.wait_time(ticket.tokens, now):
+                return False
+            self.requests.take(1)
+            self.tokens.take(ticket.tokens)
+        self._wait_histogram.observe(0.0, PRIORITY_NAMES.get(ticket.priority, ""))
+        return True
+
+    def _enqueue(self, ticket: _Ticket):
+        with self._cond:
+            users = self._queues.setdefault(ticket.priority, OrderedDict())
+            users.setdefault(ticket.user_id, deque()).append(ticket)
+            self._set_depth(ticket.priority, 1)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._dispatch_loop, name="request-scheduler", daemon=True)
+                self._dispatcher.start()
+            self._cond.notify()
+
+    def _abandon(self, ticket: _Ticket) -> bool:
+        """Remove a ticket whose waiter gave up; returns True if it was granted meanwhile."""
+        with self._cond:
+            if ticket.granted:
+                return True
+            users = self._queues[ticket.priority]
+            queue = users[ticket.user_id]
+            queue.remove(ticket)
+            if not queue:
+                del users[ticket.user_id]
+            self._set_depth(ticket.priority, -1)
+            self._cond.notify()
+            return False
+
+    def _head(self) -> Optional[_Ticket]:
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                ticket = self._head()
+                if ticket is None:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                wait = max(self.requests.wait_time(1, now),
+                           self.tokens.wait_time(ticket.tokens, now))
+                if wait > 0:
+                    # Woken early by new arrivals, refunds and abandoned tickets
+                    self._cond.wait(wait)
+                    continue
+                self.requests.take(1)
+                self.tokens.take(ticket.tokens)
+                users = self._queues[ticket.priority]
+                queue = users[ticket.user_id]
+                queue.popleft()
+                if queue:
+                    users.move_to_end(ticket.user_id)
+                else:
+                    del users[ticket.user_id]
+                self._set_depth(ticket.priority, -1)
+                ticket.granted = True
+            self._wait_histogram.observe(
+                time.monotonic() - ticket.enqueued_at, PRIORITY_NAMES.get(ticket.priority, ""))
+            ticket.notify()
+
+    def _set_depth(self, priority: int, change: int):
+        depth = self._depth[priority] = self._depth.get(priority, 0) + change
+        self._depth_gauge.set(depth, PRIORITY_NAMES.get(priority, str(priority)))
+
+
+# Singleton instance
+_scheduler_instance = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Get singleton request scheduler instance."""
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        with _scheduler_lock:
+            if _scheduler_instance is None:
+                _scheduler_instance = RequestScheduler()
+    return _scheduler_instance
@@ -0,0 +1,175 @@
+"""
+Per-session ChatEngine pool.
+
+Each browser session gets its own lightweight ChatEngine (history, profile,
+first-interaction flag) while the model provider and moderator stay shared
+singletons. Sessions are evicted least-recently-used first once the pool is
+full, and after SESSION_IDLE_TTL_SECONDS without activity.
+"""
+
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from .chat_engine import ChatEngine
+from .config import SESSION_IDLE_TTL_SECONDS, SESSION_MAX_COUNT
+
+logger = logging.getLogger(__name__)
+
+# Format of ids from new_session_id(): 32 lowercase hex digits
+_SESSION_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class SessionManager:
+    """Thread-safe LRU + idle-TTL pool of ChatEngine instances."""
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_COUNT,
+        idle_ttl_seconds: float = SESSION_IDLE_TTL_SECONDS,
+        engine_factory: Callable[[str], ChatEngine] = ChatEngine,
+    ):
+        """
+        Args:
+            max_sessions: Memory cap; least recently used sessions are evicted beyond it
+            idle_ttl_seconds: Sessions idle longer than this are evicted
+            engine_factory: Builds a new engine for a session id
+        """
+        if max_sessions < 1:
+            raise ValueError(f"Invalid max_sessions: {max_sessions}")
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.engine_factory = engine_factory
+        # session_id -> (engine, last_access); order is least -> most recent
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @staticmethod
+    def new_session_id() -> str:
+        """Generate a fresh, unguessable session id."""
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def is_valid_session_id(session_id: Optional[str]) -> bool:
+        """Whether a client-supplied id could have come from new_session_id()."""
+        return bool(session_id) and _SESSION_ID.fullmatch(session_id) is not None
+
+    def get(
+        self,
+        session_id: str,
+        on_create: Optional[Callable[[ChatEngine], None]] = None,
+    ) -> ChatEngine:
+        """
+        Get the engine for a session, creating it if needed.
+
+        A new engine is only published once on_create has run, so concurrent
+        first requests never see it half set up; if two of them race, one
+        engine wins and the other is dropped.
+
+        Args:
+            session_id: Session key (e.g. from a cookie)
+            on_create: Called with a newly created engine, e.g. to load a profile
+
+        Returns:
+            ChatEngine owned by this session
+        """
+        engine = self._touch(session_id)
+        if engine is not None:
+            return engine
+
+        # Built outside the lock: on_create may do I/O (e.g. read a profile)
+        engine = self.engine_factory(session_id)
+        if on_create:
+            on_create(engine)
+
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                # Another request created this session first; use its engine
+                self._sessions[session_id] = (entry[0], time.monotonic())
+                self._sessions.move_to_end(session_id)
+                return entry[0]
+            self._sessions[session_id] = (engine, time.monotonic())
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"Evicted least recently used session: {evicted_id}")
+
+        logger.info(f"Created ChatEngine for session: {session_id}")
+        return engine
+
+    def _touch(self, session_id: str) -> Optional[ChatEngine]:
+        """Return an existing engine and mark it used, or None."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], now)
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def peek(self, session_id: str) -> Optional[ChatEngine]:
+        """Return the engine for a session without creating or touching it."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry[0] if entry else None
+
+    def remove(self, session_id: str) -> bool:
+        """Drop a session. Returns True if it existed."""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def evict_expired(self) -> int:
+        """Evict idle sessions now. Returns the number evicted."""
+        with self._lock:
+            return self._evict_expired(time.monotonic())
+
+    def _evict_expired(self, now: float) -> int:
+        # Entries are ordered by last access, so stop at the first fresh one
+        evicted = 0
+        while self._sessions:
+            _, last_access = next(iter(self._sessions.values()))
+            if now - last_access <= self.idle_ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            evicted += 1
+        if evicted:
+            self.evictions += evicted
+            logger.info(f"Evicted {evicted} idle session(s)")
+        return evicted
+
+    def stats(self) -> Dict:
+        """Pool statistics for monitoring."""
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+# Singleton instance
+_manager_instance = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager() -> SessionManager:
+    """Get singleton session manager instance."""
+    global _manager_instance
+    if _manager_instance is None:
+        with _manager_lock:
+            if _manager_instance is None:
+                _manager_instance = SessionManager()
+    return _manager_instance
@@ -0,0 +1,78 @@
+"""
+Local token counting.
+
+Uses tiktoken with the encoding of MODEL_NAME when it is installed and its
+encoding file is available (tiktoken downloads it once, then caches it; the
+load runs in the background so no request waits on it). Until then, or
+without tiktoken, counts fall back to an estimate: one token per CJK
+character and about four characters per token for other text, which is
+close for the mixed Chinese/English text this app exchanges.
+"""
+
+import logging
+import re
+import threading
+
+from .config import MODEL_NAME
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# CJK punctuation, ideographs and full-width forms
+_CJK_CHAR = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+_WORD_OR_SYMBOL = re.compile(r"[^\W\d_]+|\d+|[^\w\s]")
+
+_encoding = None
+_encoding_requested = False
+_encoding_lock = threading.Lock()
+
+
+def _load_encoding():
+    global _encoding
+    try:
+        import tiktoken
+        _encoding = tiktoken.encoding_for_model(MODEL_NAME)
+        logger.info(f"Token counts use tiktoken encoding {_encoding.name}")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+
+
+def _get_encoding():
+    # The first load may download the encoding file, so it happens in the
+    # background and counts are estimated until it is ready
+    global _encoding_requested
+    if not _encoding_requested:
+        with _encoding_lock:
+            if not _encoding_requested:
+                _encoding_requested = True
+                threading.Thread(target=_load_encoding, name="tiktoken-load", daemon=True).start()
+    return _encoding
+
+
+def counts_are_exact() -> bool:
+    """Whether counts come from tiktoken rather than the estimate."""
+    return _get_encoding() is not None
+
+
+def estimate_tokens(text: str) -> int:
+    """Heuristic token count, used when tiktoken is unavailable."""
+    cjk = len(_CJK_CHAR.findall(text))
+    rest = _CJK_CHAR.sub(" ", text)
+    return cjk + sum(max(1, (len(piece) + 3) // 4) for piece in _WORD_OR_SYMBOL.findall(rest))
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens text encodes to for the configured model."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message: dict) -> int:
+    """Tokens a chat message costs in a request, including format overhead."""
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
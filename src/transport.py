@@ -0,0 +1,290 @@
+"""
+HTTP transport, retry policy and circuit breaker for model API calls.
+
+The OpenAI clients are built on a shared, explicitly sized httpx connection
+pool with keep-alive (and optionally HTTP/2), so requests reuse warm
+connections instead of paying TCP and TLS setup each time. The SDK's own
+retries are disabled; ModelProvider retries transient failures itself with
+jittered exponential backoff that honours Retry-After, bounds each attempt
+with MODEL_ATTEMPT_TIMEOUT_SECONDS and gives up once the overall
+TIMEOUT_SECONDS deadline would be exceeded. A circuit breaker per endpoint
+fails requests immediately while the provider is down rather than letting
+every request wait out its timeouts.
+"""
+
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from .config import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+    MODEL_ATTEMPT_TIMEOUT_SECONDS,
+    MODEL_CONNECT_TIMEOUT_SECONDS,
+    MODEL_HTTP2,
+    MODEL_KEEPALIVE_EXPIRY_SECONDS,
+    MODEL_MAX_RETRIES,
+    MODEL_POOL_MAX_CONNECTIONS,
+    MODEL_POOL_MAX_KEEPALIVE,
+    MODEL_RETRY_BASE_DELAY,
+    MODEL_RETRY_MAX_DELAY,
+)
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: timeout, conflict, rate limit and server errors
+_RETRYABLE_STATUS = {408, 409, 429}
+
+# Longest Retry-After we will wait for before giving up instead
+_MAX_RETRY_AFTER = 60.0
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+def http_client_options() -> Dict:
+    """Keyword arguments for the httpx client behind the OpenAI SDK."""
+    import httpx
+
+    http2 = MODEL_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        except ImportError:
+            logger.warning("MODEL_HTTP2 needs the h2 package (pip install httpx[http2]); using HTTP/1.1")
+            http2 = False
+
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=MODEL_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=MODEL_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=MODEL_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        "timeout": httpx.Timeout(MODEL_ATTEMPT_TIMEOUT_SECONDS, connect=MODEL_CONNECT_TIMEOUT_SECONDS),
+    }
+
+
+def create_http_client():
+    """Pooled keep-alive httpx client for the sync OpenAI SDK."""
+    from openai import DefaultHttpxClient
+    return DefaultHttpxClient(**http_client_options())
+
+
+def create_async_http_client():
+    """Pooled keep-alive httpx client for the asyncio OpenAI SDK."""
+    from openai import DefaultAsyncHttpxClient
+    return DefaultAsyncHttpxClient(**http_client_options())
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed call may succeed if repeated."""
+    from openai import APIConnectionError  # Includes APITimeoutError
+
+    if isinstance(error, APIConnectionError):
+        return True
+    status = _status_code(error)
+    return status is not None and (status in _RETRYABLE_STATUS or status >= 500)
+
+
+def is_outage(error: BaseException) -> bool:
+    """Whether a failure suggests the provider is down (counts towards the breaker)."""
+    from openai import APIConnectionError
+
+    if isinstance(error, APIConnectionError):
+        return True
+    status = _status_code(error)
+    return status is not None and status >= 500
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay the server asked for in retry-after-ms or Retry-After, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:  # HTTP-date form
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, within an overall deadline."""
+
+    def __init__(
+        self,
+        max_retries: int = MODEL_MAX_RETRIES,
+        base_delay: float = MODEL_RETRY_BASE_DELAY,
+        max_delay: float = MODEL_RETRY_MAX_DELAY,
+        attempt_timeout: float = MODEL_ATTEMPT_TIMEOUT_SECONDS,
+    ):
+        """
+        Args:
+            max_retries: Retries after the first attempt
+            base_delay: Backoff ceiling in seconds for the first retry; doubles each retry
+            max_delay: Largest backoff ceiling in seconds
+            attempt_timeout: Timeout in seconds for a single attempt
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+
+    def backoff(self, retry: int, error: Optional[BaseException] = None) -> float:
+        """
+        Seconds to wait before the given retry (1 for the first).
+
+        A Retry-After from the server wins over the computed backoff;
+        otherwise the delay is uniform in [0, min(max_delay, base * 2^(retry-1))]
+        so that clients that failed together don't retry together.
+        """
+        requested = retry_after_seconds(error) if error is not None else None
+        if requested is not None:
+            return requested
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (retry - 1)))
+        return random.uniform(0, ceiling)
+
+    def next_delay(
+        self, retry: int, error: BaseException, deadline: float
+    ) -> Optional[float]:
+        """
+        Delay before retrying after error, or None to give up.
+
+        Args:
+            retry: Number of the retry about to be made (1 for the first)
+            error: Exception from the failed attempt
+            deadline: time.monotonic() value by which the call must finish
+        """
+        if retry > self.max_retries or not is_retryable(error):
+            return None
+        delay = self.backoff(retry, error)
+        if delay > _MAX_RETRY_AFTER or time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def attempt_timeout_for(self, deadline: float) -> float:
+        """Timeout for the next attempt: the per-attempt limit, capped by the time left."""
+        return max(0.0, min(self.attempt_timeout, deadline - time.monotonic()))
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+
+    Closed: calls go through and consecutive outage failures are counted.
+    Open: after failure_threshold of them, calls fail immediately for
+    reset_timeout seconds. Half-open: then a single trial call is let
+    through; success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not be attempted."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_started_at = now
+                logger.info(f"Circuit for {self.name} half-open; sending a trial request")
+                return
+            # A trial whose outcome was never reported is replaced after a while
+            if self.state == self.HALF_OPEN and now - self._trial_started_at >= self.reset_timeout:
+                self._trial_started_at = now
+                return
+            retry_in = max(0.0, self.reset_timeout - (now - self._opened_at))
+        get_metrics().counter(
+            "model_circuit_rejections_total",
+            "Model calls failed fast because the circuit breaker was open.",
+        ).inc()
+        raise CircuitOpenError(
+            f"{self.name} is unavailable after repeated failures; retrying in {retry_in:.1f}s")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self, error: BaseException):
+        """Count a failed call; only outage-type errors move the breaker."""
+        if not is_outage(error):
+            if _status_code(error) is not None:
+                self.record_success()  # The provider answered, so it is up
+            return
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                if self.state == self.CLOSED:
+                    logger.error(f"Circuit for {self.name} opened after {self._failures} failures: {error}")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def record_retry(error: BaseException, delay: float):
+    reason = _status_code(error) or type(error).__name__
+    logger.warning(f"Model call failed ({reason}), retrying in {delay:.2f}s: {error}")
+    get_metrics().counter(
+        "model_retries_total", "Model call retries by failure reason.", label="reason"
+    ).inc(str(reason))
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """Get the circuit breaker shared by all clients of an endpoint."""
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
@@ -0,0 +1,446 @@
+"""
+Text-to-speech synthesis with pluggable backends and a content-addressed audio cache.
+
+Text is split into sentence-sized chunks. Each chunk's audio is keyed by a hash
+of (backend, lang, text) and kept in a size-bounded memory LRU backed by one
+file per clip on disk. Concurrent requests for the same clip share a single
+synthesis, so replaying a sentence, or requesting one that is already being
+pre-synthesised in the background, never synthesises twice. Streaming yields
+the first chunk's audio while later chunks are still being synthesised.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import wave
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .config import (
+    TTS_BACKEND,
+    TTS_BACKGROUND_WORKERS,
+    TTS_CACHE_DIR,
+    TTS_CACHE_MAX_BYTES,
+    TTS_CACHE_MAX_DISK_BYTES,
+    TTS_CHUNK_MIN_CHARS,
+    TTS_MAX_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+_CHINESE_RUN = re.compile(r"[\u4e00-\u9fff]+")
+
+# Break after Chinese sentence punctuation, after English sentence punctuation
+# followed by whitespace, at newlines, and at the spaces extract_chinese() puts
+# between Chinese phrases
+_SENTENCE_BREAK = re.compile(
+    r"(?<=[。！？；])\s*|(?<=[.!?;])\s+|\n+|(?<=[\u4e00-\u9fff])\s+(?=[\u4e00-\u9fff])"
+)
+
+
+def detect_lang(text: str) -> str:
+    """Chinese (zh-cn) if the text contains any CJK ideograph, else English."""
+    return "zh-cn" if _CHINESE_RUN.search(text) else "en"
+
+
+def extract_chinese(text: str) -> str:
+    """Chinese runs of a reply joined by spaces, matching what the chat page sends to /speak."""
+    return " ".join(_CHINESE_RUN.findall(text))
+
+
+def split_sentences(text: str, min_chars: int = TTS_CHUNK_MIN_CHARS) -> List[str]:
+    """
+    Split text into sentence-sized chunks for incremental synthesis.
+
+    Consecutive short sentences are merged until a chunk has at least
+    min_chars characters, so very short phrases don't each cost a request.
+    """
+    chunks = []
+    current = ""
+    for piece in _SENTENCE_BREAK.split(text):
+        piece = piece.strip()
+        if not piece:
+            continue
+        current = f"{current} {piece}" if current else piece
+        if len(current) >= min_chars:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def audio_key(text: str, lang: str, backend: str = "gtts") -> str:
+    """Content address of a clip."""
+    return hashlib.sha256(f"{backend}\0{lang}\0{text}".encode("utf-8")).hexdigest()
+
+
+class TTSBackend(ABC):
+    """Interface for speech synthesis engines."""
+
+    name = ""
+    mimetype = "audio/mpeg"
+
+    @abstractmethod
+    def synthesize(self, text: str, lang: str) -> bytes:
+        """Return encoded audio for text."""
+
+    def join_stream(self, clips: Iterable[bytes]) -> Iterator[bytes]:
+        """Turn per-chunk clips into one playable byte stream. MP3 frames concatenate as-is."""
+        yield from clips
+
+    def join_audio(self, clips: Iterable[bytes]) -> bytes:
+        """Combine per-chunk clips into one complete file."""
+        return b"".join(self.join_stream(clips))
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS via gTTS (needs network)."""
+
+    name = "gtts"
+    mimetype = "audio/mpeg"
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        # gTTS is imported on first use to keep startup fast
+        from gtts import gTTS
+        audio_io = BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(audio_io)
+        return audio_io.getvalue()
+
+
+class OfflineTTSBackend(TTSBackend):
+    """Local espeak-ng engine; works without network."""
+
+    name = "offline"
+    mimetype = "audio/wav"
+
+    # gTTS language code -> espeak-ng voice
+    VOICES = {"zh-cn": "cmn", "en": "en"}
+
+    def __init__(self, executable: Optional[str] = None):
+        self.executable = executable or shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        if not self.executable:
+            raise RuntimeError(
+                "espeak-ng not found. Install it or set TTS_BACKEND = \"gtts\".")
+        voice = self.VOICES.get(lang, lang)
+        # Text goes through stdin so it can never be parsed as an option
+        result = subprocess.run(
+            [self.executable, "-v", voice, "--stdin", "--stdout"],
+            input=text.encode("utf-8"), capture_output=True, check=True, timeout=60,
+        )
+        return result.stdout
+
+    def join_stream(self, clips: Iterable[bytes]) -> Iterator[bytes]:
+        # One WAV header with open-ended sizes, then raw PCM from every clip
+        header_sent = False
+        for clip in clips:
+            with wave.open(BytesIO(clip)) as wav:
+                if not header_sent:
+                    yield _streaming_wav_header(
+                        wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+                    header_sent = True
+                yield wav.readframes(wav.getnframes())
+
+    def join_audio(self, clips: Iterable[bytes]) -> bytes:
+        # A whole file gets a header with its real sizes, unlike a stream
+        out = BytesIO()
+        writer = None
+        for clip in clips:
+            with wave.open(BytesIO(clip)) as wav:
+                if writer is None:
+                    writer = wave.open(out, "wb")
+                    writer.setparams(wav.getparams())
+                writer.writeframes(wav.readframes(wav.getnframes()))
+        if writer is None:
+            return b""
+        # Closing rewrites the header's sizes; out itself stays open
+        writer.close()
+        return out.getvalue()
+
+
+def _streaming_wav_header(channels: int, sample_width: int, frame_rate: int) -> bytes:
+    """WAV header for a stream of unknown length (sizes set to the maximum)."""
+    byte_rate = frame_rate * channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, frame_rate,
+                                byte_rate, channels * sample_width, sample_width * 8)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF - 36)
+    )
+
+
+# Registered TTS backends by name
+TTS_BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    OfflineTTSBackend.name: OfflineTTSBackend,
+}
+
+
+def create_backend(name: str = TTS_BACKEND) -> TTSBackend:
+    """Instantiate a registered TTS backend."""
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"Unknown TTS backend: {name}. Choose from {sorted(TTS_BACKENDS)}")
+    return TTS_BACKENDS[name]()
+
+
+class AudioCache:
+    """
+    Thread-safe byte-bounded LRU of audio clips with an optional on-disk tier.
+
+    Both tiers are size-bounded. The disk tier's recency order starts from
+    the files' modification times and is kept in memory from then on; a
+    disk hit also touches its file, so the order survives a restart.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = TTS_CACHE_MAX_BYTES,
+        cache_dir: Optional[str] = TTS_CACHE_DIR,
+        max_disk_bytes: int = TTS_CACHE_MAX_DISK_BYTES,
+    ):
+        """
+        Args:
+            max_bytes: Total size of clips kept in memory
+            cache_dir: Directory for the on-disk tier, or None for memory only
+            max_disk_bytes: Total size of clip files kept in cache_dir
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        # Clip files on disk, least recently used first: key -> size
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._scan_disk()
+
+    def __contains__(self, key: str) -> bool:
+        """Whether a clip is cached in either tier, without reading it."""
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return cached audio, or None on a miss."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                return audio
+
+        path = self._path(key)
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                os.utime(path)
+            except OSError:
+                # Evicted by another process sharing the directory
+                return None
+            with self._lock:
+                self._remember(key, audio)
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+            return audio
+        return None
+
+    def set(self, key: str, audio: bytes):
+        """Store audio in memory and, atomically, on disk."""
+        with self._lock:
+            self._remember(key, audio)
+
+        path = self._path(key)
+        if path:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(audio)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not write audio cache file {path}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return
+            with self._lock:
+                self._disk_size += len(audio) - self._disk.pop(key, 0)
+                self._disk[key] = len(audio)
+                self._evict_disk()
+
+    def _path(self, key: str) -> Optional[str]:
+        return os.path.join(self.cache_dir, f"{key}.audio") if self.cache_dir else None
+
+    def _scan_disk(self):
+        entries = []
+        with os.scandir(self.cache_dir) as files:
+            for entry in files:
+                if entry.name.endswith(".audio"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-len(".audio")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        # Oldest files first, until the directory fits in max_disk_bytes
+        while self._disk_size > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not delete audio cache file for {key}: {e}")
+
+    def _remember(self, key: str, audio: bytes):
+        if key in self._memory:
+            self._size -= len(self._memory.pop(key))
+        if len(audio) > self.max_bytes:
+            return
+        self._memory[key] = audio
+        self._size += len(audio)
+        while self._size > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._size -= len(evicted)
+
+
+class SpeechSynthesizer:
+    """Cached, chunked synthesis with request de-duplication and background pre-synthesis."""
+
+    def __init__(
+        self,
+        backend: Optional[TTSBackend] = None,
+        cache: Optional[AudioCache] = None,
+        max_workers: int = TTS_MAX_WORKERS,
+        background_workers: int = TTS_BACKGROUND_WORKERS,
+    ):
+        self.backend = backend or create_backend()
+        self.cache = cache or AudioCache()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+        # Pre-synthesis has its own pool, so a burst of replies can't queue ahead of /speak
+        self._background = ThreadPoolExecutor(
+            max_workers=background_workers, thread_name_prefix="tts-background")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def mimetype(self) -> str:
+        return self.backend.mimetype
+
+    def key(self, text: str, lang: Optional[str] = None) -> str:
+        """Content address of the full audio for text."""
+        return audio_key(text, lang or detect_lang(text), self.backend.name)
+
+    def stream_audio(self, text: str, lang: Optional[str] = None) -> Iterator[bytes]:
+        """
+        Yield playable audio for text chunk by chunk.
+
+        All chunks are queued for synthesis up front, so later sentences are
+        produced while earlier ones are being sent.
+        """
+        lang = lang or detect_lang(text)
+        yield from self.backend.join_stream(self._chunk_clips(text, lang))
+
+    def get_full_audio(self, text: str, lang: Optional[str] = None) -> Tuple[str, bytes]:
+        """Return (key, audio) for text, assembled from cached chunks into one file."""
+        lang = lang or detect_lang(text)
+        return self.key(text, lang), self.backend.join_audio(self._chunk_clips(text, lang))
+
+    def _chunk_clips(self, text: str, lang: str) -> Iterator[bytes]:
+        # Every chunk is queued at once; clips are yielded in order as they finish
+        futures = [
+            self._executor.submit(self.get_audio, chunk, lang)
+            for chunk in split_sentences(text)
+        ]
+        return (future.result()[1] for future in futures)
+
+    def get_audio(self, text: str, lang: Optional[str] = None) -> Tuple[str, bytes]:
+        """
+        Return (key, audio bytes) for a single chunk, synthesising only if no
+        cached or in-flight copy exists.
+
+        Args:
+            text: Text to speak
+            lang: gTTS language code; detected from text if omitted
+        """
+        lang = lang or detect_lang(text)
+        key = audio_key(text, lang, self.backend.name)
+        audio = self.cache.get(key)
+        if audio is not None:
+            return key, audio
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not owner:
+            return key, future.result()
+
+        try:
+            audio = self.backend.synthesize(text, lang)
+            self.cache.set(key, audio)
+            future.set_result(audio)
+            return key, audio
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def presynthesize(self, text: str, lang: Optional[str] = None):
+        """
+        Synthesise every chunk of text in the background so later playback is instant.
+
+        Returns at once: splitting, cache checks and synthesis all run on the
+        background pool, so the calling request does no TTS work or I/O.
+        """
+        if text:
+            self._background.submit(self._presynthesize, text, lang)
+
+    def _presynthesize(self, text: str, lang: Optional[str]):
+        lang = lang or detect_lang(text)
+        for chunk in split_sentences(text):
+            key = audio_key(chunk, lang, self.backend.name)
+            with self._lock:
+                if key in self._in_flight:
+                    continue
+            # A membership check, so a clip already on disk is not read back in
+            if key in self.cache:
+                continue
+            try:
+                self.get_audio(chunk, lang)
+            except Exception as e:
+                logger.warning(f"Background TTS synthesis failed: {e}")
+
+
+# Singleton instance
+_synthesizer_instance = None
+_synthesizer_lock = threading.Lock()
+
+
+def get_synthesizer() -> SpeechSynthesizer:
+    """Get singleton speech synthesizer instance."""
+    global _synthesizer_instance
+    if _synthesizer_instance is None:
+        with _synthesizer_lock:
+            if _synthesizer_instance is None:
+                _synthesizer_instance = SpeechSynthesizer()
+    return _synthesizer_instance
@@ -0,0 +1,199 @@
+"""
+Per-user practice log.
+
+Each user has an append-only file with one ISO date per line, written once
+per day they open the chat. The dates are loaded into an in-memory set the
+first time a user is seen, so recording a visit is an O(1) membership check
+plus, at most once a day, a one-line append. Aggregates (streaks, active
+days per month, date ranges) are computed server-side so the browser never
+needs the full history.
+"""
+
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from .config import USAGE_LOG_DIR, USAGE_LOG_LEGACY_FILE
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class _UserDates:
+    """Loaded state of one user's log."""
+
+    def __init__(self):
+        self.days = set()
+        self.sorted_days: List[date] = []
+        self.offset = 0  # Bytes of the file already read
+
+
+class UsageLog:
+    """Thread-safe append-only usage log with an in-memory date index per user."""
+
+    def __init__(
+        self,
+        log_dir: str = USAGE_LOG_DIR,
+        legacy_file: Optional[str] = USAGE_LOG_LEGACY_FILE,
+        legacy_user: str = "default_user",
+    ):
+        """
+        Args:
+            log_dir: Directory holding one log file per user
+            legacy_file: Old usage_log.json (a list of dates) imported for legacy_user
+            legacy_user: User the legacy dates belong to
+        """
+        self.log_dir = log_dir
+        self.legacy_file = legacy_file
+        self.legacy_user = legacy_user
+        self._users: Dict[str, _UserDates] = {}
+        self._lock = threading.Lock()
+
+    def record(self, user_id: str, day: Optional[date] = None) -> bool:
+        """
+        Record that the user practised on day (today by default).
+
+        Returns:
+            True if this was the first visit recorded for that day
+        """
+        day = day or date.today()
+        with self._lock:
+            entry = self._load(user_id)
+            if day in entry.days:
+                return False
+            # The line is read back into the index on the next query, along
+            # with anything other workers appended meanwhile
+            os.makedirs(self.log_dir, exist_ok=True)
+            with open(self._path(user_id), 'a', encoding='utf-8') as f:
+                f.write(f"{day.isoformat()}\n")
+            self._add(entry, day)
+            return True
+
+    def dates(
+        self, user_id: str, start: Optional[date] = None, end: Optional[date] = None
+    ) -> List[str]:
+        """Active dates between start and end (inclusive), oldest first, as ISO strings."""
+        with self._lock:
+            days = self._load(user_id).sorted_days
+            lo = bisect.bisect_left(days, start) if start else 0
+            hi = bisect.bisect_right(days, end) if end else len(days)
+            return [day.isoformat() for day in days[lo:hi]]
+
+    def days_by_month(self, user_id: str, year: Optional[int] = None) -> Dict[str, int]:
+        """Number of active days per month ("YYYY-MM"), optionally for one year."""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for day in self._load(user_id).sorted_days:
+                if year is None or day.year == year:
+                    key = f"{day.year:04d}-{day.month:02d}"
+                    counts[key] = counts.get(key, 0) + 1
+            return counts
+
+    def summary(self, user_id: str, today: Optional[date] = None) -> Dict:
+        """
+        Streak statistics.
+
+        The current streak counts consecutive active days ending today, or
+        ending yesterday if the user hasn't practised yet today.
+        """
+        today = today or date.today()
+        with self._lock:
+            entry = self._load(user_id)
+            end = today if today in entry.days else today - timedelta(days=1)
+            current = 0
+            while end - timedelta(days=current) in entry.days:
+                current += 1
+
+            longest = run = 0
+            previous = None
+            for day in entry.sorted_days:
+                run = run + 1 if previous and day - previous == timedelta(days=1) else 1
+                longest = max(longest, run)
+                previous = day
+
+            return {
+                "current_streak": current,
+                "longest_streak": longest,
+                "total_days": len(entry.sorted_days),
+                "active_today": today in entry.days,
+                "last_active": entry.sorted_days[-1].isoformat() if entry.sorted_days else None,
+            }
+
+    def _load(self, user_id: str) -> _UserDates:
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = _UserDates()
+            if user_id == self.legacy_user:
+                self._import_legacy(user_id)
+        self._read_new_lines(user_id, entry)
+        return entry
+
+    def _read_new_lines(self, user_id: str, entry: _UserDates):
+        # Picks up lines appended by other worker processes since the last read
+        path = self._path(user_id)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        if size <= entry.offset:
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            f.seek(entry.offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # Another process is mid-append; read it next time
+                entry.offset += len(line.encode('utf-8'))
+                try:
+                    self._add(entry, date.fromisoformat(line.strip()))
+                except ValueError:
+                    logger.warning(f"Skipping bad line in {path}: {line.strip()!r}")
+
+    def _import_legacy(self, user_id: str):
+        path = self._path(user_id)
+        if not self.legacy_file or os.path.exists(path) or not os.path.exists(self.legacy_file):
+            return
+        try:
+            with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                legacy_dates = sorted({date.fromisoformat(day) for day in json.load(f)})
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            logger.warning(f"Could not import {self.legacy_file}: {e}")
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{day}\n" for day in legacy_dates)
+        logger.info(f"Imported {len(legacy_dates)} date(s) from {self.legacy_file}")
+
+    @staticmethod
+    def _add(entry: _UserDates, day: date):
+        if day in entry.days:
+            return
+        entry.days.add(day)
+        # Days are almost always appended in order, so this is usually O(1)
+        if not entry.sorted_days or day > entry.sorted_days[-1]:
+            entry.sorted_days.append(day)
+        else:
+            bisect.insort(entry.sorted_days, day)
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.log_dir, f"{_UNSAFE_FILENAME_CHARS.sub('_', user_id)}.log")
+
+
+# Singleton instance
+_usage_log_instance = None
+_usage_log_lock = threading.Lock()
+
+
+def get_usage_log() -> UsageLog:
+    """Get singleton usage log instance."""
+    global _usage_log_instance
+    if _usage_log_instance is None:
+        with _usage_log_lock:
+            if _usage_log_instance is None:
+                _usage_log_instance = UsageLog()
+    return _usage_log_instance
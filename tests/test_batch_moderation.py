@@ -0,0 +1,74 @@
+import json
+import random
+import unittest
+
+from src.batch_moderation import ACTIONS, decide, hit_matrix, moderate_batch, score_texts
+from src.config import MODERATION_RULES_FILE
+from src.moderation import get_moderator
+
+
+def _corpus(size: int, seed: int = 0):
+    """Random texts mixing plain words with the rule keywords."""
+    with open(MODERATION_RULES_FILE, encoding="utf-8") as f:
+        keywords = [keyword for words in json.load(f)["keywords"].values() for keyword in words]
+    filler = ["hello", "你好", "how", "do", "I", "say", "thank", "you", "all", "people", "are"]
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(keywords if rng.random() < 0.15 else filler)
+                 for _ in range(rng.randint(0, 12)))
+        for _ in range(size)
+    ]
+
+
+class BatchModerationTest(unittest.TestCase):
+    def setUp(self):
+        self.moderator = get_moderator()
+        self.texts = _corpus(1500)
+
+    def assert_matches_moderate(self, texts, mode, **kwargs):
+        result = moderate_batch(texts, mode=mode, **kwargs)
+        previous_mode = self.moderator.safety_mode
+        self.moderator.safety_mode = mode
+        try:
+            for index, text in enumerate(texts):
+                expected = self.moderator.moderate(user_prompt=text)
+                self.assertEqual(result.action(index), expected.action, text)
+                self.assertEqual(result.confidence[index], expected.confidence, text)
+                self.assertEqual(list(result.tags[index]), expected.tags, text)
+        finally:
+            self.moderator.safety_mode = previous_mode
+
+    def test_matches_moderate_in_every_mode(self):
+        for mode in self.moderator.confidence_thresholds:
+            with self.subTest(mode=mode):
+                self.assert_matches_moderate(self.texts, mode, chunk_size=97)
+
+    def test_corpus_covers_every_action(self):
+        counts = moderate_batch(self.texts, mode="balanced").counts()
+        self.assertTrue(all(counts.values()), counts)
+
+    def test_process_pool_matches_single_process(self):
+        single = moderate_batch(self.texts, mode="balanced")
+        pooled = moderate_batch(self.texts, mode="balanced", processes=2, chunk_size=200)
+        self.assertEqual(single.actions.tolist(), pooled.actions.tolist())
+        self.assertEqual(single.confidence.tolist(), pooled.confidence.tolist())
+        self.assertEqual(single.tags, pooled.tags)
+
+    def test_hit_matrix_counts_decisions(self):
+        scores = score_texts(self.texts)
+        modes = list(self.moderator.confidence_thresholds)
+        matrix = hit_matrix(scores, modes)
+        for mode in modes:
+            counts = decide(scores, mode).counts()
+            for action in ACTIONS:
+                self.assertEqual(matrix[action.value][mode], counts[action.value])
+            self.assertEqual(sum(counts.values()), len(self.texts))
+
+    def test_empty_batch(self):
+        result = moderate_batch([])
+        self.assertEqual(len(result), 0)
+        self.assertEqual(result.counts(), {action.value: 0 for action in ACTIONS})
+
+
+if __name__ == "__main__":
+    unittest.main()
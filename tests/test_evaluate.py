@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.chat_engine import ChatEngine
+from src.evaluate import run_evaluation
+from src.model_provider import FakeModelProvider
+
+
+class RunEvaluationTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.input_file = os.path.join(directory, "inputs.jsonl")
+        self.output_file = os.path.join(directory, "outputs.jsonl")
+        with open(self.input_file, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "p1", "prompt": "how do I say hello?"}) + "\n")
+        self.provider = FakeModelProvider()
+
+    def run_with(self, provider):
+        with mock.patch.object(ChatEngine, "model", provider):
+            return run_evaluation(
+                self.input_file, self.output_file, schema_file=None, max_workers=1)
+
+    def written_ids(self):
+        if not os.path.exists(self.output_file):
+            return []
+        with open(self.output_file, encoding="utf-8") as f:
+            return [json.loads(line)["id"] for line in f]
+
+    def test_failed_prompt_is_not_written_and_reruns(self):
+        with mock.patch.object(self.provider, "generate", side_effect=RuntimeError("down")):
+            summary = self.run_with(self.provider)
+        self.assertEqual(summary["failed"], 1)
+        self.assertEqual(summary["written"], 0)
+        self.assertEqual(self.written_ids(), [])
+
+        summary = self.run_with(self.provider)
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual(summary["skipped"], 0)
+        self.assertEqual(summary["written"], 1)
+        self.assertEqual(self.written_ids(), ["p1"])
+
+    def test_completed_prompt_is_skipped_on_resume(self):
+        self.run_with(self.provider)
+        summary = self.run_with(self.provider)
+        self.assertEqual(summary["skipped"], 1)
+        self.assertEqual(summary["written"], 0)
+        self.assertEqual(self.written_ids(), ["p1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
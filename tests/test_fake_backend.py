@@ -0,0 +1,130 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from src.chat_engine import ChatEngine
+from src.config import MODERATION_RULES_FILE
+from src.fake_model import FakeClient
+from src.markdown import render_markdown
+from src.model_provider import AsyncFakeModelProvider, FakeModelProvider
+from src.router import HedgedRouter
+from src.scheduler import RequestScheduler
+
+
+def _bias_keyword() -> str:
+    with open(MODERATION_RULES_FILE, encoding="utf-8") as f:
+        return json.load(f)["keywords"]["bias"][0]
+
+
+class FakeProviderTest(unittest.TestCase):
+    def setUp(self):
+        self.provider = FakeModelProvider()
+
+    def test_replies_are_deterministic(self):
+        first = self.provider.generate("你好")
+        second = self.provider.generate("你好")
+        self.assertEqual(first["response"], second["response"])
+        self.assertIn("You said: 你好", first["response"])
+        self.assertTrue(first["deterministic"])
+
+    def test_stream_matches_generate(self):
+        streamed = "".join(self.provider.generate_stream("how do I say thank you"))
+        self.assertEqual(streamed, self.provider.generate("how do I say thank you")["response"])
+
+    def test_stream_settles_reservation(self):
+        with mock.patch.object(self.provider.scheduler, "refund") as refund:
+            "".join(self.provider.generate_stream("hello"))
+        # Only the max_tokens the reply didn't use is handed back
+        refund.assert_called_once()
+        self.assertGreater(refund.call_args[0][1], 0)
+
+    def test_async_matches_sync(self):
+        provider = AsyncFakeModelProvider()
+        result = asyncio.run(provider.generate("你好"))
+        self.assertEqual(result["response"], self.provider.generate("你好")["response"])
+
+
+def _unlimited_provider(latency: float = 0.0) -> FakeModelProvider:
+    # Not admitted through the shared scheduler, whose quota other tests use up
+    provider = FakeModelProvider()
+    provider.client = FakeClient(latency=latency)
+    provider.scheduler = RequestScheduler(0, 0)
+    return provider
+
+
+class HedgedRouterTest(unittest.TestCase):
+    def test_slow_primary_is_hedged(self):
+        primary, secondary = _unlimited_provider(latency=1.0), _unlimited_provider()
+        router = HedgedRouter(primary, secondary, default_delay=0.05, min_delay=0.05)
+        result = router.generate("hello")
+        self.assertTrue(result["hedged"])
+        self.assertEqual(result["served_by"], "secondary")
+
+    def test_fast_primary_is_not_hedged(self):
+        router = HedgedRouter(_unlimited_provider(), _unlimited_provider(), default_delay=5.0)
+        result = router.generate("hello")
+        self.assertFalse(result["hedged"])
+        self.assertEqual(result["served_by"], "primary")
+
+    def test_stream_hedges_to_first_token(self):
+        primary, secondary = _unlimited_provider(latency=1.0), _unlimited_provider()
+        router = HedgedRouter(primary, secondary, default_delay=0.05, min_delay=0.05)
+        streamed = "".join(router.generate_stream("hello"))
+        self.assertEqual(streamed, secondary.generate("hello")["response"])
+
+
+class ChatEngineWithFakeBackendTest(unittest.TestCase):
+    def setUp(self):
+        provider, async_provider = FakeModelProvider(), AsyncFakeModelProvider()
+        patches = [
+            mock.patch.object(ChatEngine, "model", provider),
+            mock.patch.object(ChatEngine, "async_model", async_provider),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_sync_async_and_stream_agree(self):
+        replies = []
+        for run in (
+            lambda engine, text: engine.process_message(text),
+            lambda engine, text: asyncio.run(engine.process_message_async(text)),
+            lambda engine, text: list(engine.process_message_stream(text))[-1],
+        ):
+            engine = ChatEngine(session_id="fake-test")
+            engine.first_interaction = False
+            replies.append(run(engine, "how do I order tea?"))
+        for reply in replies:
+            self.assertEqual(reply["safety_action"], "allow")
+            self.assertEqual(reply["response"], replies[0]["response"])
+            self.assertEqual(reply["turn_count"], 1)
+
+    def test_stream_done_event_renders_streamed_text(self):
+        engine = ChatEngine(session_id="fake-stream")
+        events = list(engine.process_message_stream("hello"))
+        tokens = [event for event in events if event["type"] == "token"]
+        done = events[-1]
+        self.assertEqual(done["type"], "done")
+        self.assertFalse(done["cut"])
+        # The first turn's disclaimer is streamed as the first token
+        self.assertEqual(done["response"], render_markdown("".join(t["text"] for t in tokens)))
+
+    def test_flagged_input_gets_same_fallback_on_every_path(self):
+        text = f"all of them are {_bias_keyword()}"
+        responses = set()
+        for run in (
+            lambda engine: engine.process_message(text),
+            lambda engine: asyncio.run(engine.process_message_async(text)),
+            lambda engine: list(engine.process_message_stream(text))[-1],
+        ):
+            engine = ChatEngine(session_id="fake-flagged")
+            engine.first_interaction = False
+            reply = run(engine)
+            self.assertNotEqual(reply["safety_action"], "allow")
+            responses.add(reply["response"])
+        self.assertEqual(len(responses), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
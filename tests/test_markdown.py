@@ -0,0 +1,81 @@
+import random
+import time
+import unittest
+
+from src.markdown import StreamingMarkdownRenderer, render_markdown
+
+# Pieces that exercise every kind of markup, escaping and line handling
+_PIECES = [
+    "*", "**", "`", "```", "```python\n", "[", "]", "(", ")", "](", "\n", "\n\n",
+    "a", "你好", " ", "bold", "<b>", "&amp;", '"', "http://example.com/?q=1",
+    "javascript:alert(1)", "mailto:x@y.z", "\\",
+]
+
+
+def _random_text(rng: random.Random, max_pieces: int = 40) -> str:
+    return "".join(rng.choice(_PIECES) for _ in range(rng.randint(0, max_pieces)))
+
+
+def _random_chunks(rng: random.Random, text: str):
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 8))))
+    bounds = [0, *cuts, len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def _render_streamed(chunks) -> str:
+    renderer = StreamingMarkdownRenderer()
+    return "".join(renderer.feed(chunk) for chunk in chunks) + renderer.close()
+
+
+class RenderMarkdownTest(unittest.TestCase):
+    def test_markup(self):
+        self.assertEqual(render_markdown("**好** and *ok*"), "<b>好</b> and <i>ok</i>")
+        self.assertEqual(render_markdown("a\nb"), "a<br>b")
+        self.assertEqual(render_markdown("`<x>`"), "<code>&lt;x&gt;</code>")
+
+    def test_escapes_html(self):
+        self.assertNotIn("<script", render_markdown("<script>alert(1)</script>"))
+
+    def test_unsafe_links_are_not_emitted(self):
+        self.assertNotIn("href", render_markdown("[x](javascript:alert(1))"))
+        self.assertIn('href="https://example.com"', render_markdown("[x](https://example.com)"))
+
+    def test_adversarial_input_is_linear(self):
+        # Quadratic backtracking would make the larger input ~16x slower, not ~4x
+        timings = []
+        for size in (2_500, 10_000):
+            text = ("*a" * size)[:size] + "[" * (size // 10)
+            start = time.perf_counter()
+            render_markdown(text)
+            timings.append(time.perf_counter() - start)
+        self.assertLess(timings[1], max(timings[0], 1e-3) * 10)
+
+
+class StreamingMarkdownRendererTest(unittest.TestCase):
+    def test_streamed_output_equals_full_render(self):
+        rng = random.Random(3249)
+        for _ in range(3000):
+            text = _random_text(rng)
+            chunks = _random_chunks(rng, text)
+            self.assertEqual(_render_streamed(chunks), render_markdown(text), repr(chunks))
+
+    def test_one_character_at_a_time(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            text = _random_text(rng)
+            self.assertEqual(_render_streamed(list(text)), render_markdown(text), repr(text))
+
+    def test_complete_lines_render_before_close(self):
+        renderer = StreamingMarkdownRenderer()
+        self.assertEqual(renderer.feed("**hi"), "")
+        self.assertEqual(renderer.feed("**\nnext"), "<b>hi</b><br>")
+        self.assertEqual(renderer.close(), "next")
+
+    def test_code_block_is_held_until_closed(self):
+        renderer = StreamingMarkdownRenderer()
+        self.assertEqual(renderer.feed("```\n*x*\n"), "")
+        self.assertEqual(renderer.feed("```\n"), "<pre><code>*x*\n</code></pre><br>")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from unittest import mock
+
+from src.config import SYSTEM_PROMPT
+from src.prompts import PromptCompiler
+
+PROFILE = {"name": "Ana", "level": "beginner", "goal": ["travel"]}
+
+
+class PromptCompilerTokenCountTest(unittest.TestCase):
+    def setUp(self):
+        # An estimate of 1 token while tiktoken is loading, an exact 2 after
+        self.exact = False
+        patches = [
+            mock.patch("src.prompts.counts_are_exact", lambda: self.exact),
+            mock.patch("src.prompts.count_message_tokens", lambda message: 2 if self.exact else 1),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.compiler = PromptCompiler()
+
+    def test_system_prompt_is_counted_on_first_use(self):
+        self.exact = True
+        self.assertEqual(self.compiler.message_tokens({"content": SYSTEM_PROMPT}), 2)
+
+    def test_estimates_are_recounted_once_tiktoken_loads(self):
+        self.assertEqual(self.compiler.message_tokens({"content": SYSTEM_PROMPT}), 1)
+        self.assertEqual(self.compiler.compile(PROFILE).tokens, 1)
+        self.exact = True
+        self.assertEqual(self.compiler.message_tokens({"content": SYSTEM_PROMPT}), 2)
+        self.assertEqual(self.compiler.compile(PROFILE).tokens, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.tts import AudioCache, SpeechSynthesizer, TTSBackend
+
+
+class CountingBackend(TTSBackend):
+    name = "counting"
+    mimetype = "audio/mpeg"
+
+    def __init__(self):
+        self.calls = []
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        self.calls.append(text)
+        return text.encode("utf-8")
+
+    def join_stream(self, clips):
+        yield from clips
+
+    def join_audio(self, clips) -> bytes:
+        return b"".join(clips)
+
+
+class AudioCacheDiskTierTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = tmp.name
+
+    def files(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_least_recently_used_file_is_deleted(self):
+        cache = AudioCache(max_bytes=0, cache_dir=self.cache_dir, max_disk_bytes=20)
+        cache.set("a", b"x" * 10)
+        cache.set("b", b"x" * 10)
+        cache.get("a")
+        cache.set("c", b"x" * 10)
+        self.assertEqual(self.files(), ["a.audio", "c.audio"])
+        self.assertNotIn("b", cache)
+        self.assertIsNone(cache.get("b"))
+
+    def test_existing_files_count_towards_the_cap(self):
+        AudioCache(cache_dir=self.cache_dir).set("old", b"x" * 10)
+        cache = AudioCache(cache_dir=self.cache_dir, max_disk_bytes=15)
+        self.assertIn("old", cache)
+        cache.set("new", b"x" * 10)
+        self.assertEqual(self.files(), ["new.audio"])
+
+
+class PresynthesizeTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = CountingBackend()
+        self.synthesizer = SpeechSynthesizer(self.backend, AudioCache(cache_dir=None))
+        self.addCleanup(self.synthesizer._background.shutdown)
+
+    def test_request_thread_does_no_tts_work(self):
+        with mock.patch.object(self.synthesizer.cache, "get") as get:
+            with mock.patch.object(self.synthesizer._background, "submit") as submit:
+                self.synthesizer.presynthesize("你好。谢谢你的帮助。")
+        get.assert_not_called()
+        submit.assert_called_once()
+
+    def test_cached_chunks_are_not_read_back(self):
+        self.synthesizer.get_audio("你好", "zh-cn")
+        with mock.patch.object(self.synthesizer.cache, "get") as get:
+            self.synthesizer.presynthesize("你好", "zh-cn")
+            self.synthesizer._background.shutdown(wait=True)
+        get.assert_not_called()
+        self.assertEqual(self.backend.calls, ["你好"])
+
+
+if __name__ == "__main__":
+    unittest.main()